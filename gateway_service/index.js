@@ -1,4 +1,4 @@
-import {ApolloGateway, IntrospectAndCompose} from "@apollo/gateway";
+import {ApolloGateway, IntrospectAndCompose, RemoteGraphQLDataSource} from "@apollo/gateway";
 import { ApolloServer } from "@apollo/server";
 import { startStandaloneServer } from "@apollo/server/standalone";
 import dotenv from "dotenv";
@@ -13,6 +13,10 @@ const gateway = new ApolloGateway({
        { name: "images", url: process.env.FEDERATED_SERVICES_IMAGES },
     ],
   }),
+  // Send subgraph queries by hash (automatic persisted queries), the full text only when a subgraph asks for it
+  buildService({ url }) {
+    return new RemoteGraphQLDataSource({ url, apq: true });
+  },
 });
 
 const server = new ApolloServer({
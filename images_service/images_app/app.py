@@ -1,11 +1,69 @@
-from fastapi import FastAPI
-from strawberry.fastapi import GraphQLRouter
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
 
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from .batching import write_batcher
+from .context import get_context
+from .cost import cost_limiter
+from .db import dispose_db, get_pool_stats, get_statement_stats, init_db
+from .metrics import render_gauges, render_metrics
+from .persisted_queries import PersistedQueryRouter
+from .rows import ImageRow
 from .schema import schema
+from .services import close_export, export_images_service, take_export_slot
+
+# Cumulative stats, exported as Prometheus counters rather than gauges
+POOL_COUNTERS = frozenset({"checkouts", "connects", "timeouts", "wait_seconds_total"})
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    """
+    Owns the process-wide database pool for the lifetime of the app
+    """
+    init_db()
+    yield
+    # Batched writes still pending need the pool, and their callers are waiting for them
+    await write_batcher.close()
+    await dispose_db()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="Images Service")
-    graphql_app = GraphQLRouter(schema)
+    app = FastAPI(title="Images Service", lifespan=lifespan)
+    graphql_app = PersistedQueryRouter(schema, context_getter=get_context)
     app.include_router(graphql_app, prefix="/graphql")
+
+    @app.get("/images/export")
+    async def export_images() -> StreamingResponse:
+        slot = await take_export_slot()
+        if slot is None:
+            # Refused up front rather than queued, so waiting clients hold no request (or connection) open
+            raise HTTPException(503, "Too many exports in progress, retry later", headers={"Retry-After": "10"})
+        # Streamed as newline-delimited JSON, so neither side holds the whole table
+        stream = export_images_service(slot, ImageRow.__slots__)
+        return StreamingResponse(
+            stream, media_type="application/x-ndjson", background=BackgroundTask(close_export, stream, slot)
+        )
+
+    @app.get("/stats")
+    async def stats() -> dict[str, dict[str, int | float]]:
+        admission: dict[str, int | float] = {"in_flight": cost_limiter.in_flight, "shed": cost_limiter.shed}
+        return {"pool": get_pool_stats(), "admission": admission}
+
+    @app.get("/stats/statements")
+    async def statement_stats() -> list[dict[str, Any]]:
+        return get_statement_stats()
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics() -> str:
+        admission = {"in_flight": cost_limiter.in_flight, "shed": cost_limiter.shed}
+        return render_metrics(
+            render_gauges("db_pool", get_pool_stats(), POOL_COUNTERS),
+            render_gauges("admission", admission, frozenset({"shed"})),
+        )
+
     return app
@@ -0,0 +1,78 @@
+import asyncio
+import contextvars
+from typing import Any
+
+from .db import init_db
+from .models import Image
+from .services import create_images_service
+from .settings import settings
+
+
+class WriteBatcher:
+    """
+    Coalesces concurrent `createImage` calls into group commits: rows arriving within `linger` seconds of the first
+    one (or until `max_size` are pending) are inserted by a single statement in one transaction, and every caller
+    gets back its own image or error. A batch commits on its own, outside of the callers' units of work.
+    """
+
+    def __init__(self, linger: float, max_size: int) -> None:
+        self.linger = linger
+        self.max_size = max_size
+        self.batches = 0
+        self._pending: list[tuple[dict[str, Any], asyncio.Future[Image]]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        # Flushes in progress, referenced until done so they are not garbage collected
+        self._flushes: set[asyncio.Task[None]] = set()
+
+    async def create_image(self, image_data: dict[str, Any]) -> Image:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[Image] = loop.create_future()
+        self._pending.append((image_data, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger, self._flush)
+        return await future
+
+    async def close(self) -> None:
+        """
+        Flushes the pending rows without waiting for the linger timer, and waits for every flush in progress, so no
+        batch runs after the database pool is disposed
+        """
+        self._flush()
+        if self._flushes:
+            await asyncio.wait(self._flushes)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        # A fresh context, so the batch is neither part of nor reported by the operation that happened to fill it
+        task = asyncio.get_running_loop().create_task(self._insert(batch), context=contextvars.Context())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _insert(self, batch: list[tuple[dict[str, Any], asyncio.Future[Image]]]) -> None:
+        self.batches += 1
+        try:
+            async with init_db()() as session:
+                results = await create_images_service(session, [image_data for image_data, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), (image, error) in zip(batch, results, strict=True):
+            # A caller that went away (e.g. a cancelled request) still had its image created
+            if future.done():
+                continue
+            if image is None:
+                future.set_exception(ValueError(error))
+            else:
+                future.set_result(image)
+
+
+write_batcher = WriteBatcher(settings.WRITE_BATCH_LINGER_MS / 1000, settings.WRITE_BATCH_MAX_SIZE)
@@ -0,0 +1,187 @@
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any
+
+from graphql import (
+    DocumentNode,
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLField,
+    GraphQLInterfaceType,
+    GraphQLList,
+    GraphQLNamedType,
+    GraphQLObjectType,
+    GraphQLSchema,
+    InlineFragmentNode,
+    SelectionSetNode,
+    get_named_type,
+    get_nullable_type,
+    get_operation_ast,
+)
+from graphql.execution.values import get_argument_values
+
+from .settings import settings
+
+# Cost of resolving one item of a field, when it differs from the default (1 for objects, 0 for scalars)
+FIELD_WEIGHTS = {
+    "Mutation.createImage": 5,
+    "Mutation.upsertImage": 5,
+    "Mutation.updateImage": 5,
+    "Mutation.deleteImage": 5,
+}
+# Items a list field without a size argument is assumed to return, when it differs from `COST_DEFAULT_LIST_SIZE`
+ASSUMED_LIST_SIZES = {
+    # Reads the whole table
+    "Query.getAllImages": 1_000,
+}
+# Integer arguments bounding how many items a field returns
+SIZE_ARGUMENTS = ("first", "limit")
+
+
+@dataclass
+class _Walk:
+    schema: GraphQLSchema
+    fragments: dict[str, FragmentDefinitionNode]
+    variables: dict[str, Any]
+
+
+def operation_cost(
+    schema: GraphQLSchema, document: DocumentNode, operation_name: str | None, variables: dict[str, Any] | None
+) -> int:
+    """
+    Estimates how many objects an operation resolves, before running it: every list multiplies the cost of its items
+    by its size argument (`first`, `limit` or the length of a list argument such as `representations`), or by an
+    assumed size when it has none
+    """
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return 0
+    root_type = schema.get_root_type(operation.operation)
+    if root_type is None:
+        return 0
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    return _selection_set_cost(_Walk(schema, fragments, variables or {}), root_type, operation.selection_set, None)
+
+
+def _selection_set_cost(
+    walk: _Walk, parent_type: GraphQLNamedType, selection_set: SelectionSetNode, size: int | None
+) -> int:
+    cost = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            cost += _field_cost(walk, parent_type, selection, size)
+            continue
+        fragment: FragmentDefinitionNode | InlineFragmentNode | None = None
+        if isinstance(selection, FragmentSpreadNode):
+            fragment = walk.fragments.get(selection.name.value)
+        elif isinstance(selection, InlineFragmentNode):
+            fragment = selection
+        if fragment is None:
+            continue
+        # Every type a fragment may apply to is counted, which over-estimates abstract types (e.g. `_entities`)
+        fragment_type = walk.schema.get_type(fragment.type_condition.name.value) if fragment.type_condition else None
+        cost += _selection_set_cost(walk, fragment_type or parent_type, fragment.selection_set, size)
+    return cost
+
+
+def _field_cost(walk: _Walk, parent_type: GraphQLNamedType, node: FieldNode, inherited_size: int | None) -> int:
+    if node.name.value.startswith("__") or not isinstance(parent_type, GraphQLObjectType | GraphQLInterfaceType):
+        return 0
+    field = parent_type.fields.get(node.name.value)
+    if field is None:
+        return 0
+    coordinate = f"{parent_type.name}.{node.name.value}"
+    field_type = get_named_type(field.type)
+    weight = FIELD_WEIGHTS.get(coordinate, 0 if node.selection_set is None else 1)
+    size = _size_argument(field, node, walk.variables)
+    children = 0
+    if node.selection_set is not None:
+        # A connection's size argument applies to its `edges` list, not to the connection itself
+        children_size = None if isinstance(get_nullable_type(field.type), GraphQLList) else size
+        children = _selection_set_cost(walk, field_type, node.selection_set, children_size)
+    if isinstance(get_nullable_type(field.type), GraphQLList):
+        if size is None:
+            size = inherited_size
+        count = ASSUMED_LIST_SIZES.get(coordinate, settings.COST_DEFAULT_LIST_SIZE) if size is None else size
+        return count * (weight + children)
+    return weight + children
+
+
+def _size_argument(field: GraphQLField, node: FieldNode, variables: dict[str, Any]) -> int | None:
+    try:
+        arguments = get_argument_values(field, node, variables)
+    except GraphQLError:
+        # Invalid variables fail the execution itself
+        return None
+    for name in SIZE_ARGUMENTS:
+        size = arguments.get(name)
+        if isinstance(size, int):
+            return max(size, 0)
+    for value in arguments.values():
+        if isinstance(value, list):
+            return len(value)
+    return None
+
+
+class OperationShed(Exception):
+    pass
+
+
+class CostLimiter:
+    """
+    Admits operations while the summed cost of those in flight stays within `capacity`, first come first served.
+    An operation not admitted within `timeout` seconds is shed, instead of queueing on the connection pool.
+    """
+
+    def __init__(self, capacity: int, timeout: float) -> None:
+        self.capacity = capacity
+        self.timeout = timeout
+        self.in_flight = 0
+        self.shed = 0
+        self._waiters: deque[tuple[int, asyncio.Future[None]]] = deque()
+
+    @asynccontextmanager
+    async def admit(self, cost: int) -> AsyncIterator[None]:
+        # An operation costlier than the whole capacity still runs, alone
+        cost = min(cost, self.capacity)
+        if self._waiters or self.in_flight + cost > self.capacity:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append((cost, waiter))
+            try:
+                await asyncio.wait_for(waiter, self.timeout)
+            except asyncio.TimeoutError:
+                self.shed += 1
+                raise OperationShed from None
+            finally:
+                if waiter.cancelled():
+                    # It may have been holding back cheaper operations queued behind it
+                    self._wake()
+        else:
+            self.in_flight += cost
+        try:
+            yield
+        finally:
+            self.in_flight -= cost
+            self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            cost, waiter = self._waiters[0]
+            if not waiter.done() and self.in_flight + cost > self.capacity:
+                return
+            self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += cost
+                waiter.set_result(None)
+
+
+cost_limiter = CostLimiter(settings.COST_CONCURRENCY_LIMIT, settings.COST_QUEUE_TIMEOUT_MS / 1000)
@@ -0,0 +1,215 @@
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from inspect import isawaitable
+from typing import Any
+
+from graphql import GraphQLError, GraphQLResolveInfo
+from sqlalchemy.exc import SQLAlchemyError
+from strawberry.extensions import SchemaExtension
+from strawberry.schema.schema_converter import GraphQLCoreConverter
+from strawberry.types.graphql import OperationType
+from strawberry.utils.await_maybe import AwaitableOrValue
+
+from .cost import OperationShed, cost_limiter, operation_cost
+from .db import StatementCounter, current_statement_counter, current_unit_of_work
+from .metrics import FIELD_DURATION, FIELD_ERRORS, FIELD_RESULT_SIZE, OPERATION_DURATION, OPERATION_ERRORS
+from .persisted_queries import documents, query_hash
+from .settings import settings
+
+
+class UnitOfWorkExtension(SchemaExtension):
+    """
+    Runs each operation in the unit of work of its context: committed when every field succeeded, rolled back
+    otherwise. A failed mutation reports no data, since none of its writes were kept. Queries read from a replica
+    when any is configured (unless their client wrote within `READ_YOUR_WRITES_SECONDS`), mutations always run on
+    the primary.
+    """
+
+    def on_execute(self) -> Iterator[None]:
+        # Known once the document is parsed, still before any resolver opens the session
+        context = self.execution_context.context
+        operation_type = self.execution_context.operation_type
+        context.unit_of_work.read_only = operation_type == OperationType.QUERY and not context.wrote_recently()
+        yield
+
+    async def on_operation(self) -> AsyncIterator[None]:
+        unit_of_work = self.execution_context.context.unit_of_work
+        token = current_unit_of_work.set(unit_of_work)
+        try:
+            yield
+            result = self.execution_context.result
+            if result is None or not result.errors:
+                try:
+                    await unit_of_work.commit()
+                    if self.execution_context.operation_type == OperationType.MUTATION:
+                        self.execution_context.context.record_write()
+                except SQLAlchemyError as exc:
+                    await unit_of_work.rollback()
+                    if result is not None:
+                        result.data = None
+                        result.errors = [GraphQLError("The operation could not be committed", original_error=exc)]
+            else:
+                await unit_of_work.rollback()
+                if self.execution_context.operation_type == OperationType.MUTATION:
+                    result.data = None
+        finally:
+            await unit_of_work.close()
+            current_unit_of_work.reset(token)
+
+
+class DocumentCacheExtension(SchemaExtension):
+    """
+    Skips parsing and validation of a query text seen before, reusing its validated document
+    """
+
+    def on_parse(self) -> Iterator[None]:
+        execution_context = self.execution_context
+        self.query_hash = query_hash(execution_context.query or "")
+        document = documents.get(self.query_hash)
+        if document is not None:
+            execution_context.graphql_document = document
+            # Already validated against this schema, so validation is skipped as well
+            execution_context.errors = []
+        yield
+
+    def on_validate(self) -> Iterator[None]:
+        cached = self.execution_context.errors is not None
+        yield
+        execution_context = self.execution_context
+        if not cached and not execution_context.errors and execution_context.graphql_document is not None:
+            documents.set(self.query_hash, execution_context.graphql_document)
+
+
+class QueryCostExtension(SchemaExtension):
+    """
+    Estimates an operation's cost before executing it (see `operation_cost`). Queries over `COST_MAX_PER_OPERATION`
+    are rejected (mutations are bounded by `BULK_MAX_ITEMS` instead); every operation then waits for its cost to fit
+    in the process-wide `cost_limiter`, and is shed with an error when it does not in time.
+    """
+
+    async def on_execute(self) -> AsyncIterator[None]:
+        execution_context = self.execution_context
+        assert execution_context.graphql_document is not None
+        cost = operation_cost(
+            execution_context.schema._schema,
+            execution_context.graphql_document,
+            execution_context.operation_name,
+            execution_context.variables,
+        )
+        if execution_context.operation_type == OperationType.QUERY and cost > settings.COST_MAX_PER_OPERATION:
+            raise GraphQLError(
+                f"Operation cost {cost} exceeds the maximum of {settings.COST_MAX_PER_OPERATION}",
+                extensions={"code": "OPERATION_TOO_EXPENSIVE", "cost": cost},
+            )
+        try:
+            async with cost_limiter.admit(cost):
+                yield
+        except OperationShed:
+            raise GraphQLError(
+                "The server is overloaded, retry later", extensions={"code": "SERVICE_OVERLOADED"}
+            ) from None
+
+
+# Operation names are chosen by clients: beyond this many distinct ones, operations are recorded together
+MAX_OPERATION_NAMES = 200
+_operation_names: set[str] = set()
+
+
+def _operation_name(name: str | None) -> str:
+    if not name or name in _operation_names:
+        return name or ""
+    if len(_operation_names) >= MAX_OPERATION_NAMES:
+        return "other"
+    _operation_names.add(name)
+    return name
+
+
+# Metric label of every field by parent type and name, or None for fields without a resolver of their own
+_timed_fields: dict[tuple[str, str], str | None] = {}
+
+
+def _timed_field(info: GraphQLResolveInfo) -> str | None:
+    key = (info.parent_type.name, info.field_name)
+    try:
+        return _timed_fields[key]
+    except KeyError:
+        field = info.parent_type.fields[info.field_name].extensions.get(GraphQLCoreConverter.DEFINITION_BACKREF)
+        timed = f"{key[0]}.{key[1]}" if getattr(field, "base_resolver", None) is not None else None
+        _timed_fields[key] = timed
+        return timed
+
+
+class MetricsExtension(SchemaExtension):
+    """
+    Records the latency and error count of every operation, and the latency, errors and list sizes of every field
+    with a resolver of its own. Fields read straight off their parent (most of them) only cost a dict lookup.
+    """
+
+    def on_operation(self) -> Iterator[None]:
+        start = time.perf_counter()
+        yield
+        execution_context = self.execution_context
+        try:
+            operation_type = execution_context.operation_type.value
+        except RuntimeError:
+            # The document did not parse, or has no such operation
+            operation_type = "unknown"
+        labels = (operation_type, _operation_name(execution_context.operation_name))
+        OPERATION_DURATION.observe(labels, time.perf_counter() - start)
+        result = execution_context.result
+        if result is not None and result.errors:
+            OPERATION_ERRORS.inc(labels, len(result.errors))
+
+    def resolve(
+        self, _next: Callable[..., object], root: Any, info: GraphQLResolveInfo, *args: str, **kwargs: Any
+    ) -> AwaitableOrValue[object]:
+        field = _timed_field(info)
+        if field is None:
+            return _next(root, info, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            result = _next(root, info, *args, **kwargs)
+        except Exception:
+            FIELD_ERRORS.inc((field,))
+            FIELD_DURATION.observe((field,), time.perf_counter() - start)
+            raise
+        if isawaitable(result):
+            return self._observe(field, start, result)
+        self._record(field, start, result)
+        return result
+
+    async def _observe(self, field: str, start: float, result: Awaitable[object]) -> object:
+        try:
+            value = await result
+        except Exception:
+            FIELD_ERRORS.inc((field,))
+            FIELD_DURATION.observe((field,), time.perf_counter() - start)
+            raise
+        self._record(field, start, value)
+        return value
+
+    @staticmethod
+    def _record(field: str, start: float, value: object) -> None:
+        FIELD_DURATION.observe((field,), time.perf_counter() - start)
+        if isinstance(value, list):
+            FIELD_RESULT_SIZE.observe((field,), len(value))
+
+
+class SQLStatsExtension(SchemaExtension):
+    """
+    Counts the SQL statements run by an operation's resolvers, reported in the response `extensions` (unless
+    `SQL_STATS_IN_RESPONSE` is off), so a resolver issuing one statement per item shows up right away
+    """
+
+    def on_operation(self) -> Iterator[None]:
+        self.counter = StatementCounter()
+        token = current_statement_counter.set(self.counter)
+        try:
+            yield
+        finally:
+            current_statement_counter.reset(token)
+
+    def get_results(self) -> dict[str, Any]:
+        if not settings.SQL_STATS_IN_RESPONSE:
+            return {}
+        return {"sql": {"statements": self.counter.count, "duration_ms": round(self.counter.seconds * 1000, 3)}}
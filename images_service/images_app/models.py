@@ -13,5 +13,75 @@ class Image(SQLModel, table=True):
 
     __table_args__ = (
         sa.Index("idx_priority", "priority"),
+        # Serves the best images of a product first, see `get_images_by_product_ids`
+        sa.Index("idx_product_id_priority", "product_id", sa.desc("priority"), "id"),
         sa.UniqueConstraint("product_id", "url", name="unique_product_id_url"),
     )
+
+
+# Id of the current transaction; `xid8` has no cast to bigint, hence the detour through text
+CURRENT_XACT_ID = "pg_current_xact_id()::text::bigint"
+
+# Stamped by Postgres on insert, and on every update that changes the image (an upsert of the same priority does not),
+# so the change feed sees every write whichever client made it. It is attached to the table only, never loaded by reads.
+image_updated_at = sa.Column(
+    "updated_at", sa.DateTime(timezone=True), server_default=sa.func.clock_timestamp(), nullable=False
+)
+Image.__table__.append_column(image_updated_at)  # type: ignore[attr-defined]
+# Answers lookups by time (what changed since a given moment); the change feed itself pages on `idx_xact_id_id`
+sa.Index("idx_updated_at_id", image_updated_at, Image.__table__.c.id)  # type: ignore[attr-defined]
+
+# Id of the transaction that last wrote the row, stamped alongside `updated_at`. The change feed is ordered by it and
+# only serves the rows of transactions older than any still in flight, so a slow transaction committing rows stamped
+# earlier than changes already served can never be skipped.
+image_xact_id = sa.Column("xact_id", sa.BigInteger, server_default=sa.text(CURRENT_XACT_ID), nullable=False)
+Image.__table__.append_column(image_xact_id)  # type: ignore[attr-defined]
+sa.Index("idx_xact_id_id", image_xact_id, Image.__table__.c.id)  # type: ignore[attr-defined]
+
+# Ids of deleted images, left behind by a trigger so the change feed can report deletes
+image_tombstone = sa.Table(
+    "image_tombstone",
+    SQLModel.metadata,
+    sa.Column("id", sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column("deleted_at", sa.DateTime(timezone=True), server_default=sa.func.clock_timestamp(), nullable=False),
+    sa.Column("xact_id", sa.BigInteger, server_default=sa.text(CURRENT_XACT_ID), nullable=False),
+    sa.Index("idx_deleted_at_id", "deleted_at", "id"),
+    sa.Index("idx_tombstone_xact_id_id", "xact_id", "id"),
+)
+
+# Kept in sync with the migration creating them
+IMAGE_TRIGGERS = (
+    """
+    CREATE OR REPLACE FUNCTION image_touch() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.updated_at := clock_timestamp();
+        NEW.xact_id := pg_current_xact_id()::text::bigint;
+        RETURN NEW;
+    END $$
+    """,
+    """
+    CREATE TRIGGER image_touch BEFORE UPDATE ON image FOR EACH ROW
+    WHEN ((OLD.url, OLD.priority, OLD.product_id) IS DISTINCT FROM (NEW.url, NEW.priority, NEW.product_id))
+    EXECUTE FUNCTION image_touch()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION image_tombstone() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO image_tombstone (id) SELECT id FROM deleted
+        ON CONFLICT (id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at, xact_id = EXCLUDED.xact_id;
+        RETURN NULL;
+    END $$
+    """,
+    # One insert per statement, whatever the number of deleted rows
+    """
+    CREATE TRIGGER image_tombstone AFTER DELETE ON image REFERENCING OLD TABLE AS deleted
+    FOR EACH STATEMENT EXECUTE FUNCTION image_tombstone()
+    """,
+)
+for trigger in IMAGE_TRIGGERS:
+    sa.event.listen(Image.__table__, "after_create", sa.DDL(trigger))  # type: ignore[attr-defined, no-untyped-call]
+sa.event.listen(
+    Image.__table__,  # type: ignore[attr-defined]
+    "after_drop",
+    sa.DDL("DROP FUNCTION IF EXISTS image_touch, image_tombstone"),  # type: ignore[no-untyped-call]
+)
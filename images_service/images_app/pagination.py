@@ -0,0 +1,54 @@
+import base64
+import binascii
+import json
+from typing import Any
+
+DEFAULT_PAGE_SIZE = 100
+# Images are small rows, synced in bulk by downstream consumers
+MAX_PAGE_SIZE = 1_000
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Encodes the sort key of a row into an opaque cursor
+    """
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor: str, *types: type) -> list[Any]:
+    """
+    Decodes a cursor produced by `encode_cursor` back into its sort key, one value of each of `types`.
+    A cursor of any other shape is rejected before it can reach a query.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != len(types) or not all(map(_is_a, values, types)):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _is_a(value: Any, type_: type) -> bool:
+    # Booleans are ints to Python, and JSON has a single number type, so a float may be written as an int
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, (int, float) if type_ is float else type_)
+
+
+def validate_page_size(first: int) -> int:
+    if not 1 <= first <= MAX_PAGE_SIZE:
+        raise ValueError(f"`first` must be between 1 and {MAX_PAGE_SIZE}")
+    return first
+
+
+def encode_change_cursor(xact_id: int, id: int) -> str:
+    """
+    Encodes the position of a change in a change feed
+    """
+    return encode_cursor(xact_id, id)
+
+
+def decode_change_cursor(cursor: str) -> tuple[int, int]:
+    xact_id, id = decode_cursor(cursor, int, int)
+    return xact_id, id
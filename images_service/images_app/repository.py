@@ -1,48 +1,258 @@
+from collections.abc import AsyncIterator, Collection
+from typing import Any
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlmodel import select
+from sqlalchemy.orm import aliased
+from sqlmodel import col, select
+
+from .db import commit
+from .models import Image, image_tombstone, image_updated_at, image_xact_id
+from .rows import ImageChangeRow, ImageRow, fetch_rows
+from .settings import settings
+
+# Channel the write paths NOTIFY with the id of every changed image, for replicas caching image reads
+IMAGES_CHANNEL = "images_changed"
 
-from .models import Image
+
+async def notify_changed(session: AsyncSession, image_ids: list[int]) -> None:
+    # Delivered to every listening replica when (and only if) the surrounding transaction commits
+    ids = sa.bindparam("image_ids", value=image_ids, type_=ARRAY(sa.Integer))
+    changed = sa.func.unnest(ids).column_valued("id")
+    await session.execute(select(sa.func.pg_notify(IMAGES_CHANNEL, sa.cast(changed, sa.Text))))
 
 
 async def create_image(session: AsyncSession, image_data: dict[str, object]) -> Image:
     image = Image(**image_data)
     session.add(image)
-    await session.commit()
-    await session.refresh(image)
+    await session.flush()
+    await notify_changed(session, [image.id])
+    await commit(session)
     return image
 
 
-async def get_image_by_id(session: AsyncSession, image_id: int) -> Image | None:
-    result = await session.scalar(select(Image).where(Image.id == image_id))
-    return result
+def image_columns(fields: Collection[str], *required: str) -> list[sa.Column[Any]]:
+    """
+    Columns to read for the requested `fields` (plus `id` and any `required` by the query itself), so the
+    columns a client did not ask for are neither transferred nor decoded
+    """
+    return [column for column in sa.inspect(Image).columns if column.key in {"id", *fields, *required}]
+
+
+async def create_images(session: AsyncSession, rows: list[dict[str, Any]]) -> list[Image]:
+    """
+    Inserts every row with a single statement in one transaction and returns the inserted images.
+    Rows whose (product_id, url) already exists are skipped (not returned) rather than failing the whole batch.
+    """
+    stmt, staging = await _insert_statement(session, rows)
+    images = list(
+        await session.scalars(stmt.on_conflict_do_nothing(constraint="unique_product_id_url").returning(Image))
+    )
+    await _drop_staging(session, staging)
+    if images:
+        await notify_changed(session, [image.id for image in images])
+    await commit(session)
+    return images
+
+
+async def upsert_images(session: AsyncSession, rows: list[dict[str, Any]]) -> list[tuple[Image, bool]]:
+    """
+    Inserts every row, or updates the priority of the image already stored for its (product_id, url), with a single
+    statement in one transaction. Returns every image with whether it was created, in no particular order.
+    Rows must be unique by (product_id, url), as one statement cannot update a row twice. An image stored with the
+    same priority is left as it is (no new row version, no change notification) and only read back.
+    """
+    stmt, staging = await _insert_statement(session, rows)
+    columns = sa.inspect(Image).columns
+    written = (
+        stmt.on_conflict_do_update(
+            constraint="unique_product_id_url",
+            set_={"priority": stmt.excluded.priority},
+            where=col(Image.priority).is_distinct_from(stmt.excluded.priority),
+        )
+        .returning(*columns)
+        .cte("written")
+    )
+    # The rest of the statement sees the table as it was before the upsert: an image written but not found there
+    # was created, and the images the upsert skipped are read as they are
+    stored = sa.inspect(Image).local_table.alias("stored")
+    keys = sa.tuple_(stored.c.product_id, stored.c.url)
+    upserted = sa.union_all(
+        sa.select(
+            *written.c,
+            (~sa.exists().where(col(Image.id) == written.c.id)).label("created"),
+            sa.true().label("changed"),
+        ),
+        sa.select(
+            *(stored.c[column.name] for column in columns), sa.false().label("created"), sa.false().label("changed")
+        ).where(_keys_in(keys, rows, staging), stored.c.id.not_in(select(written.c.id))),
+    ).subquery("upserted")
+    # Images already loaded by the unit of work are refreshed with the upserted values
+    result = await session.execute(
+        select(aliased(Image, upserted), upserted.c.created, upserted.c.changed),
+        execution_options={"populate_existing": True},
+    )
+    images = [(image, created, changed) for image, created, changed in result]
+    if len(images) < len(rows):
+        # A conflicting image committed by a concurrent transaction after the statement started is skipped when
+        # its priority is the same, and only visible to a later statement
+        found = {(image.product_id, image.url) for image, _, _ in images}
+        missing = [(row["product_id"], row["url"]) for row in rows if (row["product_id"], row["url"]) not in found]
+        stmt = select(Image).where(sa.tuple_(col(Image.product_id), col(Image.url)).in_(missing))
+        images += [(image, False, False) for image in await session.scalars(stmt)]
+    await _drop_staging(session, staging)
+    if changed_ids := [image.id for image, _, changed in images if changed]:
+        await notify_changed(session, changed_ids)
+    await commit(session)
+    return [(image, created) for image, created, _ in images]
+
+
+def _keys_in(keys: Any, rows: list[dict[str, Any]], staging: sa.Table | None) -> sa.ColumnElement[bool]:
+    if staging is None:
+        return keys.in_([(row["product_id"], row["url"]) for row in rows])  # type: ignore[no-any-return]
+    return keys.in_(select(staging.c.product_id, staging.c.url))  # type: ignore[no-any-return]
+
+
+async def _insert_statement(session: AsyncSession, rows: list[dict[str, Any]]) -> tuple[Any, sa.Table | None]:
+    # Large batches are inserted from a staging table filled by COPY, see `_copy_to_staging`
+    if len(rows) < settings.BULK_COPY_THRESHOLD:
+        return insert(Image).values(rows), None
+    staging = await _copy_to_staging(session, rows)
+    stmt = insert(Image).from_select(
+        ["url", "priority", "product_id"],
+        select(staging.c.url, staging.c.priority, staging.c.product_id).order_by(staging.c.position),
+    )
+    return stmt, staging
 
 
-async def get_images_by_product_id(session: AsyncSession, product_id: int) -> list[Image]:
-    stmt = select(Image).where(Image.product_id == product_id)
-    res = await session.scalars(stmt)
-    return list(res.all())
+async def _drop_staging(session: AsyncSession, staging: sa.Table | None) -> None:
+    if staging is not None:
+        # The transaction may go on (see `UnitOfWork`), leaving room for another import
+        await (await session.connection()).run_sync(staging.drop)
 
 
-async def get_all_images(session: AsyncSession) -> list[Image]:
-    result = await session.scalars(select(Image))
-    return list(result.all())
+async def _copy_to_staging(session: AsyncSession, rows: list[dict[str, Any]]) -> sa.Table:
+    # COPY streams the rows without binding thousands of parameters; the staging table vanishes on commit
+    staging = sa.Table(
+        "image_import",
+        sa.MetaData(),
+        sa.Column("position", sa.Integer),
+        sa.Column("url", sa.Text),
+        sa.Column("priority", sa.Integer),
+        sa.Column("product_id", sa.Integer),
+        prefixes=["TEMPORARY"],
+        postgresql_on_commit="DROP",
+    )
+    connection = await session.connection()
+    await connection.run_sync(staging.create)
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(  # type: ignore[union-attr]
+        staging.name,
+        records=[(position, row["url"], row["priority"], row["product_id"]) for position, row in enumerate(rows)],
+        columns=[column.name for column in staging.columns],
+    )
+    return staging
+
+
+async def get_image_by_id(session: AsyncSession, image_id: int, fields: Collection[str]) -> ImageRow | None:
+    rows = await fetch_rows(session, sa.select(*image_columns(fields)).where(col(Image.id) == image_id), ImageRow)
+    return rows[0] if rows else None
+
+
+async def get_images_by_product_ids(
+    session: AsyncSession,
+    product_ids: list[int],
+    fields: Collection[str],
+    limit: int | None = None,
+    min_priority: int | None = None,
+) -> list[ImageRow]:
+    """
+    Images of every product, highest priority first, or only the best `limit` of each product: a `LATERAL` subquery
+    per product then reads just those rows off `idx_product_id_priority`, whatever the number of images
+    """
+    # A single array parameter keeps the statement text (and its prepared plan) identical for any batch size
+    ids = sa.bindparam("product_ids", value=product_ids, type_=ARRAY(sa.Integer))
+    stmt = sa.select(*image_columns(fields, "product_id"))
+    if min_priority is not None:
+        stmt = stmt.where(col(Image.priority) >= min_priority)
+    stmt = stmt.order_by(col(Image.priority).desc(), col(Image.id))
+    if limit is None:
+        return await fetch_rows(session, stmt.where(col(Image.product_id) == sa.any_(ids)), ImageRow)
+    products = sa.func.unnest(ids).table_valued("product_id").render_derived("products")
+    best = stmt.where(col(Image.product_id) == products.c.product_id).limit(limit).lateral("best")
+    return await fetch_rows(session, sa.select(*best.c).select_from(products).join(best, sa.true()), ImageRow)
+
+
+async def get_all_images(
+    session: AsyncSession, limit: int | None, after_id: int | None, fields: Collection[str]
+) -> list[ImageRow]:
+    # A range on the primary key, so a page costs the same wherever it starts (no limit: every image)
+    stmt = sa.select(*image_columns(fields))
+    if after_id is not None:
+        stmt = stmt.where(col(Image.id) > after_id)
+    return await fetch_rows(session, stmt.order_by(col(Image.id)).limit(limit), ImageRow)
+
+
+async def stream_images(session: AsyncSession, fields: Collection[str]) -> AsyncIterator[dict[str, Any]]:
+    """
+    Yields every image through a server-side cursor, so at most `STREAM_FETCH_SIZE` rows are held in memory
+    however large the table is
+    """
+    connection = await session.connection()
+    stmt = sa.select(*image_columns(fields)).execution_options(yield_per=settings.STREAM_FETCH_SIZE)
+    result = await connection.stream(stmt)
+    async for row in result.mappings():
+        yield dict(row)
+
+
+async def get_changes_since(session: AsyncSession, after: tuple[int, int] | None, limit: int) -> list[ImageChangeRow]:
+    """
+    The first `limit` images changed or deleted after the `(xact_id, id)` position of a change feed, in the order of
+    their transactions. Changes are held back while an older transaction is in flight: it may still commit, and a
+    consumer past its changes would miss them.
+    """
+    # Every transaction older than the oldest one still in flight has committed (or aborted)
+    finished = sa.cast(sa.cast(sa.func.pg_snapshot_xmin(sa.func.pg_current_snapshot()), sa.Text), sa.BigInteger)
+    # Each branch is a range scan over its `(xact_id, id)` index, merged by the outer sort
+    live = sa.select(
+        *image_columns(ImageRow.__slots__),
+        image_xact_id,
+        image_updated_at.label("changed_at"),
+        sa.false().label("deleted"),
+    ).where(image_xact_id < finished)
+    dead = sa.select(
+        image_tombstone.c.id,
+        sa.null().label("url"),
+        sa.null().label("priority"),
+        sa.null().label("product_id"),
+        image_tombstone.c.xact_id,
+        image_tombstone.c.deleted_at.label("changed_at"),
+        sa.true().label("deleted"),
+    ).where(image_tombstone.c.xact_id < finished)
+    if after is not None:
+        position = sa.tuple_(*map(sa.literal, after))
+        live = live.where(sa.tuple_(image_xact_id, col(Image.id)) > position)
+        dead = dead.where(sa.tuple_(image_tombstone.c.xact_id, image_tombstone.c.id) > position)
+    live = live.order_by(image_xact_id, col(Image.id)).limit(limit)
+    dead = dead.order_by(image_tombstone.c.xact_id, image_tombstone.c.id).limit(limit)
+    changes = sa.union_all(live, dead).subquery("changes")
+    stmt = sa.select(*changes.c).order_by(changes.c.xact_id, changes.c.id).limit(limit)
+    return await fetch_rows(session, stmt, ImageChangeRow)
 
 
 async def update_image(session: AsyncSession, image_id: int, updates: dict[str, object]) -> Image | None:
-    image = await get_image_by_id(session, image_id)
-    if image:
-        for key, value in updates.items():
-            setattr(image, key, value)
-        session.add(image)
-        await session.commit()
-        await session.refresh(image)
-    return image
+    # One statement updates the row, returns it and queues its change notification; no row means no such image
+    updated = sa.update(Image).where(col(Image.id) == image_id).values(updates).returning(Image).cte("updated")
+    stmt = select(aliased(Image, updated), sa.func.pg_notify(IMAGES_CHANNEL, sa.cast(updated.c.id, sa.Text)))
+    # An image already loaded by the unit of work is refreshed with the updated values
+    row = (await session.execute(stmt, execution_options={"populate_existing": True})).first()
+    await commit(session)
+    return row[0] if row else None
 
 
 async def delete_image(session: AsyncSession, image_id: int) -> bool:
-    image = await get_image_by_id(session, image_id)
-    if image:
-        await session.delete(image)
-        await session.commit()
-        return True
-    return False
+    deleted = sa.delete(Image).where(col(Image.id) == image_id).returning(col(Image.id)).cte("deleted")
+    row = (await session.execute(select(sa.func.pg_notify(IMAGES_CHANNEL, sa.cast(deleted.c.id, sa.Text))))).first()
+    await commit(session)
+    return row is not None
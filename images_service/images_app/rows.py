@@ -0,0 +1,70 @@
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any, TypeVar
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+
+R = TypeVar("R", bound="SlottedRow")
+
+
+class SlottedRow:
+    """
+    Base of the plain result objects of the ORM-free read path, one slot per selectable column
+    """
+
+    __slots__ = ()
+
+
+class ImageRow(SlottedRow):
+    """
+    An image read without the ORM; attributes of columns the query did not select are left unset
+    """
+
+    __slots__ = ("id", "url", "priority", "product_id")
+
+    id: int
+    url: str
+    priority: int
+    product_id: int
+
+
+class ImageChangeRow(ImageRow):
+    """
+    An image changed since a change feed cursor; a deleted image only has its `id` (its other columns are `None`)
+    """
+
+    __slots__ = ("xact_id", "changed_at", "deleted")
+
+    xact_id: int
+    changed_at: datetime
+    deleted: bool
+
+
+async def fetch_rows(session: AsyncSession, stmt: sa.Select[Any], row_type: type[R]) -> list[R]:
+    """
+    Runs a Core select and maps the driver's records straight onto `row_type` instances, skipping ORM identity
+    tracking, model validation and SQLAlchemy `Row` objects. Every selected column key must be a slot of `row_type`.
+    """
+    connection = await session.connection()
+    result = await connection.execute(stmt)
+    try:
+        # The asyncpg cursor already holds every record of the (buffered) result
+        cursor = result.cursor
+        records = cursor.fetchall()
+        columns: list[tuple[Callable[[Any, Any], None], Callable[[Any], Any] | None]] = [
+            (
+                getattr(row_type, description[0]).__set__,
+                column.type.dialect_impl(connection.dialect).result_processor(connection.dialect, description[1]),
+            )
+            for column, description in zip(stmt.selected_columns, cursor.description, strict=True)
+        ]
+    finally:
+        result.close()
+    rows = []
+    for record in records:
+        row = row_type.__new__(row_type)
+        for (set_value, process), value in zip(columns, record, strict=True):
+            set_value(row, value if process is None or value is None else process(value))
+        rows.append(row)
+    return rows
@@ -1,14 +1,38 @@
+from datetime import datetime
+
 import strawberry
 
+from .batching import write_batcher
+from .context import Context
 from .db import get_session
+from .extensions import (
+    DocumentCacheExtension,
+    MetricsExtension,
+    QueryCostExtension,
+    SQLStatsExtension,
+    UnitOfWorkExtension,
+)
+from .pagination import (
+    DEFAULT_PAGE_SIZE,
+    decode_change_cursor,
+    decode_cursor,
+    encode_change_cursor,
+    encode_cursor,
+    validate_page_size,
+)
+from .rows import ImageRow
+from .selection import requested_fields
 from .services import (
     create_image_service,
+    create_images_service,
     delete_image_service,
     get_all_images_service,
+    get_changes_since_service,
     get_image_service,
-    get_images_by_product_id_service,
     update_image_service,
+    upsert_images_service,
 )
+from .settings import settings
 
 
 @strawberry.federation.type(keys=["id"])
@@ -19,6 +43,58 @@ class ImageType:
     product_id: int
 
 
+# Both subgraphs page with this type, so the gateway must be allowed to resolve it from either
+@strawberry.federation.type(shareable=True)
+class PageInfo:
+    has_next_page: bool
+    end_cursor: str | None
+
+
+@strawberry.type
+class ImageEdge:
+    cursor: str
+    # Pages serve the read path's plain rows as images as they are, without copying them
+    node: ImageRow = strawberry.field(graphql_type=ImageType)
+
+
+@strawberry.type
+class ImageConnection:
+    edges: list[ImageEdge]
+    page_info: PageInfo
+
+
+@strawberry.type
+class ImageChange:
+    cursor: str
+    id: int
+    deleted: bool
+    changed_at: datetime
+    # The image as of now, `null` once deleted
+    image: ImageRow | None = strawberry.field(graphql_type=ImageType | None)
+
+
+@strawberry.type
+class ImageChangeFeed:
+    changes: list[ImageChange]
+    # Where to resume from: the cursor of the last change, or the given one when nothing changed since
+    cursor: str | None
+    has_more: bool
+
+
+@strawberry.type
+class CreateImageResult:
+    image: ImageType | None
+    error: str | None
+
+
+@strawberry.type
+class UpsertImageResult:
+    image: ImageType | None
+    # Whether the image was created, rather than updated
+    created: bool
+    error: str | None
+
+
 @strawberry.input
 class ImageInput:
     url: str
@@ -30,35 +106,114 @@ class ImageInput:
 class ProductType:
     id: int
 
-    @strawberry.field
-    async def images(self) -> list[ImageType]:
-        images = await get_images_by_product_id_service(self.id)
-        return [ImageType(**image.model_dump()) for image in images]
+    # Reads return the read path's plain rows, served as images as they are (`graphql_type` overrides the
+    # annotation, which Strawberry's stubs leave untyped)
+    @strawberry.field(graphql_type=list[ImageType])  # type: ignore[untyped-decorator]
+    async def images(
+        self, info: strawberry.Info[Context, None], first: int | None = None, min_priority: int | None = None
+    ) -> list[ImageRow]:
+        # Highest priority first; `first` keeps only the best few of each product
+        fields = frozenset(requested_fields(info.selected_fields[0].selections))
+        limit = validate_page_size(first) if first is not None else None
+        return await info.context.images_by_product_id(fields, limit, min_priority).load(self.id)
 
 
 @strawberry.type
 class Query:
-    @strawberry.field
-    async def get_image(self, image_id: int) -> ImageType | None:
+    @strawberry.field(graphql_type=ImageType | None)  # type: ignore[untyped-decorator]
+    async def get_image(self, info: strawberry.Info[Context, None], image_id: int) -> ImageRow | None:
         async with get_session() as session:
-            image = await get_image_service(session, image_id)
-            return ImageType(**image.model_dump()) if image else None
+            return await get_image_service(session, image_id, requested_fields(info.selected_fields[0].selections))
+
+    @strawberry.field(
+        graphql_type=list[ImageType],
+        deprecation_reason="Reads every image at once, use `imagesConnection` to page through them",
+    )  # type: ignore[untyped-decorator]
+    async def get_all_images(self, info: strawberry.Info[Context, None]) -> list[ImageRow]:
+        async with get_session() as session:
+            return await get_all_images_service(
+                session, None, None, requested_fields(info.selected_fields[0].selections)
+            )
 
     @strawberry.field
-    async def get_all_images(self) -> list[ImageType]:
+    async def images_connection(
+        self, info: strawberry.Info[Context, None], first: int = DEFAULT_PAGE_SIZE, after: str | None = None
+    ) -> ImageConnection:
+        (after_id,) = decode_cursor(after, int) if after else (None,)
+        fields = requested_fields(info.selected_fields[0].selections, "edges", "node")
         async with get_session() as session:
-            images = await get_all_images_service(session)
-            return [ImageType(**image.model_dump()) for image in images]
+            # One extra row only signals that another page exists
+            images = await get_all_images_service(session, validate_page_size(first) + 1, after_id, fields)
+        edges = [ImageEdge(cursor=encode_cursor(image.id), node=image) for image in images[:first]]
+        return ImageConnection(
+            edges=edges,
+            page_info=PageInfo(has_next_page=len(images) > first, end_cursor=edges[-1].cursor if edges else None),
+        )
+
+    @strawberry.field
+    async def images_changed_since(self, cursor: str | None = None, first: int = DEFAULT_PAGE_SIZE) -> ImageChangeFeed:
+        # Images created, updated or deleted after `cursor` (from the start without one), oldest first
+        after = decode_change_cursor(cursor) if cursor else None
+        # One extra change only signals that more are pending
+        changes = await get_changes_since_service(after, validate_page_size(first) + 1)
+        page = [
+            ImageChange(
+                cursor=encode_change_cursor(change.xact_id, change.id),
+                id=change.id,
+                deleted=change.deleted,
+                changed_at=change.changed_at,
+                image=None if change.deleted else change,
+            )
+            for change in changes[:first]
+        ]
+        return ImageChangeFeed(changes=page, cursor=page[-1].cursor if page else cursor, has_more=len(changes) > first)
 
 
 @strawberry.type
 class Mutation:
     @strawberry.mutation
     async def create_image(self, inp: ImageInput) -> ImageType:
+        if settings.WRITE_BATCHING:
+            # Committed with the images created concurrently, rather than in the operation's transaction
+            image = await write_batcher.create_image(strawberry.asdict(inp))
+            return ImageType(**image.model_dump())
         async with get_session() as session:
             image = await create_image_service(session, inp.url, inp.priority, inp.product_id)
             return ImageType(**image.model_dump())
 
+    @strawberry.mutation
+    async def create_images(self, inputs: list[ImageInput]) -> list[CreateImageResult]:
+        if len(inputs) > settings.BULK_MAX_ITEMS:
+            raise ValueError(f"At most {settings.BULK_MAX_ITEMS} images can be created at once")
+        async with get_session() as session:
+            results = await create_images_service(session, [strawberry.asdict(inp) for inp in inputs])
+            return [
+                CreateImageResult(image=ImageType(**image.model_dump()) if image else None, error=error)
+                for image, error in results
+            ]
+
+    @strawberry.mutation
+    async def upsert_image(self, inp: ImageInput) -> UpsertImageResult:
+        # Safe to retry: the image of the same product and url is updated instead of failing as a duplicate
+        async with get_session() as session:
+            ((image, created, error),) = await upsert_images_service(session, [strawberry.asdict(inp)])
+            return UpsertImageResult(
+                image=ImageType(**image.model_dump()) if image else None, created=created, error=error
+            )
+
+    @strawberry.mutation
+    async def upsert_images(self, inputs: list[ImageInput]) -> list[UpsertImageResult]:
+        if len(inputs) > settings.BULK_MAX_ITEMS:
+            raise ValueError(f"At most {settings.BULK_MAX_ITEMS} images can be upserted at once")
+        async with get_session() as session:
+            results = await upsert_images_service(session, [strawberry.asdict(inp) for inp in inputs])
+            return [
+                UpsertImageResult(
+                    image=ImageType(**image.model_dump()) if image else None, created=created, error=error
+                )
+                for image, created, error in results
+            ]
+
     @strawberry.mutation
     async def update_image(self, image_id: int, updates: ImageInput) -> ImageType | None:
         async with get_session() as session:
@@ -73,5 +228,15 @@ class Mutation:
 
 
 schema = strawberry.federation.Schema(
-    query=Query, types=[ImageType, ProductType], mutation=Mutation, enable_federation_2=True
+    query=Query,
+    types=[ImageType, ProductType],
+    mutation=Mutation,
+    extensions=[
+        MetricsExtension,
+        SQLStatsExtension,
+        DocumentCacheExtension,
+        QueryCostExtension,
+        UnitOfWorkExtension,
+    ],
+    enable_federation_2=True,
 )
@@ -1,16 +1,28 @@
+import asyncio
+import json
+from collections import defaultdict
+from collections.abc import AsyncIterator, Collection
+from typing import Any
+
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from images_app.db import get_session
+from images_app.db import get_session, init_db, read_session_maker
 
 from .models import Image
 from .repository import (
     create_image,
+    create_images,
     delete_image,
     get_all_images,
+    get_changes_since,
     get_image_by_id,
-    get_images_by_product_id,
+    get_images_by_product_ids,
+    stream_images,
     update_image,
+    upsert_images,
 )
+from .rows import ImageChangeRow, ImageRow
+from .settings import settings
 
 
 async def create_image_service(session: AsyncSession, url: str, priority: int, product_id: int) -> Image:
@@ -18,17 +30,140 @@ async def create_image_service(session: AsyncSession, url: str, priority: int, p
     return await create_image(session, image_data)
 
 
-async def get_image_service(session: AsyncSession, image_id: int) -> Image | None:
-    return await get_image_by_id(session, image_id)
+async def create_images_service(
+    session: AsyncSession, images_data: list[dict[str, Any]]
+) -> list[tuple[Image | None, str | None]]:
+    """
+    Creates many images at once, returning `(image, None)` or `(None, error)` in the order of `images_data`.
+    Invalid items are rejected up front; the valid ones are inserted in a single statement.
+    """
+    errors: list[str | None] = []
+    seen: set[tuple[int, str]] = set()
+    for image_data in images_data:
+        key = (image_data["product_id"], image_data["url"])
+        if not 0 <= image_data["priority"] <= 100:
+            errors.append("Priority must be between 0 and 100")
+        elif key in seen:
+            errors.append(
+                f"Duplicate url {image_data['url']!r} for product {image_data['product_id']} in the same batch"
+            )
+        else:
+            errors.append(None)
+        seen.add(key)
+    rows = [image_data for image_data, error in zip(images_data, errors, strict=True) if error is None]
+    created = {(image.product_id, image.url): image for image in await create_images(session, rows)} if rows else {}
+    results: list[tuple[Image | None, str | None]] = []
+    for image_data, error in zip(images_data, errors, strict=True):
+        key = (image_data["product_id"], image_data["url"])
+        if error is not None:
+            results.append((None, error))
+        elif key in created:
+            results.append((created[key], None))
+        else:
+            results.append((None, f"Image {image_data['url']!r} of product {image_data['product_id']} already exists"))
+    return results
+
+
+async def upsert_images_service(
+    session: AsyncSession, images_data: list[dict[str, Any]]
+) -> list[tuple[Image | None, bool, str | None]]:
+    """
+    Creates or re-prioritises many images at once, returning `(image, created, error)` in the order of `images_data`.
+    Invalid items are rejected up front; an image listed twice is upserted once, with the last priority given.
+    """
+    rows: dict[tuple[int, str], dict[str, Any]] = {}
+    for image_data in images_data:
+        if 0 <= image_data["priority"] <= 100:
+            rows[(image_data["product_id"], image_data["url"])] = image_data
+    upserted: dict[tuple[int, str], tuple[Image, bool]] = {}
+    if rows:
+        for image, created in await upsert_images(session, list(rows.values())):
+            upserted[(image.product_id, image.url)] = (image, created)
+    results: list[tuple[Image | None, bool, str | None]] = []
+    for image_data in images_data:
+        key = (image_data["product_id"], image_data["url"])
+        if not 0 <= image_data["priority"] <= 100:
+            results.append((None, False, "Priority must be between 0 and 100"))
+        else:
+            results.append((*upserted[key], None))
+    return results
+
+
+async def get_image_service(session: AsyncSession, image_id: int, fields: Collection[str]) -> ImageRow | None:
+    return await get_image_by_id(session, image_id, fields)
 
 
-async def get_images_by_product_id_service(product_id: int) -> list[Image]:
+async def get_images_by_product_ids_service(
+    fields: Collection[str], limit: int | None, min_priority: int | None, product_ids: list[int]
+) -> list[list[ImageRow]]:
     async with get_session() as session:
-        return await get_images_by_product_id(session, product_id)
+        images = await get_images_by_product_ids(session, product_ids, fields, limit, min_priority)
+    grouped: dict[int, list[ImageRow]] = defaultdict(list)
+    for image in images:
+        grouped[image.product_id].append(image)
+    return [grouped.get(product_id, []) for product_id in product_ids]
+
+
+async def get_all_images_service(
+    session: AsyncSession, limit: int | None, after_id: int | None, fields: Collection[str]
+) -> list[ImageRow]:
+    return await get_all_images(session, limit, after_id, fields)
+
+
+# Each export holds a connection for the whole download, so only this many run at once and the pool is left to the
+# GraphQL operations
+export_slots = asyncio.Semaphore(settings.EXPORT_CONCURRENCY_LIMIT)
+
+
+class ExportSlot:
+    """
+    One of the `export_slots`, released once by whichever of its stream and its response ends first
+    """
+
+    def __init__(self) -> None:
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            export_slots.release()
+
+
+async def take_export_slot() -> ExportSlot | None:
+    """
+    Takes an export slot without waiting for one, or returns None when every slot is taken
+    """
+    if export_slots.locked():
+        return None
+    # Acquiring a free slot completes without yielding to the event loop, so no other request takes it in between
+    await export_slots.acquire()
+    return ExportSlot()
+
+
+async def export_images_service(slot: ExportSlot, fields: Collection[str]) -> AsyncIterator[str]:
+    """
+    Every image as a line of JSON, read from a replica (when configured) in a single snapshot.
+    The `slot` is released once the stream ends, fails or is closed.
+    """
+    try:
+        async with read_session_maker()() as session:
+            async for image in stream_images(session, fields):
+                yield json.dumps(image) + "\n"
+    finally:
+        slot.release()
+
+
+async def close_export(stream: AsyncIterator[str], slot: ExportSlot) -> None:
+    # Run once the response is over: a stream cut short by the client (or never started) still lets go of its slot
+    await stream.aclose()  # type: ignore[attr-defined]
+    slot.release()
 
 
-async def get_all_images_service(session: AsyncSession) -> list[Image]:
-    return await get_all_images(session)
+async def get_changes_since_service(after: tuple[int, int] | None, limit: int) -> list[ImageChangeRow]:
+    # Always read from the primary: only it knows every transaction still in flight, and replicas lag behind each
+    # other, so a consumer moving between them could pass changes one of them has not replayed yet
+    async with init_db()() as session:
+        return await get_changes_since(session, after, limit)
 
 
 async def update_image_service(session: AsyncSession, image_id: int, updates: dict[str, object]) -> Image | None:
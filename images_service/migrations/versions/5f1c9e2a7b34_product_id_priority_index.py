@@ -0,0 +1,26 @@
+"""product id priority index
+
+Revision ID: 5f1c9e2a7b34
+Revises: e60cef4baa9f
+Create Date: 2026-10-18 15:04:12.518730
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5f1c9e2a7b34"
+down_revision: str | None = "e60cef4baa9f"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_index("idx_product_id_priority", "image", ["product_id", sa.text("priority DESC"), "id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("idx_product_id_priority", table_name="image")
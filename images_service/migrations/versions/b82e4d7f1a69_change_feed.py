@@ -0,0 +1,76 @@
+"""change feed
+
+Revision ID: b82e4d7f1a69
+Revises: 5f1c9e2a7b34
+Create Date: 2026-10-18 16:48:03.215407
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b82e4d7f1a69"
+down_revision: str | None = "5f1c9e2a7b34"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+TRIGGERS = (
+    """
+    CREATE OR REPLACE FUNCTION image_touch() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.updated_at := clock_timestamp();
+        RETURN NEW;
+    END $$
+    """,
+    """
+    CREATE TRIGGER image_touch BEFORE UPDATE ON image FOR EACH ROW
+    WHEN ((OLD.url, OLD.priority, OLD.product_id) IS DISTINCT FROM (NEW.url, NEW.priority, NEW.product_id))
+    EXECUTE FUNCTION image_touch()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION image_tombstone() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO image_tombstone (id) SELECT id FROM deleted
+        ON CONFLICT (id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+        RETURN NULL;
+    END $$
+    """,
+    """
+    CREATE TRIGGER image_tombstone AFTER DELETE ON image REFERENCING OLD TABLE AS deleted
+    FOR EACH STATEMENT EXECUTE FUNCTION image_tombstone()
+    """,
+)
+
+
+def upgrade() -> None:
+    # A stable default fills the existing rows without rewriting the table; new rows get the time of their insert
+    op.add_column(
+        "image",
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+    op.alter_column("image", "updated_at", server_default=sa.text("clock_timestamp()"))
+    op.create_index("idx_updated_at_id", "image", ["updated_at", "id"], unique=False)
+    op.create_table(
+        "image_tombstone",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column(
+            "deleted_at", sa.DateTime(timezone=True), server_default=sa.text("clock_timestamp()"), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("idx_deleted_at_id", "image_tombstone", ["deleted_at", "id"], unique=False)
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER image_tombstone ON image")
+    op.execute("DROP TRIGGER image_touch ON image")
+    op.execute("DROP FUNCTION image_touch, image_tombstone")
+    op.drop_index("idx_deleted_at_id", table_name="image_tombstone")
+    op.drop_table("image_tombstone")
+    op.drop_index("idx_updated_at_id", table_name="image")
+    op.drop_column("image", "updated_at")
@@ -2,17 +2,18 @@ from collections.abc import AsyncGenerator
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 from sqlmodel import SQLModel
 
 from images_app.app import create_app
-from images_app.db import get_db_engine, get_session
+from images_app.db import dispose_db, get_db_engine
 from images_app.models import Image
 from images_app.settings import settings
 
 
 @pytest.fixture
-async def seed_images() -> list[Image]:
-    async with get_session() as session:
+async def seed_images(engine: AsyncEngine) -> list[Image]:
+    async with async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)() as session:
         images = [
             Image(url="http://example.com/image1.jpg", priority=50, product_id=1),
             Image(url="http://example.com/image2.jpg", priority=20, product_id=2),
@@ -23,13 +24,22 @@ async def seed_images() -> list[Image]:
         return images
 
 
+@pytest.fixture(scope="function")
+async def engine() -> AsyncGenerator[AsyncEngine, None]:
+    """Engine owned by the test itself, separate from the app's lifespan-managed pool."""
+    engine = get_db_engine(settings.DATABASE_URI)
+    yield engine
+    await engine.dispose()
+
+
 @pytest.fixture(scope="function", autouse=True)
-async def setup_test_env() -> AsyncGenerator[None, None]:
+async def setup_test_env(engine: AsyncEngine) -> AsyncGenerator[None, None]:
     """Sets up the database environment for testing."""
-    engine = get_db_engine(settings.DATABASE_URI)
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
     yield
+    # Drop the process-wide engine if the test executed operations directly, outside the app lifespan
+    await dispose_db()
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.drop_all)
 
@@ -0,0 +1,225 @@
+import time
+from typing import Any
+
+import pytest
+import sqlalchemy as sa
+import strawberry
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlmodel import select
+
+from images_app import db
+from images_app.context import Context
+from images_app.extensions import MetricsExtension
+from images_app.models import Image
+from images_app.repository import get_all_images
+from images_app.rows import ImageRow
+from images_app.schema import ImageType, Mutation, ProductType, Query, schema
+
+ENTITIES_QUERY = """
+    query Entities($representations: [_Any!]!) {
+        _entities(representations: $representations) {
+            ... on ProductType {
+                images {
+                    url
+                }
+            }
+        }
+    }
+"""
+
+
+@pytest.fixture
+async def seed_product_images(engine: AsyncEngine) -> None:
+    async with async_sessionmaker(engine, class_=AsyncSession)() as session:
+        session.add_all(Image(url=f"http://example.com/{i}.jpg", product_id=i) for i in range(500))
+        await session.commit()
+
+
+@pytest.mark.parametrize("products", [1, 10, 100, 500])
+async def test_product_images_query_count_scaling(
+    fastapi_client: TestClient, seed_product_images: None, products: int
+) -> None:
+    statements: list[str] = []
+
+    def count(_conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        statements.append(statement)
+
+    assert db._engine is not None
+    event.listen(db._engine.sync_engine, "before_cursor_execute", count)
+    try:
+        representations = [{"__typename": "ProductType", "id": i} for i in range(products)]
+        response = fastapi_client.post(
+            "/graphql", json={"query": ENTITIES_QUERY, "variables": {"representations": representations}}
+        )
+    finally:
+        event.remove(db._engine.sync_engine, "before_cursor_execute", count)
+
+    data = response.json()
+    assert "errors" not in data
+    assert len(data["data"]["_entities"]) == products
+    assert len(statements) == 1
+
+
+# Rows per second a bulk create must sustain: a few times below what a statement per batch achieves, and above what a
+# statement per row would. The fixed cost of the request dominates small batches.
+@pytest.mark.parametrize(("rows", "min_rows_per_second"), [(100, 500), (5000, 5_000)])
+async def test_create_images_throughput(fastapi_client: TestClient, rows: int, min_rows_per_second: int) -> None:
+    statements: list[str] = []
+
+    def count(_conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        statements.append(statement)
+
+    mutation = """
+        mutation CreateImages($inputs: [ImageInput!]!) {
+            createImages(inputs: $inputs) {
+                error
+            }
+        }
+    """
+    inputs = [{"url": f"http://example.com/{i}.jpg", "productId": i % 50} for i in range(rows)]
+    assert db._engine is not None
+    event.listen(db._engine.sync_engine, "before_cursor_execute", count)
+    try:
+        start = time.perf_counter()
+        response = fastapi_client.post("/graphql", json={"query": mutation, "variables": {"inputs": inputs}})
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(db._engine.sync_engine, "before_cursor_execute", count)
+
+    results = response.json()["data"]["createImages"]
+    assert [result["error"] for result in results] == [None] * rows
+    assert len(statements) <= 4
+    assert rows / elapsed >= min_rows_per_second, f"{rows / elapsed:,.0f} rows/sec"
+
+
+@pytest.mark.parametrize(
+    ("mutation", "expected"),
+    [
+        (
+            'mutation { updateImage(imageId: 1, updates: {url: "http://example.com/a.jpg", productId: 1}) { url } }',
+            {"url": "http://example.com/a.jpg"},
+        ),
+        (
+            'mutation { updateImage(imageId: 999, updates: {url: "http://example.com/a.jpg", productId: 1}) { url } }',
+            None,
+        ),
+        ("mutation { deleteImage(imageId: 1) }", "Image deleted successfully."),
+        ("mutation { deleteImage(imageId: 999) }", "Image not found."),
+    ],
+)
+async def test_write_is_single_statement(
+    fastapi_client: TestClient, seed_images: list[Image], mutation: str, expected: Any
+) -> None:
+    statements: list[str] = []
+
+    def count(_conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        statements.append(statement)
+
+    assert db._engine is not None
+    event.listen(db._engine.sync_engine, "before_cursor_execute", count)
+    try:
+        response = fastapi_client.post("/graphql", json={"query": mutation})
+    finally:
+        event.remove(db._engine.sync_engine, "before_cursor_execute", count)
+
+    (data,) = response.json()["data"].values()
+    assert data == expected
+    assert len(statements) == 1
+
+
+@pytest.mark.parametrize(
+    ("query", "columns"),
+    [
+        ("query { getAllImages { url } }", ["id", "url"]),
+        ("query { getImage(imageId: 1) { priority productId } }", ["id", "priority", "product_id"]),
+        (
+            'query { _entities(representations: [{__typename: "ProductType", id: 1}]) '
+            "{ ... on ProductType { images { ... on ImageType { url } } } } }",
+            ["id", "url", "product_id"],
+        ),
+    ],
+)
+async def test_reads_only_requested_columns(
+    fastapi_client: TestClient, seed_images: list[Image], query: str, columns: list[str]
+) -> None:
+    statements: list[str] = []
+
+    def capture(_conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        statements.append(statement)
+
+    assert db._engine is not None
+    event.listen(db._engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        response = fastapi_client.post("/graphql", json={"query": query})
+    finally:
+        event.remove(db._engine.sync_engine, "before_cursor_execute", capture)
+
+    assert "errors" not in response.json()
+    (statement,) = statements
+    selected = statement[len("SELECT ") : statement.index(" \nFROM")]
+    assert selected.split(", ") == [f"image.{column}" for column in columns]
+
+
+@pytest.fixture
+async def seed_10k_images(engine: AsyncEngine) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(
+            sa.text(
+                "INSERT INTO image (url, priority, product_id) "
+                "SELECT 'http://example.com/' || n || '.jpg', n % 101, n FROM generate_series(1, 10000) AS n"
+            )
+        )
+
+
+async def test_read_path_per_row_cost(engine: AsyncEngine, seed_10k_images: None) -> None:
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def orm_path() -> list[ImageType]:
+        async with session_maker() as session:
+            images = await session.scalars(select(Image))
+            return [ImageType(**image.model_dump()) for image in images]
+
+    async def row_path() -> list[ImageRow]:
+        async with session_maker() as session:
+            return await get_all_images(session, 10000, None, ImageRow.__slots__)
+
+    timings = {}
+    for name, path in (("ORM", orm_path), ("rows", row_path)):
+        assert len(await path()) == 10000  # warm up connections and compiled statement caches
+        start = time.process_time()
+        for _ in range(3):
+            await path()
+        timings[name] = (time.process_time() - start) / 3 / 10000
+
+    assert timings["rows"] < timings["ORM"]
+
+
+async def test_metrics_per_field_overhead(seed_10k_images: None) -> None:
+    without_metrics = strawberry.federation.Schema(
+        query=Query,
+        types=[ImageType, ProductType],
+        mutation=Mutation,
+        extensions=[extension for extension in schema.extensions if extension is not MetricsExtension],
+        enable_federation_2=True,
+    )
+    query = "query { imagesConnection(first: 1000) { edges { node { id url priority productId } } } }"
+
+    schemas = {"without metrics": without_metrics, "with metrics": schema}
+    timings = dict.fromkeys(schemas, float("inf"))
+    for executed_schema in schemas.values():
+        result = await executed_schema.execute(query, context_value=Context())
+        assert result.errors is None and result.data is not None
+        assert len(result.data["imagesConnection"]["edges"]) == 1000
+    # Many short interleaved rounds, keeping the best of each side: noise only ever adds time, so the best round
+    # of each is the one closest to its actual cost
+    for _ in range(15):
+        for name, executed_schema in schemas.items():
+            start = time.process_time()
+            for _ in range(2):
+                await executed_schema.execute(query, context_value=Context())
+            timings[name] = min(timings[name], (time.process_time() - start) / 2 / 1000)
+
+    # Five fields per row (`node` and four plain attributes), none of them timed: only the cost of the hook itself
+    assert timings["with metrics"] < timings["without metrics"] * 1.25
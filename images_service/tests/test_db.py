@@ -0,0 +1,181 @@
+from collections.abc import AsyncGenerator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import SQLModel
+
+from images_app import db
+from images_app.app import create_app
+from images_app.models import Image
+from images_app.services import create_image_service, update_image_service
+from images_app.settings import settings
+
+
+async def test_requests_share_pooled_engine(fastapi_client: TestClient, seed_images: list[Image]) -> None:
+    engine = db._engine
+    connects = db.pool_stats.connects
+    query = "query { getAllImages { id } }"
+    for _ in range(5):
+        response = fastapi_client.post("/graphql", json={"query": query})
+        assert "errors" not in response.json()
+
+    assert db._engine is engine
+    assert db.pool_stats.connects - connects <= 1
+
+
+async def test_pool_stats_endpoint(fastapi_client: TestClient) -> None:
+    fastapi_client.post("/graphql", json={"query": "query { getAllImages { id } }"})
+    response = fastapi_client.get("/stats")
+
+    assert response.status_code == 200
+    pool = response.json()["pool"]
+    assert pool["checkouts"] >= 1
+    assert pool["checked_out"] == 0
+    assert {"size", "checked_in", "overflow", "wait_seconds_total", "wait_seconds_max", "timeouts"} <= pool.keys()
+
+
+async def test_metrics_endpoint(fastapi_client: TestClient, seed_images: list[Image]) -> None:
+    fastapi_client.post("/graphql", json={"query": "query Everything { getAllImages { url } }"})
+    metrics = fastapi_client.get("/metrics").text.splitlines()
+
+    assert 'graphql_operation_duration_seconds_count{operation_type="query",operation_name="Everything"} 1.0' in metrics
+    assert any(line.startswith('graphql_field_result_size_count{field="Query.getAllImages"}') for line in metrics)
+    assert "db_pool_checked_out 0" in metrics
+    assert "# TYPE db_pool_checkouts_total counter" in metrics
+
+
+async def test_engine_disposed_on_shutdown() -> None:
+    with TestClient(create_app()):
+        assert db._engine is not None
+    assert db._engine is None
+
+
+async def test_operation_checks_out_one_connection(fastapi_client: TestClient, seed_images: list[Image]) -> None:
+    query = """
+        query {
+            all: getAllImages { url }
+            first: getImage(imageId: 1) { url }
+            second: getImage(imageId: 2) { url }
+            _entities(representations: [{__typename: "ProductType", id: 1}, {__typename: "ProductType", id: 2}]) {
+                ... on ProductType { images { url } }
+            }
+        }
+    """
+    checkouts = db.pool_stats.checkouts
+    response = fastapi_client.post("/graphql", json={"query": query})
+
+    assert "errors" not in response.json()
+    assert db.pool_stats.checkouts - checkouts == 1
+    assert fastapi_client.get("/stats").json()["pool"]["checked_out"] == 0
+
+
+async def test_mutations_of_an_operation_share_one_transaction(
+    fastapi_client: TestClient, seed_images: list[Image]
+) -> None:
+    mutation = """
+        mutation {
+            created: createImage(inp: {url: "http://example.com/new.jpg", productId: 1}) { id }
+            deleted: deleteImage(imageId: 2)
+            duplicate: createImage(inp: {url: "http://example.com/image1.jpg", productId: 1}) { id }
+        }
+    """
+    response = fastapi_client.post("/graphql", json={"query": mutation}).json()
+
+    assert response["data"] is None
+    assert len(response["errors"]) == 1
+    images = fastapi_client.post("/graphql", json={"query": "query { getAllImages { url } }"}).json()
+    assert sorted(image["url"] for image in images["data"]["getAllImages"]) == [
+        "http://example.com/image1.jpg",
+        "http://example.com/image2.jpg",
+        "http://example.com/image3.jpg",
+    ]
+
+
+async def test_updates_of_an_operation_return_their_own_writes() -> None:
+    unit_of_work = db.UnitOfWork()
+    token = db.current_unit_of_work.set(unit_of_work)
+    try:
+        async with db.get_session() as session:
+            created = await create_image_service(session, "http://example.com/new.jpg", 100, 1)
+            updates = {"url": created.url, "priority": 10, "product_id": 1}
+            first = await update_image_service(session, created.id, updates)
+            second = await update_image_service(session, created.id, {**updates, "priority": 20})
+        assert first is second is created
+        assert created.priority == 20
+    finally:
+        await unit_of_work.rollback()
+        await unit_of_work.close()
+        db.current_unit_of_work.reset(token)
+
+
+@pytest.fixture
+async def replica(engine: AsyncEngine, monkeypatch: pytest.MonkeyPatch) -> AsyncGenerator[str, None]:
+    name = f"{settings.POSTGRES_DB}_replica"
+    async with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        await conn.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
+        await conn.execute(text(f'CREATE DATABASE "{name}"'))
+    replica_uri = make_url(settings.DATABASE_URI).set(database=name).render_as_string(hide_password=False)
+    replica = db.get_db_engine(replica_uri)
+    async with replica.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.execute(text("INSERT INTO image (url, priority, product_id) VALUES ('http://replica/1.jpg', 1, 1)"))
+    await replica.dispose()
+    monkeypatch.setattr(settings, "DATABASE_REPLICA_URIS", [replica_uri])
+    yield replica_uri
+    async with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        await conn.execute(text(f'DROP DATABASE "{name}" WITH (FORCE)'))
+
+
+def image_urls(client: TestClient) -> list[str]:
+    response = client.post("/graphql", json={"query": "query { getAllImages { url } }"}).json()
+    return sorted(image["url"] for image in response["data"]["getAllImages"])
+
+
+async def test_queries_read_from_replica(replica: str, fastapi_client: TestClient, seed_images: list[Image]) -> None:
+    assert image_urls(fastapi_client) == ["http://replica/1.jpg"]
+    image = fastapi_client.post("/graphql", json={"query": "query { getImage(imageId: 1) { url } }"}).json()
+    assert image["data"]["getImage"] == {"url": "http://replica/1.jpg"}
+
+
+async def test_mutations_write_to_primary(
+    replica: str, fastapi_client: TestClient, seed_images: list[Image], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    mutation = 'mutation { createImage(inp: {url: "http://example.com/new.jpg", productId: 1}) { id } }'
+    response = fastapi_client.post("/graphql", json={"query": mutation}).json()
+
+    assert response["data"] == {"createImage": {"id": 4}}
+    # Without a read-your-writes window queries see the replica, which never got the write
+    assert image_urls(fastapi_client) == ["http://replica/1.jpg"]
+
+
+async def test_reads_after_write_go_to_primary_for_the_writing_client(
+    replica: str, fastapi_client: TestClient, seed_images: list[Image], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "READ_YOUR_WRITES_SECONDS", 60.0)
+    mutation = 'mutation { createImage(inp: {url: "http://example.com/new.jpg", productId: 1}) { id } }'
+    fastapi_client.post("/graphql", json={"query": mutation})
+
+    assert "http://example.com/new.jpg" in image_urls(fastapi_client)
+    # Another client, without the cookie of the write, still reads from the replica
+    fastapi_client.cookies.clear()
+    assert image_urls(fastapi_client) == ["http://replica/1.jpg"]
+
+
+async def test_product_images_run_one_statement(
+    fastapi_client: TestClient, seed_images: list[Image], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "SQL_STATS_IN_RESPONSE", True)
+    query = """
+        query($representations: [_Any!]!) {
+            _entities(representations: $representations) { ... on ProductType { images { url } } }
+        }
+    """
+    representations = [{"__typename": "ProductType", "id": product_id} for product_id in range(1, 51)]
+    response = fastapi_client.post("/graphql", json={"query": query, "variables": {"representations": representations}})
+
+    assert "errors" not in response.json()
+    # One batched statement for every product's images, however many products are referenced
+    assert response.json()["extensions"]["sql"]["statements"] == 1
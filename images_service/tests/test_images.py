@@ -1,6 +1,28 @@
+import asyncio
+import hashlib
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+
+import asyncpg  # type: ignore[import-untyped]
+import httpx
+import pytest
+import sqlalchemy as sa
 from fastapi.testclient import TestClient
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
 
+from images_app import services
+from images_app.app import create_app
+from images_app.batching import WriteBatcher, write_batcher
+from images_app.context import Context
 from images_app.models import Image
+from images_app.pagination import encode_cursor
+from images_app.persisted_queries import documents, persisted_queries
+from images_app.repository import IMAGES_CHANNEL
+from images_app.schema import schema
+from images_app.services import export_slots
+from images_app.settings import settings
 
 
 async def test_create_image(fastapi_client: TestClient) -> None:
@@ -24,6 +46,174 @@ async def test_create_image(fastapi_client: TestClient) -> None:
     assert data["data"]["createImage"]["productId"] == 4
 
 
+CREATE_IMAGES_MUTATION = """
+    mutation CreateImages($inputs: [ImageInput!]!) {
+        createImages(inputs: $inputs) {
+            image {
+                url
+                productId
+            }
+            error
+        }
+    }
+"""
+
+
+async def test_create_images(fastapi_client: TestClient, seed_images: list[Image]) -> None:
+    inputs = [
+        {"url": "http://example.com/new.jpg", "priority": 10, "productId": 1},
+        {"url": "http://example.com/image1.jpg", "priority": 10, "productId": 1},
+        {"url": "http://example.com/image1.jpg", "priority": 10, "productId": 2},
+        {"url": "http://example.com/bad.jpg", "priority": 101, "productId": 1},
+        {"url": "http://example.com/new.jpg", "priority": 20, "productId": 1},
+    ]
+    response = fastapi_client.post("/graphql", json={"query": CREATE_IMAGES_MUTATION, "variables": {"inputs": inputs}})
+
+    assert response.json()["data"]["createImages"] == [
+        {"image": {"url": "http://example.com/new.jpg", "productId": 1}, "error": None},
+        {"image": None, "error": "Image 'http://example.com/image1.jpg' of product 1 already exists"},
+        {"image": {"url": "http://example.com/image1.jpg", "productId": 2}, "error": None},
+        {"image": None, "error": "Priority must be between 0 and 100"},
+        {"image": None, "error": "Duplicate url 'http://example.com/new.jpg' for product 1 in the same batch"},
+    ]
+
+
+async def test_create_images_streams_large_batches(fastapi_client: TestClient, seed_images: list[Image]) -> None:
+    inputs = [{"url": f"http://example.com/{i}.jpg", "productId": i} for i in range(settings.BULK_COPY_THRESHOLD)]
+    inputs.append({"url": "http://example.com/image2.jpg", "productId": 2})
+    response = fastapi_client.post("/graphql", json={"query": CREATE_IMAGES_MUTATION, "variables": {"inputs": inputs}})
+
+    results = response.json()["data"]["createImages"]
+    assert [result["image"]["productId"] for result in results[:-1]] == list(range(len(inputs) - 1))
+    assert results[-1] == {"image": None, "error": "Image 'http://example.com/image2.jpg' of product 2 already exists"}
+
+
+UPSERT_IMAGES_MUTATION = """
+    mutation UpsertImages($inputs: [ImageInput!]!) {
+        upsertImages(inputs: $inputs) {
+            image {
+                id
+                priority
+            }
+            created
+            error
+        }
+    }
+"""
+
+
+@pytest.mark.parametrize("copy_threshold", [1_000, 2])
+async def test_upsert_images(
+    fastapi_client: TestClient, seed_images: list[Image], monkeypatch: pytest.MonkeyPatch, copy_threshold: int
+) -> None:
+    monkeypatch.setattr(settings, "BULK_COPY_THRESHOLD", copy_threshold)
+    inputs = [
+        {"url": "http://example.com/image1.jpg", "priority": 10, "productId": 1},
+        {"url": "http://example.com/new.jpg", "priority": 30, "productId": 1},
+        {"url": "http://example.com/new.jpg", "priority": 40, "productId": 1},
+        {"url": "http://example.com/invalid.jpg", "priority": 101, "productId": 1},
+    ]
+    variables = {"inputs": inputs}
+    response = fastapi_client.post("/graphql", json={"query": UPSERT_IMAGES_MUTATION, "variables": variables}).json()
+
+    results = response["data"]["upsertImages"]
+    assert results[0] == {"image": {"id": seed_images[0].id, "priority": 10}, "created": False, "error": None}
+    # Listed twice, upserted once with the last priority
+    assert results[1] == results[2]
+    assert results[1]["image"]["priority"] == 40 and results[1]["created"]
+    assert results[3] == {"image": None, "created": False, "error": "Priority must be between 0 and 100"}
+
+    # A retry updates the same images in place
+    retried = fastapi_client.post("/graphql", json={"query": UPSERT_IMAGES_MUTATION, "variables": variables}).json()
+    assert [result["image"] for result in retried["data"]["upsertImages"]] == [result["image"] for result in results]
+    assert not any(result["created"] for result in retried["data"]["upsertImages"])
+
+
+async def test_upsert_image_is_idempotent(fastapi_client: TestClient, seed_images: list[Image]) -> None:
+    mutation = """
+        mutation UpsertImage($input: ImageInput!) {
+            upsertImage(inp: $input) { image { id url priority productId } created error }
+        }
+    """
+    variables = {"input": {"url": "http://example.com/image2.jpg", "priority": 75, "productId": 2}}
+    first = fastapi_client.post("/graphql", json={"query": mutation, "variables": variables}).json()
+    second = fastapi_client.post("/graphql", json={"query": mutation, "variables": variables}).json()
+
+    expected = {"id": seed_images[1].id, "url": "http://example.com/image2.jpg", "priority": 75, "productId": 2}
+    assert first["data"]["upsertImage"] == {"image": expected, "created": False, "error": None}
+    assert second["data"]["upsertImage"] == first["data"]["upsertImage"]
+
+
+async def test_upsert_leaves_unchanged_images_untouched(
+    fastapi_client: TestClient, seed_images: list[Image], engine: AsyncEngine
+) -> None:
+    mutation = """
+        mutation UpsertImages($inputs: [ImageInput!]!) {
+            upsertImages(inputs: $inputs) { image { id priority } created }
+        }
+    """
+    inputs = [
+        {"url": "http://example.com/image1.jpg", "priority": 10, "productId": 1},
+        {"url": "http://example.com/image2.jpg", "priority": 20, "productId": 2},
+    ]
+    row_version = sa.text("SELECT id, xmin::text FROM image ORDER BY id")
+    async with engine.connect() as connection:
+        before = (await connection.execute(row_version)).all()
+    response = fastapi_client.post("/graphql", json={"query": mutation, "variables": {"inputs": inputs}}).json()
+    async with engine.connect() as connection:
+        after = (await connection.execute(row_version)).all()
+
+    assert response["data"]["upsertImages"] == [
+        {"image": {"id": seed_images[0].id, "priority": 10}, "created": False},
+        {"image": {"id": seed_images[1].id, "priority": 20}, "created": False},
+    ]
+    # Only the image whose priority changed got a new row version
+    assert after[0] != before[0]
+    assert after[1:] == before[1:]
+
+
+async def test_concurrent_creates_are_group_committed(
+    seed_images: list[Image], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "WRITE_BATCHING", True)
+    monkeypatch.setattr(write_batcher, "linger", 0.2)
+    monkeypatch.setattr(write_batcher, "max_size", 8)
+    mutation = "mutation($input: ImageInput!) { createImage(inp: $input) { id url productId } }"
+    inputs = [{"url": f"http://example.com/burst{i}.jpg", "productId": 7} for i in range(18)]
+    inputs.append({"url": "http://example.com/image1.jpg", "productId": 1})
+    inputs.append({"url": "http://example.com/invalid.jpg", "priority": 101, "productId": 7})
+    batches = write_batcher.batches
+
+    results = await asyncio.gather(
+        *(schema.execute(mutation, {"input": inp}, context_value=Context()) for inp in inputs)
+    )
+
+    # Two full batches, then the rest once the linger time is over
+    assert write_batcher.batches - batches == 3
+    for inp, result in zip(inputs[:18], results[:18], strict=True):
+        assert result.errors is None and result.data is not None
+        assert result.data["createImage"]["url"] == inp["url"]
+    assert len({result.data["createImage"]["id"] for result in results[:18] if result.data}) == 18
+    assert [str(result.errors[0].original_error) for result in results[18:] if result.errors] == [
+        "Image 'http://example.com/image1.jpg' of product 1 already exists",
+        "Priority must be between 0 and 100",
+    ]
+
+
+async def test_closing_write_batcher_flushes_pending_creates(seed_images: list[Image]) -> None:
+    batcher = WriteBatcher(linger=60, max_size=100)
+    created = asyncio.create_task(
+        batcher.create_image({"url": "http://example.com/new.jpg", "priority": 1, "product_id": 1})
+    )
+    await asyncio.sleep(0)
+
+    await batcher.close()
+
+    assert created.done()
+    assert (await created).url == "http://example.com/new.jpg"
+    assert batcher.batches == 1
+
+
 async def test_get_all_images(fastapi_client: TestClient, seed_images: list[Image]) -> None:
     query = """
         query {
@@ -45,6 +235,103 @@ async def test_get_all_images(fastapi_client: TestClient, seed_images: list[Imag
         assert image["url"] == expected.url
         assert image["priority"] == expected.priority
         assert image["productId"] == expected.product_id
+    assert "getAllImages: [ImageType!]! @deprecated" in schema.as_str()
+
+
+async def test_images_connection(fastapi_client: TestClient, seed_images: list[Image]) -> None:
+    query = """
+        query($after: String) {
+            imagesConnection(first: 2, after: $after) {
+                edges {
+                    node {
+                        url
+                        priority
+                        productId
+                    }
+                }
+                pageInfo {
+                    hasNextPage
+                    endCursor
+                }
+            }
+        }
+    """
+    first_page = fastapi_client.post("/graphql", json={"query": query}).json()
+    assert "errors" not in first_page
+    page_info = first_page["data"]["imagesConnection"]["pageInfo"]
+    assert page_info["hasNextPage"]
+    second_page = fastapi_client.post(
+        "/graphql", json={"query": query, "variables": {"after": page_info["endCursor"]}}
+    ).json()
+
+    assert "errors" not in second_page
+    assert not second_page["data"]["imagesConnection"]["pageInfo"]["hasNextPage"]
+    images = [edge["node"] for page in (first_page, second_page) for edge in page["data"]["imagesConnection"]["edges"]]
+    assert len(images) == len(seed_images)
+    for image, expected in zip(images, seed_images, strict=True):
+        assert image["url"] == expected.url
+        assert image["priority"] == expected.priority
+        assert image["productId"] == expected.product_id
+
+
+async def test_images_connection_rejects_invalid_page(fastapi_client: TestClient) -> None:
+    invalid_cursor = "Invalid cursor"
+    for arguments, message in (
+        ("first: 0", "`first` must be between 1 and 1000"),
+        ("first: 1001", "`first` must be between 1 and 1000"),
+        ('after: "not a cursor"', invalid_cursor),
+        (f'after: "{encode_cursor("x")}"', invalid_cursor),
+    ):
+        query = f"query {{ imagesConnection({arguments}) {{ edges {{ cursor }} }} }}"
+        response = fastapi_client.post("/graphql", json={"query": query}).json()
+        assert response["data"] is None
+        assert [error["message"] for error in response["errors"]] == [message], arguments
+
+
+async def test_export_images_streams_ndjson(fastapi_client: TestClient, seed_images: list[Image]) -> None:
+    with fastapi_client.stream("GET", "/images/export") as response:
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = list(response.iter_lines())
+
+    assert sorted(json.loads(line)["url"] for line in lines) == sorted(image.url for image in seed_images)
+    assert set(json.loads(lines[0])) == {"id", "url", "priority", "product_id"}
+    assert not export_slots.locked()
+
+
+async def test_export_images_refused_when_every_slot_is_taken(fastapi_client: TestClient) -> None:
+    for _ in range(settings.EXPORT_CONCURRENCY_LIMIT):
+        await export_slots.acquire()
+    try:
+        response = fastapi_client.get("/images/export")
+    finally:
+        for _ in range(settings.EXPORT_CONCURRENCY_LIMIT):
+            export_slots.release()
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "10"
+
+
+async def test_export_images_refuses_concurrent_requests_over_the_limit(monkeypatch: pytest.MonkeyPatch) -> None:
+    finish = asyncio.Event()
+
+    async def stream_images(_session: Any, _fields: Any) -> AsyncIterator[dict[str, Any]]:
+        await finish.wait()
+        yield {"id": 1}
+
+    monkeypatch.setattr(services, "stream_images", stream_images)
+    transport = httpx.ASGITransport(app=create_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        exports = [
+            asyncio.create_task(client.get("/images/export")) for _ in range(settings.EXPORT_CONCURRENCY_LIMIT + 1)
+        ]
+        # The request over the limit is answered while the others still stream
+        refused, _ = await asyncio.wait(exports, timeout=5, return_when=asyncio.FIRST_COMPLETED)
+        finish.set()
+        responses = await asyncio.gather(*exports)
+
+    assert [export.result().status_code for export in refused] == [503]
+    assert sorted(response.status_code for response in responses) == [200] * settings.EXPORT_CONCURRENCY_LIMIT + [503]
+    assert not export_slots.locked()
 
 
 async def test_delete_image(fastapi_client: TestClient, seed_images: list[Image]) -> None:
@@ -82,3 +369,188 @@ async def test_get_image_by_id(fastapi_client: TestClient, seed_images: list[Ima
     assert data["data"]["getImage"]["url"] == expected_image.url
     assert data["data"]["getImage"]["priority"] == expected_image.priority
     assert data["data"]["getImage"]["productId"] == expected_image.product_id
+
+
+async def test_product_images_entities(fastapi_client: TestClient, seed_images: list[Image]) -> None:
+    query = """
+        query Entities($representations: [_Any!]!) {
+            _entities(representations: $representations) {
+                ... on ProductType {
+                    id
+                    images {
+                        url
+                        productId
+                    }
+                }
+            }
+        }
+    """
+    representations = [{"__typename": "ProductType", "id": product_id} for product_id in (3, 1, 42)]
+    response = fastapi_client.post("/graphql", json={"query": query, "variables": {"representations": representations}})
+    data = response.json()
+
+    # Assertions
+    assert "errors" not in data
+    products = data["data"]["_entities"]
+    assert [product["id"] for product in products] == [3, 1, 42]
+    assert products[0]["images"] == [{"url": seed_images[2].url, "productId": 3}]
+    assert products[1]["images"] == [{"url": seed_images[0].url, "productId": 1}]
+    assert products[2]["images"] == []
+
+
+async def test_product_best_images(fastapi_client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "SQL_STATS_IN_RESPONSE", True)
+    inputs = ", ".join(
+        f'{{url: "http://example.com/{product_id}-{priority}.jpg", priority: {priority}, productId: {product_id}}}'
+        for product_id in (1, 2)
+        for priority in (10, 90, 50, 20, 70)
+    )
+    created = fastapi_client.post(
+        "/graphql", json={"query": f"mutation {{ createImages(inputs: [{inputs}]) {{ error }} }}"}
+    )
+    assert "errors" not in created.json()
+    query = """
+        query Entities($representations: [_Any!]!) {
+            _entities(representations: $representations) {
+                ... on ProductType {
+                    best: images(first: 2) { priority }
+                    aboveThreshold: images(first: 10, minPriority: 30) { priority }
+                    all: images { priority }
+                }
+            }
+        }
+    """
+    representations = [{"__typename": "ProductType", "id": product_id} for product_id in (2, 1, 42)]
+    response = fastapi_client.post("/graphql", json={"query": query, "variables": {"representations": representations}})
+    data = response.json()
+
+    assert "errors" not in data
+    products = data["data"]["_entities"]
+    for product in products[:2]:
+        assert product["best"] == [{"priority": 90}, {"priority": 70}]
+        assert product["aboveThreshold"] == [{"priority": 90}, {"priority": 70}, {"priority": 50}]
+        assert [image["priority"] for image in product["all"]] == [90, 70, 50, 20, 10]
+    assert products[2] == {"best": [], "aboveThreshold": [], "all": []}
+    # One batched statement per distinct arguments, whatever the number of products
+    assert data["extensions"]["sql"]["statements"] == 3
+
+
+async def test_writes_notify_image_ids(fastapi_client: TestClient, seed_images: list[Image]) -> None:
+    payloads: list[str] = []
+    dsn = make_url(settings.DATABASE_URI).set(drivername="postgresql").render_as_string(hide_password=False)
+    connection = await asyncpg.connect(dsn)
+    await connection.add_listener(IMAGES_CHANNEL, lambda *args: payloads.append(args[-1]))
+    try:
+        create = 'mutation { createImage(inp: {url: "http://example.com/new.jpg", priority: 1, productId: 9}) { id } }'
+        created = fastapi_client.post("/graphql", json={"query": create}).json()["data"]["createImage"]["id"]
+        update = """
+            mutation {
+                updateImage(imageId: 1, updates: {url: "http://example.com/1.jpg", priority: 5, productId: 1}) { id }
+            }
+        """
+        fastapi_client.post("/graphql", json={"query": update})
+        fastapi_client.post("/graphql", json={"query": "mutation { deleteImage(imageId: 2) }"})
+
+        async with asyncio.timeout(5):
+            while len(payloads) < 3:
+                await asyncio.sleep(0.01)
+    finally:
+        await connection.close()
+
+    assert payloads == [str(created), "1", "2"]
+
+
+async def test_persisted_query_registered_then_sent_by_hash(
+    fastapi_client: TestClient, seed_images: list[Image]
+) -> None:
+    persisted_queries.clear()
+    query = "query { getImage(imageId: 1) { url } }"
+    sha256_hash = hashlib.sha256(query.encode()).hexdigest()
+    extensions = {"persistedQuery": {"version": 1, "sha256Hash": sha256_hash}}
+
+    missing = fastapi_client.post("/graphql", json={"extensions": extensions}).json()
+    registered = fastapi_client.post("/graphql", json={"query": query, "extensions": extensions}).json()
+    by_hash = fastapi_client.post("/graphql", json={"extensions": extensions}).json()
+
+    assert missing["errors"][0]["extensions"] == {"code": "PERSISTED_QUERY_NOT_FOUND"}
+    assert registered["data"] == by_hash["data"] == {"getImage": {"url": "http://example.com/image1.jpg"}}
+    assert documents.get(sha256_hash) is not None
+
+
+async def test_unbounded_nested_lists_exceed_cost_budget(
+    fastapi_client: TestClient, seed_images: list[Image], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "COST_MAX_PER_OPERATION", 2_000)
+    query = """
+        query($representations: [_Any!]!) {
+            _entities(representations: $representations) { ... on ProductType { images { url } } }
+        }
+    """
+    representations = [{"__typename": "ProductType", "id": product_id} for product_id in range(1, 201)]
+
+    assert "errors" not in fastapi_client.post("/graphql", json={"query": "query { getAllImages { url } }"}).json()
+    response = fastapi_client.post("/graphql", json={"query": query, "variables": {"representations": representations}})
+
+    assert response.json()["data"] is None
+    assert response.json()["errors"][0]["extensions"] == {"code": "OPERATION_TOO_EXPENSIVE", "cost": 200 * (1 + 10)}
+
+
+FEED_QUERY = """
+    query Feed($cursor: String) {
+        imagesChangedSince(cursor: $cursor, first: 2) {
+            changes { id deleted image { priority } }
+            cursor
+            hasMore
+        }
+    }
+"""
+
+
+def changes_since(client: TestClient, cursor: str | None) -> dict[str, Any]:
+    response = client.post("/graphql", json={"query": FEED_QUERY, "variables": {"cursor": cursor}})
+    feed: dict[str, Any] = response.json()["data"]["imagesChangedSince"]
+    return feed
+
+
+async def test_images_changed_since(fastapi_client: TestClient, seed_images: list[Image]) -> None:
+    first = changes_since(fastapi_client, None)
+    assert [change["id"] for change in first["changes"]] == [seed_images[0].id, seed_images[1].id]
+    assert first["hasMore"]
+    cursor = changes_since(fastapi_client, first["cursor"])["cursor"]
+
+    mutation = """
+        mutation {
+            updated: updateImage(
+                imageId: 1, updates: {url: "http://example.com/image1.jpg", priority: 5, productId: 1}
+            ) { id }
+            unchanged: upsertImage(inp: {url: "http://example.com/image2.jpg", priority: 20, productId: 2}) { created }
+            deleted: deleteImage(imageId: 3)
+        }
+    """
+    assert "errors" not in fastapi_client.post("/graphql", json={"query": mutation}).json()
+
+    feed = changes_since(fastapi_client, cursor)
+    assert feed["changes"] == [
+        {"id": 1, "deleted": False, "image": {"priority": 5}},
+        {"id": 3, "deleted": True, "image": None},
+    ]
+    assert changes_since(fastapi_client, feed["cursor"]) == {"changes": [], "cursor": feed["cursor"], "hasMore": False}
+
+
+async def test_images_changed_since_waits_for_older_transactions(
+    fastapi_client: TestClient, seed_images: list[Image], engine: AsyncEngine
+) -> None:
+    cursor = changes_since(fastapi_client, None)["cursor"]
+    cursor = changes_since(fastapi_client, cursor)["cursor"]
+    async with engine.connect() as connection:
+        slow = await connection.begin()
+        await connection.execute(sa.text("UPDATE image SET priority = 1 WHERE id = 1"))
+        fastapi_client.post("/graphql", json={"query": "mutation { deleteImage(imageId: 2) }"})
+        held = changes_since(fastapi_client, cursor)
+        await slow.commit()
+
+    assert held == {"changes": [], "cursor": cursor, "hasMore": False}
+    assert changes_since(fastapi_client, held["cursor"])["changes"] == [
+        {"id": 1, "deleted": False, "image": {"priority": 1}},
+        {"id": 2, "deleted": True, "image": None},
+    ]
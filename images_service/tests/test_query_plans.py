@@ -0,0 +1,137 @@
+import json
+import os
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from images_app import db, repository
+
+# Estimated total cost of every statement a repository function runs, recorded against the seeded volume below.
+# Regenerate with `UPDATE_QUERY_PLAN_BASELINE=1 pytest tests/test_query_plans.py` after an intended plan change.
+BASELINE_PATH = Path(__file__).with_name("query_plan_baseline.json")
+# Estimates shift slightly with the statistics sampled by ANALYZE
+COST_TOLERANCE = 1.25
+SEEDED_IMAGES = 100_000
+# Exports every image by design, so there is no index to use
+SEQ_SCANS_ALLOWED = {"stream_images"}
+
+Query = Callable[[AsyncSession], Awaitable[object]]
+
+
+async def drain(rows: AsyncIterator[object]) -> None:
+    async for _ in rows:
+        pass
+
+
+QUERIES: dict[str, Query] = {
+    "get_image_by_id": lambda session: repository.get_image_by_id(session, 4242, {"url", "priority"}),
+    "get_images_by_product_ids": lambda session: repository.get_images_by_product_ids(
+        session, list(range(1000, 1100)), {"url"}
+    ),
+    "get_images_by_product_ids_best": lambda session: repository.get_images_by_product_ids(
+        session, list(range(1000, 1100)), {"url"}, 3, 50
+    ),
+    "get_all_images": lambda session: repository.get_all_images(session, 101, None, {"url"}),
+    "get_all_images_after": lambda session: repository.get_all_images(session, 101, 50_000, {"url"}),
+    "stream_images": lambda session: drain(repository.stream_images(session, {"url"})),
+    "get_changes_since": lambda session: repository.get_changes_since(session, None, 101),
+    "get_changes_since_after": lambda session: repository.get_changes_since(session, (1, 1234), 101),
+    "create_image": lambda session: repository.create_image(
+        session, {"url": "http://example.com/planned.jpg", "priority": 1, "product_id": 1}
+    ),
+    "create_images": lambda session: repository.create_images(
+        session, [{"url": f"http://example.com/planned{i}.jpg", "priority": 1, "product_id": 1} for i in range(10)]
+    ),
+    "upsert_images": lambda session: repository.upsert_images(
+        session, [{"url": f"http://example.com/{i}.jpg", "priority": 1, "product_id": i // 5} for i in range(10)]
+    ),
+    "update_image": lambda session: repository.update_image(session, 4242, {"priority": 2}),
+    "delete_image": lambda session: repository.delete_image(session, 4242),
+    "notify_changed": lambda session: repository.notify_changed(session, [4242]),
+}
+
+
+@pytest.fixture
+async def seeded_images(engine: AsyncEngine) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                "INSERT INTO image (url, priority, product_id) "
+                "SELECT 'http://example.com/' || n || '.jpg', n * 7919 % 100, n / 5 "
+                "FROM generate_series(1, :rows) AS n"
+            ),
+            {"rows": SEEDED_IMAGES},
+        )
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("ANALYZE image"))
+
+
+def plan_nodes(plan: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+async def explain(query: Query) -> list[dict[str, Any]]:
+    """Run `query` in a transaction that is rolled back, then return the JSON plan of every statement it ran."""
+    unit_of_work = db.UnitOfWork()
+    token = db.current_unit_of_work.set(unit_of_work)
+    statements: list[tuple[str, Any]] = []
+
+    def capture(_conn: Any, _cursor: Any, statement: str, parameters: Any, *_: Any) -> None:
+        statements.append((statement, parameters))
+
+    db.init_db()
+    assert db._engine is not None
+    event.listen(db._engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        async with unit_of_work.session() as session:
+            await query(session)
+        event.remove(db._engine.sync_engine, "before_cursor_execute", capture)
+        async with unit_of_work.session() as session:
+            raw = await (await session.connection()).get_raw_connection()
+            plans = []
+            for statement, parameters in statements:
+                explained = await raw.driver_connection.fetchval(  # type: ignore[union-attr]
+                    f"EXPLAIN (FORMAT JSON) {statement}", *parameters
+                )
+                # The dialect registers a codec decoding `json` values
+                plans.append(explained[0]["Plan"])
+            return plans
+    finally:
+        if event.contains(db._engine.sync_engine, "before_cursor_execute", capture):
+            event.remove(db._engine.sync_engine, "before_cursor_execute", capture)
+        await unit_of_work.rollback()
+        await unit_of_work.close()
+        db.current_unit_of_work.reset(token)
+
+
+async def test_repository_query_plans(seeded_images: None) -> None:
+    plans = {name: await explain(query) for name, query in QUERIES.items()}
+    costs = {name: [plan["Total Cost"] for plan in statement_plans] for name, statement_plans in plans.items()}
+
+    seq_scans = [
+        f"{name}: Seq Scan on {node['Relation Name']}"
+        for name, statement_plans in plans.items()
+        for plan in statement_plans
+        for node in plan_nodes(plan)
+        if node["Node Type"] == "Seq Scan" and name not in SEQ_SCANS_ALLOWED
+    ]
+    assert not seq_scans
+
+    if os.environ.get("UPDATE_QUERY_PLAN_BASELINE"):
+        BASELINE_PATH.write_text(json.dumps(costs, indent=2, sort_keys=True) + "\n")
+    baseline = json.loads(BASELINE_PATH.read_text())
+    assert {name: len(costs[name]) for name in costs} == {name: len(baseline[name]) for name in baseline}
+    regressions = [
+        f"{name}: estimated cost {cost} over the baseline {recorded}"
+        for name in costs
+        for cost, recorded in zip(costs[name], baseline[name], strict=True)
+        if cost > recorded * COST_TOLERANCE
+    ]
+    assert not regressions
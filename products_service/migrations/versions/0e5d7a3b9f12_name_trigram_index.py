@@ -0,0 +1,35 @@
+"""name trigram index
+
+Revision ID: 0e5d7a3b9f12
+Revises: c4a8f2e17d90
+Create Date: 2026-10-18 12:31:45.902217
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0e5d7a3b9f12"
+down_revision: str | None = "c4a8f2e17d90"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "idx_name_trgm",
+        "product",
+        ["name"],
+        unique=False,
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "idx_name_trgm", table_name="product", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}
+    )
@@ -0,0 +1,61 @@
+"""change feed transaction ids
+
+Revision ID: 3c7e0b9d5f21
+Revises: 9d3f6a1c8e52
+Create Date: 2026-10-18 21:07:12.408253
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3c7e0b9d5f21"
+down_revision: str | None = "9d3f6a1c8e52"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+CURRENT_XACT_ID = "pg_current_xact_id()::text::bigint"
+
+
+def functions(xact_id: str, tombstone_xact_id: str) -> tuple[str, str]:
+    return (
+        f"""
+        CREATE OR REPLACE FUNCTION product_touch() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.updated_at := clock_timestamp();{xact_id}
+            RETURN NEW;
+        END $$
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION product_tombstone() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO product_tombstone (id) SELECT id FROM deleted
+            ON CONFLICT (id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at{tombstone_xact_id};
+            RETURN NULL;
+        END $$
+        """,
+    )
+
+
+def upgrade() -> None:
+    # Rows written before the upgrade all belong to finished transactions, which a constant default (filling them
+    # without rewriting the table) orders first
+    for table in ("product", "product_tombstone"):
+        op.add_column(table, sa.Column("xact_id", sa.BigInteger(), server_default=sa.text("0"), nullable=False))
+        op.alter_column(table, "xact_id", server_default=sa.text(CURRENT_XACT_ID))
+    op.create_index("idx_xact_id_id", "product", ["xact_id", "id"], unique=False)
+    op.create_index("idx_tombstone_xact_id_id", "product_tombstone", ["xact_id", "id"], unique=False)
+    for function in functions(f"\n            NEW.xact_id := {CURRENT_XACT_ID};", ", xact_id = EXCLUDED.xact_id"):
+        op.execute(function)
+
+
+def downgrade() -> None:
+    for function in functions("", ""):
+        op.execute(function)
+    op.drop_index("idx_tombstone_xact_id_id", table_name="product_tombstone")
+    op.drop_index("idx_xact_id_id", table_name="product")
+    for table in ("product_tombstone", "product"):
+        op.drop_column(table, "xact_id")
@@ -0,0 +1,27 @@
+"""covering price index
+
+Revision ID: 7b3e91c4d2a6
+Revises: 25d2679494fb
+Create Date: 2026-10-18 11:20:41.518204
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7b3e91c4d2a6"
+down_revision: str | None = "25d2679494fb"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.drop_index("idx_status_price", table_name="product")
+    op.create_index("idx_status_price", "product", ["status", "price", "id"], unique=False, postgresql_include=["name"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_status_price", table_name="product")
+    op.create_index("idx_status_price", "product", ["status", "price"], unique=False)
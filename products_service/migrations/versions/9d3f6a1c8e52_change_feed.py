@@ -0,0 +1,76 @@
+"""change feed
+
+Revision ID: 9d3f6a1c8e52
+Revises: 0e5d7a3b9f12
+Create Date: 2026-10-18 16:22:41.730914
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9d3f6a1c8e52"
+down_revision: str | None = "0e5d7a3b9f12"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+TRIGGERS = (
+    """
+    CREATE OR REPLACE FUNCTION product_touch() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.updated_at := clock_timestamp();
+        RETURN NEW;
+    END $$
+    """,
+    """
+    CREATE TRIGGER product_touch BEFORE UPDATE ON product FOR EACH ROW
+    WHEN ((OLD.name, OLD.price, OLD.status) IS DISTINCT FROM (NEW.name, NEW.price, NEW.status))
+    EXECUTE FUNCTION product_touch()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION product_tombstone() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO product_tombstone (id) SELECT id FROM deleted
+        ON CONFLICT (id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+        RETURN NULL;
+    END $$
+    """,
+    """
+    CREATE TRIGGER product_tombstone AFTER DELETE ON product REFERENCING OLD TABLE AS deleted
+    FOR EACH STATEMENT EXECUTE FUNCTION product_tombstone()
+    """,
+)
+
+
+def upgrade() -> None:
+    # A stable default fills the existing rows without rewriting the table; new rows get the time of their insert
+    op.add_column(
+        "product",
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+    op.alter_column("product", "updated_at", server_default=sa.text("clock_timestamp()"))
+    op.create_index("idx_updated_at_id", "product", ["updated_at", "id"], unique=False)
+    op.create_table(
+        "product_tombstone",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column(
+            "deleted_at", sa.DateTime(timezone=True), server_default=sa.text("clock_timestamp()"), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("idx_deleted_at_id", "product_tombstone", ["deleted_at", "id"], unique=False)
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER product_tombstone ON product")
+    op.execute("DROP TRIGGER product_touch ON product")
+    op.execute("DROP FUNCTION product_touch, product_tombstone")
+    op.drop_index("idx_deleted_at_id", table_name="product_tombstone")
+    op.drop_table("product_tombstone")
+    op.drop_index("idx_updated_at_id", table_name="product")
+    op.drop_column("product", "updated_at")
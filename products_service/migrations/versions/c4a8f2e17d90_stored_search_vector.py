@@ -0,0 +1,41 @@
+"""stored search vector
+
+Revision ID: c4a8f2e17d90
+Revises: 7b3e91c4d2a6
+Create Date: 2026-10-18 11:52:07.340118
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "c4a8f2e17d90"
+down_revision: str | None = "7b3e91c4d2a6"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "product",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('english', name) || to_tsvector('simple', name)", persisted=True),
+            nullable=True,
+        ),
+    )
+    op.create_index("idx_search_vector", "product", ["search_vector"], unique=False, postgresql_using="gin")
+    op.drop_index("idx_name_fulltext", table_name="product", postgresql_using="gin")
+
+
+def downgrade() -> None:
+    op.create_index(
+        "idx_name_fulltext", "product", [sa.text("to_tsvector('english', name)")], unique=False, postgresql_using="gin"
+    )
+    op.drop_index("idx_search_vector", table_name="product", postgresql_using="gin")
+    op.drop_column("product", "search_vector")
@@ -1,11 +1,65 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+
 from fastapi import FastAPI
-from strawberry.fastapi import GraphQLRouter
+from fastapi.responses import PlainTextResponse
 
+from products_app.cache import dispose_cache, get_cache_stats, init_cache
+from products_app.context import get_context
+from products_app.cost import cost_limiter
+from products_app.db import dispose_db, get_pool_stats, get_statement_stats, init_db
+from products_app.metrics import render_gauges, render_metrics
+from products_app.notifications import PRODUCTS_CHANNEL, ChangeListener, listen_dsn
+from products_app.persisted_queries import PersistedQueryRouter
 from products_app.schema import schema
+from products_app.services import evict_changed_products
+from products_app.settings import settings
+
+# Cumulative stats, exported as Prometheus counters rather than gauges
+POOL_COUNTERS = frozenset({"checkouts", "connects", "timeouts", "wait_seconds_total"})
+CACHE_COUNTERS = frozenset({"hits", "misses", "evictions", "errors"})
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    """
+    Owns the process-wide database pool, cache and invalidation listener for the lifetime of the app
+    """
+    init_db()
+    init_cache()
+    listener = ChangeListener(
+        listen_dsn(), PRODUCTS_CHANNEL, evict_changed_products, settings.INVALIDATION_COALESCE_MS / 1000
+    )
+    if settings.INVALIDATION_LISTEN:
+        listener.start()
+    yield
+    await listener.stop()
+    await dispose_cache()
+    await dispose_db()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="Product Service")
-    graphql_app = GraphQLRouter(schema)
+    app = FastAPI(title="Product Service", lifespan=lifespan)
+    graphql_app = PersistedQueryRouter(schema, context_getter=get_context)
     app.include_router(graphql_app, prefix="/graphql")
+
+    @app.get("/stats")
+    async def stats() -> dict[str, dict[str, int | float]]:
+        admission: dict[str, int | float] = {"in_flight": cost_limiter.in_flight, "shed": cost_limiter.shed}
+        return {"pool": get_pool_stats(), "cache": {**get_cache_stats()}, "admission": admission}
+
+    @app.get("/stats/statements")
+    async def statement_stats() -> list[dict[str, Any]]:
+        return get_statement_stats()
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics() -> str:
+        admission = {"in_flight": cost_limiter.in_flight, "shed": cost_limiter.shed}
+        return render_metrics(
+            render_gauges("db_pool", get_pool_stats(), POOL_COUNTERS),
+            render_gauges("cache", get_cache_stats(), CACHE_COUNTERS),
+            render_gauges("admission", admission, frozenset({"shed"})),
+        )
+
     return app
@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Generic, TypeVar
+from urllib.parse import unquote, urlparse
+
+from products_app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Bounded in-process cache evicting the least recently used entry, with entries expiring after `ttl` seconds
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: K) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    errors: int = 0
+
+
+class CacheBackend(ABC):
+    """
+    Byte-oriented key/value store behind the read-through caches
+    """
+
+    def __init__(self) -> None:
+        self.stats = CacheStats()
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        values = await self._get_many(keys)
+        hits = sum(value is not None for value in values)
+        self.stats.hits += hits
+        self.stats.misses += len(values) - hits
+        return values
+
+    async def get(self, key: str) -> bytes | None:
+        (value,) = await self.get_many([key])
+        return value
+
+    @abstractmethod
+    async def _get_many(self, keys: list[str]) -> list[bytes | None]: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    @abstractmethod
+    async def delete(self, keys: list[str]) -> None: ...
+
+    async def close(self) -> None:
+        return None
+
+    def get_stats(self) -> dict[str, int]:
+        return asdict(self.stats)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Per-process LRU + TTL backend
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        super().__init__()
+        self._lru: LRUCache[str, bytes] = LRUCache(maxsize, ttl)
+
+    async def _get_many(self, keys: list[str]) -> list[bytes | None]:
+        return [self._lru.get(key) for key in keys]
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._lru.set(key, value, ttl)
+        self.stats.evictions = self._lru.evictions
+
+    async def delete(self, keys: list[str]) -> None:
+        for key in keys:
+            self._lru.pop(key)
+
+    def clear(self) -> None:
+        self._lru.clear()
+
+    def get_stats(self) -> dict[str, int]:
+        return {**super().get_stats(), "entries": len(self._lru)}
+
+
+class RedisProtocolError(Exception):
+    pass
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Backend speaking the Redis protocol (RESP2) over a single connection, shared by every replica.
+    Eviction is left to the server's `maxmemory-policy`.
+    """
+
+    def __init__(self, url: str, timeout: float) -> None:
+        super().__init__()
+        # Seconds a command may take, waiting for the connection included, before the cache is skipped
+        self.timeout = timeout
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip("AUTH", self.password)
+        if self.db:
+            await self._roundtrip("SELECT", str(self.db))
+
+    async def _roundtrip(self, *args: str | bytes) -> object:
+        assert self._reader is not None and self._writer is not None
+        parts = [arg.encode() if isinstance(arg, str) else arg for arg in args]
+        self._writer.write(b"*%d\r\n" % len(parts) + b"".join(b"$%d\r\n%s\r\n" % (len(part), part) for part in parts))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self) -> object:
+        assert self._reader is not None
+        line = await self._reader.readuntil(b"\r\n")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise RedisProtocolError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            return (await self._reader.readexactly(size + 2))[:-2]
+        if kind == b"*":
+            size = int(payload)
+            if size < 0:
+                return None
+            return [await self._read_reply() for _ in range(size)]
+        raise RedisProtocolError(f"Unexpected reply {line!r}")
+
+    async def execute(self, *args: str | bytes) -> object:
+        async with asyncio.timeout(self.timeout), self._lock:
+            try:
+                if self._writer is None:
+                    await self._connect()
+                return await self._roundtrip(*args)
+            except BaseException:
+                # A command interrupted between its write and its read (cancelled, timed out or broken) leaves its
+                # reply unread, and the next command would take it for its own: drop the connection, the next
+                # command reconnects
+                await self._close_connection()
+                raise
+
+    async def _get_many(self, keys: list[str]) -> list[bytes | None]:
+        values = await self.execute("MGET", *keys)
+        assert isinstance(values, list)
+        return values
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.execute("SET", key, value, "PX", str(int(ttl * 1000)))
+
+    async def delete(self, keys: list[str]) -> None:
+        if keys:
+            await self.execute("DEL", *keys)
+
+    async def _close_connection(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._close_connection()
+
+
+_cache: CacheBackend | None = None
+
+
+def init_cache() -> CacheBackend | None:
+    """
+    Creates the process-wide cache backend selected by `CACHE_BACKEND`, if not created yet
+    """
+    global _cache
+    if _cache is None:
+        if settings.CACHE_BACKEND == "memory":
+            _cache = MemoryCacheBackend(settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS)
+        elif settings.CACHE_BACKEND == "redis":
+            _cache = RedisCacheBackend(settings.CACHE_REDIS_URL, settings.CACHE_TIMEOUT_MS / 1000)
+    return _cache
+
+
+async def dispose_cache() -> None:
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+    _cache = None
+
+
+def get_cache() -> CacheBackend | None:
+    return _cache
+
+
+def get_cache_stats() -> dict[str, int]:
+    return _cache.get_stats() if _cache is not None else {}
+
+
+# A failing cache only costs a trip to the database, it never fails the request
+CACHE_ERRORS = (OSError, TimeoutError, asyncio.IncompleteReadError, RedisProtocolError)
+
+
+async def cache_get_many(keys: list[str]) -> list[bytes | None]:
+    if _cache is None:
+        return [None] * len(keys)
+    try:
+        return await _cache.get_many(keys)
+    except CACHE_ERRORS:
+        _cache.stats.errors += 1
+        logger.warning("Cache read failed", exc_info=True)
+        return [None] * len(keys)
+
+
+async def cache_set(key: str, value: bytes, ttl: float | None = None) -> None:
+    if _cache is None:
+        return
+    try:
+        await _cache.set(key, value, settings.CACHE_TTL_SECONDS if ttl is None else ttl)
+    except CACHE_ERRORS:
+        _cache.stats.errors += 1
+        logger.warning("Cache write failed", exc_info=True)
+
+
+async def cache_invalidate(keys: list[str]) -> None:
+    if _cache is None:
+        return
+    try:
+        await _cache.delete(keys)
+    except CACHE_ERRORS:
+        _cache.stats.errors += 1
+        logger.warning("Cache invalidation failed", exc_info=True)
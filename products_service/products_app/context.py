@@ -0,0 +1,48 @@
+import math
+import time
+
+from strawberry.dataloader import DataLoader
+from strawberry.fastapi import BaseContext
+
+from products_app.db import UnitOfWork
+from products_app.models import Product
+from products_app.services import ProductService
+from products_app.settings import settings
+
+# Wall-clock time of the client's last mutation. The client sends it back, so that its own reads stay on the primary
+# for `READ_YOUR_WRITES_SECONDS` (replicas may not have caught up yet) while every other client's reads do not.
+LAST_WRITE_COOKIE = "last_write_at"
+
+
+class Context(BaseContext):
+    """
+    Per-request GraphQL context, holding the request-scoped unit of work and data loaders
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.unit_of_work = UnitOfWork()
+        self.products_by_id: DataLoader[int, Product | None] = DataLoader(load_fn=ProductService.get_products_by_ids)
+
+    def wrote_recently(self) -> bool:
+        """
+        Whether the client sent a mutation within the last `READ_YOUR_WRITES_SECONDS`, as echoed back in its cookie
+        """
+        written_at = self.request.cookies.get(LAST_WRITE_COOKIE) if self.request is not None else None
+        try:
+            return written_at is not None and time.time() - float(written_at) < settings.READ_YOUR_WRITES_SECONDS
+        except ValueError:
+            return False
+
+    def record_write(self) -> None:
+        if self.response is not None and settings.READ_YOUR_WRITES_SECONDS > 0:
+            self.response.set_cookie(
+                LAST_WRITE_COOKIE,
+                repr(time.time()),
+                max_age=math.ceil(settings.READ_YOUR_WRITES_SECONDS),
+                httponly=True,
+            )
+
+
+async def get_context() -> Context:
+    return Context()
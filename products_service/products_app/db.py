@@ -1,33 +1,381 @@
-from collections.abc import AsyncIterator
+import asyncio
+import hashlib
+import itertools
+import logging
+import re
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Any, ParamSpec
 
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
 
+from products_app.metrics import STATEMENT_DURATION
 from products_app.settings import settings
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PoolStats:
+    """
+    Cumulative connection pool counters of the process-wide engine
+    """
+
+    checkouts: int = 0
+    connects: int = 0
+    timeouts: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+
+
+pool_stats = PoolStats()
+
+
+class MeasuredQueuePool(AsyncAdaptedQueuePool):
+    """
+    Async queue pool recording how long callers wait for a connection
+    """
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            pool_stats.wait_seconds_total += waited
+            pool_stats.wait_seconds_max = max(pool_stats.wait_seconds_max, waited)
+
+
+def _on_connect(*_: Any) -> None:
+    pool_stats.connects += 1
+
+
+def _on_checkout(*_: Any) -> None:
+    pool_stats.checkouts += 1
+
+
+# Placeholders and literals vary from one execution of a statement to the next, its fingerprint must not
+_PLACEHOLDER = re.compile(r"\$\d+(?:::[\w\[\]]+)?|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_VALUES_ROWS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+_WHITESPACE = re.compile(r"\s+")
+# Statements beyond this many distinct fingerprints are recorded together
+MAX_STATEMENT_FINGERPRINTS = 1_000
+
+
+@dataclass
+class StatementStats:
+    """
+    Cumulative executions of one statement fingerprint
+    """
+
+    statement: str
+    count: int = 0
+    seconds_total: float = 0.0
+    seconds_max: float = 0.0
+
+
+statement_stats: dict[str, StatementStats] = {}
+
+
+@dataclass
+class StatementCounter:
+    """
+    Statements executed on behalf of one GraphQL operation
+    """
+
+    count: int = 0
+    seconds: float = 0.0
+
+
+# Counter of the GraphQL operation being executed, if any
+current_statement_counter: ContextVar[StatementCounter | None] = ContextVar("current_statement_counter", default=None)
+
+
+@lru_cache(maxsize=1024)
+def normalize_statement(statement: str) -> tuple[str, str]:
+    """
+    Returns the fingerprint of a statement and its normalized text: placeholders and literals become `?`, and lists
+    of them (an IN list, the rows of a multi-row VALUES) a single `?` or `(?)`
+    """
+    normalized = _PLACEHOLDER.sub("?", _WHITESPACE.sub(" ", statement).strip())
+    normalized = _VALUES_ROWS.sub("(?)", _PLACEHOLDER_LIST.sub("?", normalized))
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+def parameter_shapes(parameters: Any) -> str:
+    """
+    Describes bound parameters by type (and length of sequences), never by value
+    """
+    if isinstance(parameters, list) and parameters and isinstance(parameters[0], tuple | dict):
+        return f"{len(parameters)} x {parameter_shapes(parameters[0])}"
+    values = parameters.values() if isinstance(parameters, dict) else parameters or ()
+    return (
+        "("
+        + ", ".join(
+            f"{type(value).__name__}[{len(value)}]" if isinstance(value, list | tuple) else type(value).__name__
+            for value in values
+        )
+        + ")"
+    )
+
+
+def _before_cursor_execute(_conn: Any, _cursor: Any, _statement: str, _parameters: Any, context: Any, *_: Any) -> None:
+    context.statement_started = time.perf_counter()
+
+
+def _after_cursor_execute(_conn: Any, _cursor: Any, statement: str, parameters: Any, context: Any, *_: Any) -> None:
+    elapsed = time.perf_counter() - context.statement_started
+    fingerprint, normalized = normalize_statement(statement)
+    stats = statement_stats.get(fingerprint)
+    if stats is None:
+        if len(statement_stats) >= MAX_STATEMENT_FINGERPRINTS:
+            fingerprint, normalized = "other", "(other statements)"
+        stats = statement_stats.setdefault(fingerprint, StatementStats(normalized))
+    stats.count += 1
+    stats.seconds_total += elapsed
+    stats.seconds_max = max(stats.seconds_max, elapsed)
+    STATEMENT_DURATION.observe((fingerprint,), elapsed)
+    counter = current_statement_counter.get()
+    if counter is not None:
+        counter.count += 1
+        counter.seconds += elapsed
+    if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        logger.warning(
+            "Slow statement %s took %.1f ms: %s -- parameters %s",
+            fingerprint,
+            elapsed * 1000,
+            normalized,
+            parameter_shapes(parameters),
+        )
+
+
+_engine: AsyncEngine | None = None
+_session_maker: async_sessionmaker[AsyncSession] | None = None
+_replicas: list[tuple[AsyncEngine, async_sessionmaker[AsyncSession]]] = []
+_replica_turn = itertools.count()
+# Monotonic time of the last write committed by, or notified to, this process
+_last_write_at = float("-inf")
+
 
 def get_db_engine(database_url: str) -> AsyncEngine:
     """
     Creates async engine for a given database url
     """
-    return create_async_engine(
+    engine = create_async_engine(
         database_url,
         echo=False,
         future=True,
+        poolclass=MeasuredQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
     )
+    event.listen(engine.sync_engine, "connect", _on_connect)
+    event.listen(engine.sync_engine, "checkout", _on_checkout)
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+def init_db() -> async_sessionmaker[AsyncSession]:
+    """
+    Creates the process-wide engine and session maker, if not created yet
+    """
+    global _engine, _session_maker
+    if _engine is None or _session_maker is None:
+        _engine = get_db_engine(settings.DATABASE_URI)
+        _session_maker = async_sessionmaker(_engine, class_=AsyncSession, expire_on_commit=False)
+        for replica_uri in settings.DATABASE_REPLICA_URIS:
+            replica = get_db_engine(replica_uri)
+            _replicas.append((replica, async_sessionmaker(replica, class_=AsyncSession, expire_on_commit=False)))
+    return _session_maker
+
+
+def _checked_out(engine: AsyncEngine) -> int:
+    pool = engine.pool
+    return pool.checkedout() if isinstance(pool, AsyncAdaptedQueuePool) else 0
+
+
+def read_session_maker() -> async_sessionmaker[AsyncSession]:
+    """
+    Session maker for read-only work: a replica picked by `REPLICA_ROUTING`, or the primary when there are none
+    """
+    session_maker = init_db()
+    if not _replicas:
+        return session_maker
+    # Start from the next replica in turn, so idle replicas (all equally loaded) still share the reads
+    start = next(_replica_turn) % len(_replicas)
+    candidates = _replicas[start:] + _replicas[:start]
+    if settings.REPLICA_ROUTING == "least_loaded":
+        return min(candidates, key=lambda replica: _checked_out(replica[0]))[1]
+    return candidates[0][1]
+
+
+def record_write() -> None:
+    global _last_write_at
+    _last_write_at = time.monotonic()
+
+
+def replica_may_lag() -> bool:
+    """
+    Whether the current unit of work reads from a replica that may not have caught up yet with a write recorded within
+    the last `READ_YOUR_WRITES_SECONDS`, so what it reads must not be cached
+    """
+    unit_of_work = current_unit_of_work.get()
+    return (
+        bool(_replicas)
+        and unit_of_work is not None
+        and unit_of_work.read_only
+        and time.monotonic() - _last_write_at < settings.READ_YOUR_WRITES_SECONDS
+    )
+
+
+async def dispose_db() -> None:
+    """
+    Closes every pooled connection of the process-wide engines
+    """
+    global _engine, _session_maker
+    if _engine is not None:
+        await _engine.dispose()
+    for replica, _ in _replicas:
+        await replica.dispose()
+    _engine = None
+    _session_maker = None
+    _replicas.clear()
+
+
+def get_statement_stats() -> list[dict[str, Any]]:
+    """
+    Returns the stats of every statement fingerprint, the most time-consuming first
+    """
+    by_time = sorted(statement_stats.items(), key=lambda item: item[1].seconds_total, reverse=True)
+    return [{"fingerprint": fingerprint, **asdict(stats)} for fingerprint, stats in by_time]
+
+
+def get_pool_stats() -> dict[str, int | float]:
+    """
+    Returns current pool gauges together with the cumulative checkout/wait counters
+    """
+    stats: dict[str, int | float] = asdict(pool_stats)
+    pool = _engine.pool if _engine is not None else None
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    return stats
+
+
+P = ParamSpec("P")
+
+
+class UnitOfWork:
+    """
+    One lazily-opened session (and transaction) shared by every resolver of a GraphQL operation.
+    Writes are flushed as they go and committed once, when the operation is over.
+    A `read_only` unit of work (a query) is served by a replica, see `read_session_maker`.
+    """
+
+    def __init__(self, read_only: bool = False) -> None:
+        self.read_only = read_only
+        self.wrote = False
+        self._session: AsyncSession | None = None
+        # Sibling fields resolve concurrently, but a session runs one statement at a time
+        self._lock = asyncio.Lock()
+        self._after_commit: list[Callable[[], Awaitable[None]]] = []
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        async with self._lock:
+            if self._session is None:
+                self._session = (read_session_maker() if self.read_only else init_db())()
+            yield self._session
+
+    def after_commit(self, callback: Callable[[], Awaitable[None]]) -> None:
+        self._after_commit.append(callback)
+
+    async def commit(self) -> None:
+        async with self._lock:
+            if self._session is not None:
+                await self._session.commit()
+                if self.wrote:
+                    record_write()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            await callback()
+
+    async def rollback(self) -> None:
+        async with self._lock:
+            if self._session is not None:
+                await self._session.rollback()
+        self._after_commit = []
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._session is not None:
+                await self._session.close()
+            self._session = None
+
+
+# Unit of work of the GraphQL operation being executed, if any
+current_unit_of_work: ContextVar[UnitOfWork | None] = ContextVar("current_unit_of_work", default=None)
 
 
 @asynccontextmanager
-async def get_session() -> AsyncIterator[AsyncSession]:
+async def get_session(isolated: bool = False) -> AsyncIterator[AsyncSession]:
     """
-    Creates async session for a given engine
+    Yields the session of the current unit of work, or a new session bound to the process-wide engine when there
+    is none (or `isolated` work, e.g. a read that may be cancelled, must not disturb it)
     """
-    engine = get_db_engine(settings.DATABASE_URI)
-    async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
-    async with async_session() as session:
+    unit_of_work = current_unit_of_work.get()
+    if unit_of_work is not None and not isolated:
+        async with unit_of_work.session() as session:
+            yield session
+        return
+    session_maker = read_session_maker() if unit_of_work is not None and unit_of_work.read_only else init_db()
+    async with session_maker() as session:
         yield session
+
+
+async def commit(session: AsyncSession) -> None:
+    """
+    Commits the session's transaction, unless it belongs to a unit of work that commits at the end of the operation
+    """
+    unit_of_work = current_unit_of_work.get()
+    if unit_of_work is None:
+        await session.commit()
+        record_write()
+    else:
+        await session.flush()
+        unit_of_work.wrote = True
+
+
+async def after_commit(callback: Callable[P, Awaitable[None]], *args: P.args, **kwargs: P.kwargs) -> None:
+    """
+    Runs `callback` once the current unit of work has committed, or right away outside of one
+    """
+    unit_of_work = current_unit_of_work.get()
+    if unit_of_work is None:
+        await callback(*args, **kwargs)
+    else:
+        unit_of_work.after_commit(lambda: callback(*args, **kwargs))
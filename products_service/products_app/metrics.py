@@ -0,0 +1,113 @@
+from bisect import bisect_left
+from collections.abc import Iterator, Mapping
+
+LabelValues = tuple[str, ...]
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1_000, 5_000, 10_000)
+
+
+def _labels(names: tuple[str, ...], values: LabelValues, *extra: tuple[str, str]) -> str:
+    pairs = [*zip(names, values, strict=True), *extra]
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped, strict=True)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, labels: LabelValues = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Histogram:
+    """
+    Observations counted into fixed buckets; cumulative counts are only computed when rendered
+    """
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...], buckets: tuple[float, ...]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # Per label values: the count of every bucket (and of +Inf), then the sum of observations
+        self._series: dict[LabelValues, list[float]] = {}
+
+    def observe(self, labels: LabelValues, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in self._series.items():
+            cumulative = 0.0
+            for bound, count in zip((*map(str, self.buckets), "+Inf"), series[:-1], strict=True):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.labels, labels, ('le', bound))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {series[-1]}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+OPERATION_DURATION = Histogram(
+    "graphql_operation_duration_seconds",
+    "Time to execute a GraphQL operation",
+    ("operation_type", "operation_name"),
+    LATENCY_BUCKETS,
+)
+OPERATION_ERRORS = Counter(
+    "graphql_operation_errors_total", "Errors reported by GraphQL operations", ("operation_type", "operation_name")
+)
+FIELD_DURATION = Histogram(
+    "graphql_field_duration_seconds", "Time spent in a field resolver", ("field",), LATENCY_BUCKETS
+)
+FIELD_ERRORS = Counter("graphql_field_errors_total", "Errors raised by a field resolver", ("field",))
+FIELD_RESULT_SIZE = Histogram(
+    "graphql_field_result_size", "Items returned by a list field resolver", ("field",), SIZE_BUCKETS
+)
+STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds",
+    "Time to execute a SQL statement, by fingerprint",
+    ("fingerprint",),
+    LATENCY_BUCKETS,
+)
+
+METRICS = (OPERATION_DURATION, OPERATION_ERRORS, FIELD_DURATION, FIELD_ERRORS, FIELD_RESULT_SIZE, STATEMENT_DURATION)
+
+
+def render_gauges(
+    prefix: str, values: Mapping[str, int | float], counters: frozenset[str] = frozenset()
+) -> Iterator[str]:
+    """
+    Renders a stats mapping (e.g. the pool stats) as one metric per key, typed as counter when listed in `counters`
+    """
+    for key, value in values.items():
+        kind = "counter" if key in counters else "gauge"
+        name = f"{prefix}_{key}" if kind == "gauge" or key.endswith("_total") else f"{prefix}_{key}_total"
+        yield f"# TYPE {name} {kind}"
+        yield f"{name} {value}"
+
+
+def render_metrics(*extra: Iterator[str]) -> str:
+    """
+    Every metric in the Prometheus text exposition format
+    """
+    lines = [line for metric in METRICS for line in metric.render()]
+    for more in extra:
+        lines.extend(more)
+    return "\n".join(lines) + "\n"
@@ -1,8 +1,12 @@
 from enum import Enum
 
 import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlmodel import Field, SQLModel
 
+# `gin_trgm_ops` of `idx_name_trgm` comes from the pg_trgm extension
+sa.event.listen(SQLModel.metadata, "before_create", sa.DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))  # type: ignore[no-untyped-call]
+
 
 class ProductStatus(str, Enum):
     ACTIVE = "active"
@@ -14,9 +18,10 @@ class Product(SQLModel, table=True):
     Product Model representing product table
 
     Indices:
-     -  Full-text search index on `name`
+     -  Full-text search index on the stored `search_vector` of `name`
+     -  Trigram index on `name` for prefix/typeahead lookups
      -  Index for queries on `status` sorted by `id`.
-     -  Index for active products sorted by `price`.
+     -  Covering index for active products sorted by `price` (and `id` as tie-breaker).
     """
 
     id: int = Field(primary_key=True)
@@ -25,13 +30,91 @@ class Product(SQLModel, table=True):
     status: ProductStatus = Field(default=ProductStatus.ACTIVE, nullable=False)
 
     __table_args__ = (
-        sa.Index(
-            "idx_name_fulltext",
-            sa.text("to_tsvector('english', name)"),
-            postgresql_using="gin",
-        ),
+        # Trigram index serving `ILIKE 'prefix%'` typeahead lookups
+        sa.Index("idx_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
         # Index for queries on status and id
         sa.Index("idx_status_id", "status", "id"),
-        # Index for active products sorted by price
-        sa.Index("idx_status_price", "status", "price"),
+        # Index for active products sorted by price, covering every column a listing returns
+        sa.Index("idx_status_price", "status", "price", "id", postgresql_include=["name"]),
     )
+
+
+# Full-text document of `name`, generated and stored by Postgres so searches never compute it per row.
+# It holds both stemmed (english) and unstemmed (simple) lexemes, the latter serving prefix matches of partial words.
+# It is attached to the table only, not mapped on the model, so regular reads never load it.
+product_search_vector = sa.Column(
+    "search_vector",
+    TSVECTOR,
+    sa.Computed("to_tsvector('english', name) || to_tsvector('simple', name)", persisted=True),
+    nullable=True,
+)
+Product.__table__.append_column(product_search_vector)  # type: ignore[attr-defined]
+sa.Index("idx_search_vector", product_search_vector, postgresql_using="gin")
+
+# Id of the current transaction; `xid8` has no cast to bigint, hence the detour through text
+CURRENT_XACT_ID = "pg_current_xact_id()::text::bigint"
+
+# Stamped by Postgres on insert, and on every update that changes the product, so the change feed sees every write
+# whichever client made it. Like `search_vector`, it is attached to the table only and never loaded by regular reads.
+product_updated_at = sa.Column(
+    "updated_at", sa.DateTime(timezone=True), server_default=sa.func.clock_timestamp(), nullable=False
+)
+Product.__table__.append_column(product_updated_at)  # type: ignore[attr-defined]
+# Answers lookups by time (what changed since a given moment); the change feed itself pages on `idx_xact_id_id`
+sa.Index("idx_updated_at_id", product_updated_at, Product.__table__.c.id)  # type: ignore[attr-defined]
+
+# Id of the transaction that last wrote the row, stamped alongside `updated_at`. The change feed is ordered by it and
+# only serves the rows of transactions older than any still in flight, so a slow transaction committing rows stamped
+# earlier than changes already served can never be skipped.
+product_xact_id = sa.Column("xact_id", sa.BigInteger, server_default=sa.text(CURRENT_XACT_ID), nullable=False)
+Product.__table__.append_column(product_xact_id)  # type: ignore[attr-defined]
+sa.Index("idx_xact_id_id", product_xact_id, Product.__table__.c.id)  # type: ignore[attr-defined]
+
+# Ids of deleted products, left behind by a trigger so the change feed can report deletes
+product_tombstone = sa.Table(
+    "product_tombstone",
+    SQLModel.metadata,
+    sa.Column("id", sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column("deleted_at", sa.DateTime(timezone=True), server_default=sa.func.clock_timestamp(), nullable=False),
+    sa.Column("xact_id", sa.BigInteger, server_default=sa.text(CURRENT_XACT_ID), nullable=False),
+    sa.Index("idx_deleted_at_id", "deleted_at", "id"),
+    sa.Index("idx_tombstone_xact_id_id", "xact_id", "id"),
+)
+
+# Kept in sync with the migration creating them
+PRODUCT_TRIGGERS = (
+    """
+    CREATE OR REPLACE FUNCTION product_touch() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.updated_at := clock_timestamp();
+        NEW.xact_id := pg_current_xact_id()::text::bigint;
+        RETURN NEW;
+    END $$
+    """,
+    # Generated columns are not computed yet in BEFORE triggers, hence the explicit columns
+    """
+    CREATE TRIGGER product_touch BEFORE UPDATE ON product FOR EACH ROW
+    WHEN ((OLD.name, OLD.price, OLD.status) IS DISTINCT FROM (NEW.name, NEW.price, NEW.status))
+    EXECUTE FUNCTION product_touch()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION product_tombstone() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO product_tombstone (id) SELECT id FROM deleted
+        ON CONFLICT (id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at, xact_id = EXCLUDED.xact_id;
+        RETURN NULL;
+    END $$
+    """,
+    # One insert per statement, whatever the number of deleted rows
+    """
+    CREATE TRIGGER product_tombstone AFTER DELETE ON product REFERENCING OLD TABLE AS deleted
+    FOR EACH STATEMENT EXECUTE FUNCTION product_tombstone()
+    """,
+)
+for trigger in PRODUCT_TRIGGERS:
+    sa.event.listen(Product.__table__, "after_create", sa.DDL(trigger))  # type: ignore[attr-defined, no-untyped-call]
+sa.event.listen(
+    Product.__table__,  # type: ignore[attr-defined]
+    "after_drop",
+    sa.DDL("DROP FUNCTION IF EXISTS product_touch, product_tombstone"),  # type: ignore[no-untyped-call]
+)
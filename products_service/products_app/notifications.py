@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import asyncpg  # type: ignore[import-untyped]
+from sqlalchemy.engine import make_url
+
+from products_app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Channel the repository's write paths NOTIFY with the id of every changed product
+PRODUCTS_CHANNEL = "products_changed"
+
+# Receives the ids changed since the previous call, or None when changes may have been missed
+ChangeHandler = Callable[[set[str] | None], Awaitable[None]]
+
+
+class ChangeListener:
+    """
+    Background LISTEN on a dedicated asyncpg connection (outside the SQLAlchemy pool).
+    Notifications arriving within `coalesce_seconds` of each other are handed to `on_changes` as one batch,
+    so a bulk write costs one eviction pass. The connection is re-established with exponential backoff; since
+    notifications sent while disconnected are lost, a reconnect reports "everything changed" (None).
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        channel: str,
+        on_changes: ChangeHandler,
+        coalesce_seconds: float,
+        keepalive_seconds: float = 30.0,
+        max_backoff_seconds: float = 30.0,
+    ) -> None:
+        self.dsn = dsn
+        self.channel = channel
+        self.on_changes = on_changes
+        self.coalesce_seconds = coalesce_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.connected = asyncio.Event()
+        self.connection: asyncpg.Connection | None = None
+        self._pending: set[str] = set()
+        self._pending_everything = False
+        self._flush_task: asyncio.Task[None] | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name=f"listen:{self.channel}")
+
+    async def stop(self) -> None:
+        for task in (self._task, self._flush_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = self._flush_task = None
+
+    async def _run(self) -> None:
+        backoff = 0.1
+        reconnecting = False
+        while True:
+            try:
+                await self._listen(reconnecting)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                logger.warning("LISTEN %s connection failed, retrying in %.1fs", self.channel, backoff, exc_info=True)
+            else:
+                backoff = 0.1
+            reconnecting = True
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff_seconds)
+
+    async def _listen(self, reconnecting: bool) -> None:
+        connection = await asyncpg.connect(self.dsn)
+        lost = asyncio.Event()
+        connection.add_termination_listener(lambda _: lost.set())
+        try:
+            await connection.add_listener(self.channel, self._on_notification)
+            self.connection = connection
+            self.connected.set()
+            if reconnecting:
+                self._schedule(None)
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    # An idle connection may be silently gone (e.g. network partition), probe it
+                    await connection.execute("SELECT 1", timeout=self.keepalive_seconds)
+        finally:
+            self.connected.clear()
+            self.connection = None
+            if not connection.is_closed():
+                connection.terminate()
+
+    def _on_notification(self, _connection: Any, _pid: int, _channel: str, payload: str) -> None:
+        self._schedule({payload})
+
+    def _schedule(self, ids: set[str] | None) -> None:
+        if ids is None:
+            self._pending_everything = True
+        else:
+            self._pending |= ids
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self) -> None:
+        await asyncio.sleep(self.coalesce_seconds)
+        ids = None if self._pending_everything else self._pending
+        self._pending, self._pending_everything = set(), False
+        self._flush_task = None
+        try:
+            await self.on_changes(ids)
+        except Exception:
+            logger.exception("Handling %s notifications failed", self.channel)
+
+
+def listen_dsn() -> str:
+    """
+    Plain asyncpg DSN of the service database
+    """
+    return make_url(settings.DATABASE_URI).set(drivername="postgresql").render_as_string(hide_password=False)
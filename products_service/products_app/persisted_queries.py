@@ -0,0 +1,82 @@
+import hashlib
+import math
+from typing import Any
+
+from graphql import DocumentNode, GraphQLError
+from strawberry.fastapi import GraphQLRouter
+from strawberry.http.exceptions import HTTPException
+from strawberry.types import ExecutionResult
+
+from products_app.cache import LRUCache
+from products_app.settings import settings
+
+# Query text registered through automatic persisted queries (APQ), by the sha256 hash clients send instead
+persisted_queries: LRUCache[str, str] = LRUCache(settings.PERSISTED_QUERIES_MAX_ENTRIES, math.inf)
+# Parsed documents that passed validation, by the sha256 hash of their query text
+documents: LRUCache[str, DocumentNode] = LRUCache(settings.DOCUMENT_CACHE_MAX_ENTRIES, math.inf)
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class PersistedQueryNotFound(Exception):
+    pass
+
+
+def resolve_persisted_query(data: dict[str, Any]) -> None:
+    """
+    Fills in the query text of an APQ request sending only its hash, or registers the text sent along with it.
+    Raises `PersistedQueryNotFound` for an unknown hash, so the client retries with the full query.
+    """
+    persisted_query = data["extensions"]["persistedQuery"]
+    if persisted_query.get("version") != 1:
+        raise HTTPException(400, "Unsupported persisted query version")
+    sha256_hash = persisted_query.get("sha256Hash")
+    query = data.get("query")
+    if query is None:
+        query = persisted_queries.get(sha256_hash)
+        if query is None:
+            raise PersistedQueryNotFound
+        data["query"] = query
+    elif query_hash(query) != sha256_hash:
+        raise HTTPException(400, "provided sha does not match query")
+    else:
+        persisted_queries.set(sha256_hash, query)
+
+
+def is_persisted_query(data: object) -> bool:
+    return (
+        isinstance(data, dict)
+        and isinstance(data.get("extensions"), dict)
+        and isinstance(data["extensions"].get("persistedQuery"), dict)
+    )
+
+
+class PersistedQueryRouter(GraphQLRouter[Any, None]):
+    """
+    GraphQL router speaking the APQ protocol: a request may carry `extensions.persistedQuery.sha256Hash` in place of
+    the query text, which is looked up in the registry (and registered when the text is sent along with it)
+    """
+
+    def parse_json(self, data: str | bytes) -> Any:
+        parsed = super().parse_json(data)
+        if is_persisted_query(parsed):
+            resolve_persisted_query(parsed)
+        return parsed
+
+    def parse_query_params(self, params: Any) -> dict[str, Any]:
+        parsed = super().parse_query_params(params)
+        if parsed.get("extensions"):
+            parsed["extensions"] = self.parse_json(parsed["extensions"])
+            if is_persisted_query(parsed):
+                resolve_persisted_query(parsed)
+        return parsed
+
+    async def execute_operation(self, *args: Any, **kwargs: Any) -> Any:
+        try:
+            return await super().execute_operation(*args, **kwargs)
+        except PersistedQueryNotFound:
+            # Answered like any GraphQL error, which is what APQ clients look for before sending the full query
+            error = GraphQLError("PersistedQueryNotFound", extensions={"code": "PERSISTED_QUERY_NOT_FOUND"})
+            return ExecutionResult(data=None, errors=[error])
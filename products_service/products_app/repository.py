@@ -1,7 +1,54 @@
+import re
+from collections.abc import Collection
+from typing import Any
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, ENUM, insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlmodel import func, select
+from sqlalchemy.orm import aliased
+from sqlmodel import and_, col, func, or_, select
+
+from products_app.db import commit
+from products_app.models import (
+    Product,
+    ProductStatus,
+    product_search_vector,
+    product_tombstone,
+    product_updated_at,
+    product_xact_id,
+)
+from products_app.notifications import PRODUCTS_CHANNEL
+from products_app.rows import ProductChangeRow, ProductRow, RankedProductRow, fetch_rows
+from products_app.settings import settings
+
+# Characters with a special meaning in LIKE patterns
+LIKE_SPECIAL = re.compile(r"[\\%_]")
+# A trailing plain word, i.e. one the user may still be typing
+TRAILING_WORD = re.compile(r"(?:^|\s)(\w+)$")
+
 
-from products_app.models import Product, ProductStatus
+def search_tsquery(search: str) -> sa.ColumnElement[Any]:
+    """
+    Parses user input with `websearch_to_tsquery`, matching a trailing plain word as a prefix as well
+    """
+    match = TRAILING_WORD.search(search)
+    if match is None:
+        return func.websearch_to_tsquery("english", search)
+    # A whole word matches by its stem, a partial one as a prefix of the unstemmed lexemes
+    word = match.group(1)
+    last = func.websearch_to_tsquery("english", word).op("||")(func.to_tsquery("simple", f"{word}:*"))
+    head = search[: match.start(1)].strip()
+    if not head:
+        return last
+    return func.websearch_to_tsquery("english", head).op("&&")(last)
+
+
+def product_columns(fields: Collection[str], *required: str) -> list[sa.Column[Any]]:
+    """
+    Columns to read for the requested `fields` (plus `id` and any `required` by the query itself), so the
+    columns a client did not ask for are neither transferred nor decoded
+    """
+    return [column for column in sa.inspect(Product).columns if column.key in {"id", *fields, *required}]
 
 
 class ProductRepository:
@@ -12,34 +59,194 @@ class ProductRepository:
         return result
 
     @staticmethod
-    async def get_active_products(session: AsyncSession) -> list[Product]:
-        stmt = select(Product).where(Product.status == ProductStatus.ACTIVE)
+    async def get_products_by_ids(product_ids: list[int], session: AsyncSession) -> list[Product]:
+        # A single array parameter keeps the statement text (and its prepared plan) identical for any batch size
+        ids = sa.bindparam("product_ids", value=product_ids, type_=ARRAY(sa.Integer))
+        stmt = select(Product).where(Product.id == sa.any_(ids))
         result = await session.scalars(stmt)
-        return list(result)
+        return list(result.all())
+
+    @staticmethod
+    async def get_active_products(limit: int, after_id: int | None, session: AsyncSession) -> list[ProductRow]:
+        # Equality on `status` plus a range on `id` is a single range scan over `idx_status_id`
+        stmt = sa.select(*product_columns(ProductRow.__slots__)).where(col(Product.status) == ProductStatus.ACTIVE)
+        if after_id is not None:
+            stmt = stmt.where(col(Product.id) > after_id)
+        stmt = stmt.order_by(col(Product.id)).limit(limit)
+        return await fetch_rows(session, stmt, ProductRow)
+
+    @staticmethod
+    async def get_active_products_by_price(
+        min_price: float | None,
+        max_price: float | None,
+        limit: int,
+        after: tuple[float, int] | None,
+        fields: Collection[str],
+        session: AsyncSession,
+    ) -> list[ProductRow]:
+        # Every predicate and sort key is a prefix of `idx_status_price`, which also covers the selected columns
+        stmt = sa.select(*product_columns(fields, "price")).where(col(Product.status) == ProductStatus.ACTIVE)
+        if min_price is not None:
+            stmt = stmt.where(col(Product.price) >= min_price)
+        if max_price is not None:
+            stmt = stmt.where(col(Product.price) <= max_price)
+        if after is not None:
+            stmt = stmt.where(sa.tuple_(col(Product.price), col(Product.id)) > sa.tuple_(*map(sa.literal, after)))
+        stmt = stmt.order_by(col(Product.price), col(Product.id)).limit(limit)
+        return await fetch_rows(session, stmt, ProductRow)
+
+    @staticmethod
+    async def search_products_by_name(
+        search: str, limit: int, after: tuple[float, int] | None, session: AsyncSession
+    ) -> list[RankedProductRow]:
+        query = search_tsquery(search)
+        rank = func.ts_rank(product_search_vector, query)
+        stmt = sa.select(*product_columns(ProductRow.__slots__), rank.label("rank")).where(
+            col(Product.status) == ProductStatus.ACTIVE, product_search_vector.op("@@")(query)
+        )
+        if after is not None:
+            after_rank, after_id = after
+            stmt = stmt.where(or_(rank < after_rank, and_(rank == after_rank, col(Product.id) > after_id)))
+        stmt = stmt.order_by(rank.desc(), col(Product.id)).limit(limit)
+        return await fetch_rows(session, stmt, RankedProductRow)
 
     @staticmethod
-    async def search_products_by_name(search: str, session: AsyncSession) -> list[Product]:
-        stmt = select(Product).where(
-            Product.status == ProductStatus.ACTIVE, func.to_tsvector("english", Product.name).match(search)
+    async def suggest_product_names(prefix: str, limit: int, session: AsyncSession) -> list[str]:
+        # `ILIKE 'prefix%'` is answered by `idx_name_trgm`; similarity ranks the closest (shortest) names first
+        pattern = LIKE_SPECIAL.sub(r"\\\g<0>", prefix) + "%"
+        stmt = (
+            select(Product.name)
+            .where(Product.status == ProductStatus.ACTIVE, col(Product.name).ilike(pattern, escape="\\"))
+            .order_by(func.similarity(Product.name, prefix).desc(), col(Product.name))
+            .limit(limit)
         )
         result = await session.scalars(stmt)
-        return list(result.all())
+        return list(result)
+
+    @staticmethod
+    async def get_changes_since(
+        after: tuple[int, int] | None, limit: int, session: AsyncSession
+    ) -> list[ProductChangeRow]:
+        """
+        The first `limit` products changed or deleted after the `(xact_id, id)` position of a change feed, in the order
+        of their transactions. Changes are held back while an older transaction is in flight: it may still commit, and
+        a consumer past its changes would miss them.
+        """
+        # Every transaction older than the oldest one still in flight has committed (or aborted)
+        finished = sa.cast(sa.cast(func.pg_snapshot_xmin(func.pg_current_snapshot()), sa.Text), sa.BigInteger)
+        # Each branch is a range scan over its `(xact_id, id)` index, merged by the outer sort
+        live = sa.select(
+            *product_columns(ProductRow.__slots__),
+            product_xact_id,
+            product_updated_at.label("changed_at"),
+            sa.false().label("deleted"),
+        ).where(product_xact_id < finished)
+        dead = sa.select(
+            product_tombstone.c.id,
+            sa.null().label("name"),
+            sa.null().label("price"),
+            sa.null().label("status"),
+            product_tombstone.c.xact_id,
+            product_tombstone.c.deleted_at.label("changed_at"),
+            sa.true().label("deleted"),
+        ).where(product_tombstone.c.xact_id < finished)
+        if after is not None:
+            position = sa.tuple_(*map(sa.literal, after))
+            live = live.where(sa.tuple_(product_xact_id, col(Product.id)) > position)
+            dead = dead.where(sa.tuple_(product_tombstone.c.xact_id, product_tombstone.c.id) > position)
+        live = live.order_by(product_xact_id, col(Product.id)).limit(limit)
+        dead = dead.order_by(product_tombstone.c.xact_id, product_tombstone.c.id).limit(limit)
+        changes = sa.union_all(live, dead).subquery("changes")
+        stmt = sa.select(*changes.c).order_by(changes.c.xact_id, changes.c.id).limit(limit)
+        return await fetch_rows(session, stmt, ProductChangeRow)
+
+    @staticmethod
+    async def notify_changed(product_ids: list[int], session: AsyncSession) -> None:
+        # Delivered to every listening replica when (and only if) the surrounding transaction commits
+        ids = sa.bindparam("product_ids", value=product_ids, type_=ARRAY(sa.Integer))
+        changed = func.unnest(ids).column_valued("id")
+        await session.execute(select(func.pg_notify(PRODUCTS_CHANNEL, sa.cast(changed, sa.Text))))
 
     @staticmethod
     async def create_product(product: Product, session: AsyncSession) -> Product:
         session.add(product)
-        await session.commit()
-        await session.refresh(product)
+        await session.flush()
+        await ProductRepository.notify_changed([product.id], session)
+        await commit(session)
         return product
 
     @staticmethod
-    async def update_product(product: Product, session: AsyncSession) -> Product:
-        session.add(product)
-        await session.commit()
-        await session.refresh(product)
-        return product
+    async def update_product(product_id: int, values: dict[str, Any], session: AsyncSession) -> Product | None:
+        """
+        Updates the product in a single statement that also queues its change notification.
+        Returns the updated product, or None when no product has this id.
+        """
+        updated = (
+            sa.update(Product).where(col(Product.id) == product_id).values(values).returning(Product).cte("updated")
+        )
+        stmt = select(aliased(Product, updated), func.pg_notify(PRODUCTS_CHANNEL, sa.cast(updated.c.id, sa.Text)))
+        # A product already loaded by the unit of work is refreshed with the updated values
+        row = (await session.execute(stmt, execution_options={"populate_existing": True})).first()
+        await commit(session)
+        return row[0] if row else None
+
+    @staticmethod
+    async def delete_product(product_id: int, session: AsyncSession) -> bool:
+        """
+        Deletes the product in a single statement that also queues its change notification.
+        Returns whether a product with this id existed.
+        """
+        deleted = sa.delete(Product).where(col(Product.id) == product_id).returning(col(Product.id)).cte("deleted")
+        stmt = select(func.pg_notify(PRODUCTS_CHANNEL, sa.cast(deleted.c.id, sa.Text)))
+        row = (await session.execute(stmt)).first()
+        await commit(session)
+        return row is not None
 
     @staticmethod
-    async def delete_product(product: Product, session: AsyncSession) -> None:
-        await session.delete(product)
-        await session.commit()
+    async def create_products(rows: list[dict[str, Any]], session: AsyncSession) -> list[Product]:
+        """
+        Inserts every row with a single statement in one transaction and returns the inserted products.
+        Rows whose name already exists are skipped (not returned) rather than failing the whole batch.
+        """
+        stmt: Any
+        staging = None
+        if len(rows) >= settings.BULK_COPY_THRESHOLD:
+            staging = await ProductRepository._copy_to_staging(rows, session)
+            stmt = insert(Product).from_select(
+                ["name", "price", "status"],
+                select(staging.c.name, staging.c.price, staging.c.status).order_by(staging.c.position),
+            )
+        else:
+            stmt = insert(Product).values(rows)
+        stmt = stmt.on_conflict_do_nothing(index_elements=["name"]).returning(Product)
+        products = list(await session.scalars(stmt))
+        if staging is not None:
+            # The transaction may go on (see `UnitOfWork`), leaving room for another import
+            await (await session.connection()).run_sync(staging.drop)
+        if products:
+            await ProductRepository.notify_changed([product.id for product in products], session)
+        await commit(session)
+        return products
+
+    @staticmethod
+    async def _copy_to_staging(rows: list[dict[str, Any]], session: AsyncSession) -> sa.Table:
+        # COPY streams the rows without binding thousands of parameters; the staging table vanishes on commit
+        staging = sa.Table(
+            "product_import",
+            sa.MetaData(),
+            sa.Column("position", sa.Integer),
+            sa.Column("name", sa.Text),
+            sa.Column("price", sa.Float),
+            sa.Column("status", ENUM(name="productstatus", create_type=False)),
+            prefixes=["TEMPORARY"],
+            postgresql_on_commit="DROP",
+        )
+        connection = await session.connection()
+        await connection.run_sync(staging.create)
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(  # type: ignore[union-attr]
+            staging.name,
+            records=[(position, row["name"], row["price"], row["status"].name) for position, row in enumerate(rows)],
+            columns=[column.name for column in staging.columns],
+        )
+        return staging
@@ -0,0 +1,101 @@
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any, Self, TypeVar
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from products_app.models import ProductStatus
+
+R = TypeVar("R", bound="SlottedRow")
+
+
+class SlottedRow:
+    """
+    Base of the plain result objects of the ORM-free read path, one slot per selectable column
+    """
+
+    __slots__ = ()
+
+
+class ProductRow(SlottedRow):
+    """
+    A product read without the ORM; attributes of columns the query did not select are left unset
+    """
+
+    __slots__ = ("id", "name", "price", "status")
+
+    id: int
+    name: str
+    price: float
+    status: ProductStatus
+
+    def to_json(self) -> list[Any]:
+        return [self.id, self.name, self.price, self.status.value]
+
+    @classmethod
+    def from_json(cls, values: list[Any]) -> Self:
+        row = cls.__new__(cls)
+        row.id, row.name, row.price = values[:3]
+        row.status = ProductStatus(values[3])
+        return row
+
+
+class RankedProductRow(ProductRow):
+    """
+    A product matched by a search, with its relevance
+    """
+
+    __slots__ = ("rank",)
+
+    rank: float
+
+    def to_json(self) -> list[Any]:
+        return [*super().to_json(), self.rank]
+
+    @classmethod
+    def from_json(cls, values: list[Any]) -> Self:
+        row = super().from_json(values)
+        row.rank = values[4]
+        return row
+
+
+class ProductChangeRow(ProductRow):
+    """
+    A product changed since a change feed cursor; a deleted product only has its `id` (its other columns are `None`)
+    """
+
+    __slots__ = ("xact_id", "changed_at", "deleted")
+
+    xact_id: int
+    changed_at: datetime
+    deleted: bool
+
+
+async def fetch_rows(session: AsyncSession, stmt: sa.Select[Any], row_type: type[R]) -> list[R]:
+    """
+    Runs a Core select and maps the driver's records straight onto `row_type` instances, skipping ORM identity
+    tracking, model validation and SQLAlchemy `Row` objects. Every selected column key must be a slot of `row_type`.
+    """
+    connection = await session.connection()
+    result = await connection.execute(stmt)
+    try:
+        # The asyncpg cursor already holds every record of the (buffered) result
+        cursor = result.cursor
+        records = cursor.fetchall()
+        columns: list[tuple[Callable[[Any, Any], None], Callable[[Any], Any] | None]] = [
+            (
+                getattr(row_type, description[0]).__set__,
+                column.type.dialect_impl(connection.dialect).result_processor(connection.dialect, description[1]),
+            )
+            for column, description in zip(stmt.selected_columns, cursor.description, strict=True)
+        ]
+    finally:
+        result.close()
+    rows = []
+    for record in records:
+        row = row_type.__new__(row_type)
+        for (set_value, process), value in zip(columns, record, strict=True):
+            set_value(row, value if process is None or value is None else process(value))
+        rows.append(row)
+    return rows
@@ -1,7 +1,30 @@
+from collections.abc import Callable, Sequence
+from datetime import datetime
+from typing import Any, TypeVar
+
 import strawberry
 
+from products_app.context import Context
+from products_app.extensions import (
+    DocumentCacheExtension,
+    MetricsExtension,
+    QueryCostExtension,
+    SQLStatsExtension,
+    UnitOfWorkExtension,
+)
 from products_app.models import ProductStatus
+from products_app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    decode_change_cursor,
+    decode_cursor,
+    encode_change_cursor,
+    encode_cursor,
+    validate_page_size,
+)
+from products_app.rows import ProductChangeRow, ProductRow
+from products_app.selection import requested_fields
 from products_app.services import ProductService
+from products_app.settings import settings
 
 
 @strawberry.federation.type(keys=["id"])
@@ -11,6 +34,58 @@ class ProductType:
     price: float
     status: ProductStatus
 
+    @classmethod
+    async def resolve_reference(cls, info: strawberry.Info[Context, None], id: strawberry.ID) -> "ProductType | None":
+        # Every representation of one `_entities` call is collected into a single batched lookup
+        product = await info.context.products_by_id.load(int(id))
+        if product:
+            return cls(id=product.id, name=product.name, price=product.price, status=product.status)
+        return None
+
+
+# Both subgraphs page with this type, so the gateway must be allowed to resolve it from either
+@strawberry.federation.type(shareable=True)
+class PageInfo:
+    has_next_page: bool
+    end_cursor: str | None
+
+
+@strawberry.type
+class ProductEdge:
+    cursor: str
+    # Listings serve the read path's plain rows as products as they are, without copying them
+    node: ProductRow = strawberry.field(graphql_type=ProductType)
+
+
+@strawberry.type
+class ProductConnection:
+    edges: list[ProductEdge]
+    page_info: PageInfo
+
+
+@strawberry.type
+class ProductChange:
+    cursor: str
+    id: int
+    deleted: bool
+    changed_at: datetime
+    # The product as of now, `null` once deleted
+    product: ProductRow | None = strawberry.field(graphql_type=ProductType | None)
+
+
+@strawberry.type
+class ProductChangeFeed:
+    changes: list[ProductChange]
+    # Where to resume from: the cursor of the last change, or the given one when nothing changed since
+    cursor: str | None
+    has_more: bool
+
+
+@strawberry.type
+class CreateProductResult:
+    product: ProductType | None
+    error: str | None
+
 
 @strawberry.input
 class ProductInput:
@@ -19,23 +94,96 @@ class ProductInput:
     status: ProductStatus = ProductStatus.ACTIVE
 
 
+R = TypeVar("R", bound=ProductRow)
+
+
+def build_product_connection(
+    products: Sequence[R], first: int, sort_key: Callable[[R], tuple[Any, ...]]
+) -> ProductConnection:
+    """
+    Builds a connection page from up to `first + 1` rows, the extra row only signalling that another page exists
+    """
+    edges = [
+        ProductEdge(
+            cursor=encode_cursor(*sort_key(product)),
+            node=product,
+        )
+        for product in products[:first]
+    ]
+    return ProductConnection(
+        edges=edges,
+        page_info=PageInfo(has_next_page=len(products) > first, end_cursor=edges[-1].cursor if edges else None),
+    )
+
+
+def build_change_feed(changes: Sequence[ProductChangeRow], first: int, cursor: str | None) -> ProductChangeFeed:
+    """
+    Builds a change feed page from up to `first + 1` changes, the extra one only signalling that more are pending
+    """
+    page = [
+        ProductChange(
+            cursor=encode_change_cursor(change.xact_id, change.id),
+            id=change.id,
+            deleted=change.deleted,
+            changed_at=change.changed_at,
+            product=None if change.deleted else change,
+        )
+        for change in changes[:first]
+    ]
+    return ProductChangeFeed(changes=page, cursor=page[-1].cursor if page else cursor, has_more=len(changes) > first)
+
+
 @strawberry.type
 class Query:
     @strawberry.field
-    async def search_active_products_by_name(self, search: str) -> list[ProductType]:
-        products = await ProductService.search_products_by_name(search)
-        return [
-            ProductType(id=product.id, name=product.name, price=product.price, status=product.status)
-            for product in products
-        ]
+    async def search_active_products_by_name(
+        self, search: str, first: int = DEFAULT_PAGE_SIZE, after: str | None = None
+    ) -> ProductConnection:
+        cursor = decode_cursor(after, float, int) if after else None
+        ranked = await ProductService.search_products_by_name(
+            search, validate_page_size(first) + 1, (cursor[0], cursor[1]) if cursor else None
+        )
+        return build_product_connection(ranked, first, lambda product: (product.rank, product.id))
 
     @strawberry.field
-    async def get_active_products_sorted_by_id(self) -> list[ProductType]:
-        products = await ProductService.get_active_products()
-        return [
-            ProductType(id=product.id, name=product.name, price=product.price, status=product.status)
-            for product in products
-        ]
+    async def suggest_products(self, prefix: str, limit: int = 10) -> list[str]:
+        return await ProductService.suggest_product_names(prefix, limit)
+
+    @strawberry.field
+    async def get_active_products_sorted_by_id(
+        self, first: int = DEFAULT_PAGE_SIZE, after: str | None = None
+    ) -> ProductConnection:
+        (after_id,) = decode_cursor(after, int) if after else (None,)
+        products = await ProductService.get_active_products(validate_page_size(first) + 1, after_id)
+        return build_product_connection(products, first, lambda product: (product.id,))
+
+    @strawberry.field
+    async def active_products_by_price(
+        self,
+        info: strawberry.Info[Context, None],
+        min_price: float | None = None,
+        max_price: float | None = None,
+        first: int = DEFAULT_PAGE_SIZE,
+        after: str | None = None,
+    ) -> ProductConnection:
+        cursor = decode_cursor(after, float, int) if after else None
+        products = await ProductService.get_active_products_by_price(
+            min_price,
+            max_price,
+            validate_page_size(first) + 1,
+            (cursor[0], cursor[1]) if cursor else None,
+            requested_fields(info.selected_fields[0].selections, "edges", "node"),
+        )
+        return build_product_connection(products, first, lambda product: (product.price, product.id))
+
+    @strawberry.field
+    async def products_changed_since(
+        self, cursor: str | None = None, first: int = DEFAULT_PAGE_SIZE
+    ) -> ProductChangeFeed:
+        # Products created, updated or deleted after `cursor` (from the start without one), oldest first
+        after = decode_change_cursor(cursor) if cursor else None
+        changes = await ProductService.get_changes_since(after, validate_page_size(first) + 1)
+        return build_change_feed(changes, first, cursor)
 
 
 @strawberry.type
@@ -45,6 +193,20 @@ class Mutation:
         product = await ProductService.create_product(inp)
         return ProductType(id=product.id, name=product.name, price=product.price, status=product.status)
 
+    @strawberry.mutation
+    async def create_products(self, inputs: list[ProductInput]) -> list[CreateProductResult]:
+        if len(inputs) > settings.BULK_MAX_ITEMS:
+            raise ValueError(f"At most {settings.BULK_MAX_ITEMS} products can be created at once")
+        return [
+            CreateProductResult(
+                product=ProductType(id=product.id, name=product.name, price=product.price, status=product.status)
+                if product
+                else None,
+                error=error,
+            )
+            for product, error in await ProductService.create_products(inputs)
+        ]
+
     @strawberry.mutation
     async def update_product(self, product_id: int, input: ProductInput) -> ProductType | None:
         product = await ProductService.update_product(product_id, input)
@@ -60,4 +222,15 @@ class Mutation:
         return f"Product {product_id} not found."
 
 
-schema = strawberry.federation.Schema(query=Query, mutation=Mutation, enable_federation_2=True)
+schema = strawberry.federation.Schema(
+    query=Query,
+    mutation=Mutation,
+    extensions=[
+        MetricsExtension,
+        SQLStatsExtension,
+        DocumentCacheExtension,
+        QueryCostExtension,
+        UnitOfWorkExtension,
+    ],
+    enable_federation_2=True,
+)
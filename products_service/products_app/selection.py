@@ -0,0 +1,18 @@
+from strawberry.types.nodes import FragmentSpread, InlineFragment, SelectedField, Selection
+from strawberry.utils.str_converters import to_snake_case
+
+
+def requested_fields(selections: list[Selection], *path: str) -> set[str]:
+    """
+    Python names of the fields a query selects below `path` (GraphQL field names), fragments included
+    """
+    fields: set[str] = set()
+    for selection in selections:
+        if isinstance(selection, (FragmentSpread, InlineFragment)):
+            fields |= requested_fields(selection.selections, *path)
+        elif isinstance(selection, SelectedField):
+            if not path:
+                fields.add(to_snake_case(selection.name))
+            elif selection.name == path[0]:
+                fields |= requested_fields(selection.selections, *path[1:])
+    return fields
@@ -1,46 +1,259 @@
-from products_app.db import get_session
+import asyncio
+import json
+import secrets
+from collections.abc import Collection, Sequence
+from typing import Any, TypeVar
+
+from products_app.cache import LRUCache, MemoryCacheBackend, cache_get_many, cache_invalidate, cache_set, get_cache
+from products_app.db import after_commit, get_session, init_db, record_write, replica_may_lag
 from products_app.models import Product
 from products_app.repository import ProductRepository
+from products_app.rows import ProductChangeRow, ProductRow, RankedProductRow
+from products_app.settings import settings
+
+# Shorter prefixes match too much of the catalog (and yield no trigrams to probe the index with)
+MIN_SUGGEST_PREFIX_LENGTH = 3
+MAX_SUGGESTIONS = 20
+
+# Length bounds of `Product.name`, checked before bulk inserts so one bad item cannot fail the batch
+MIN_PRODUCT_NAME_LENGTH = 3
+MAX_PRODUCT_NAME_LENGTH = 500
+
+suggestions_cache: LRUCache[tuple[str, int], list[str]] = LRUCache(
+    settings.SUGGEST_CACHE_SIZE, settings.SUGGEST_CACHE_TTL_SECONDS
+)
+
+PRODUCT_FIELDS = ProductRow.__slots__
+
+# Every cached list (active listings, search pages) is keyed under the current lists version, which any write
+# replaces: stale lists are never read again and expire on their own, without scanning the keyspace for them
+LISTS_VERSION_KEY = "products:lists:version"
+# Outlives the lists cached under it; a version expired or evicted early only starts a new, empty generation
+LISTS_VERSION_TTL_SECONDS = 86_400.0
+
+
+def product_key(product_id: int) -> str:
+    return f"products:id:{product_id}"
+
+
+async def lists_version() -> str:
+    (version,) = await cache_get_many([LISTS_VERSION_KEY])
+    if version is None:
+        # Lists cached under a lost version may be stale, so never fall back to an older one
+        return await bump_lists_version()
+    return version.decode()
+
+
+async def bump_lists_version() -> str:
+    version = secrets.token_hex(8)
+    await cache_set(LISTS_VERSION_KEY, version.encode(), LISTS_VERSION_TTL_SECONDS)
+    return version
+
+
+async def list_key(*args: Any) -> str:
+    return f"products:list:{await lists_version()}:" + json.dumps(args, separators=(",", ":"))
+
+
+async def cache_fill(key: str, value: bytes) -> None:
+    # Read-through fills are skipped while a replica may still serve the values a recent write replaced
+    if not replica_may_lag():
+        await cache_set(key, value)
+
+
+async def invalidate_products(keys: list[str]) -> None:
+    await cache_invalidate(keys)
+    await bump_lists_version()
+
+
+def dump_products(products: list[Product]) -> bytes:
+    return json.dumps([product.model_dump(mode="json") for product in products]).encode()
+
+
+def load_products(data: bytes) -> list[Product]:
+    return [Product.model_validate(item) for item in json.loads(data)]
+
+
+R = TypeVar("R", bound=ProductRow)
+
+
+def dump_rows(rows: Sequence[ProductRow]) -> bytes:
+    return json.dumps([row.to_json() for row in rows]).encode()
+
+
+def load_rows(data: bytes, row_type: type[R]) -> list[R]:
+    return [row_type.from_json(values) for values in json.loads(data)]
+
+
+async def evict_changed_products(product_ids: set[str] | None) -> None:
+    """
+    Drops process-local entries of products changed by any replica (`None`: possibly every product)
+    """
+    # Replica reads right after the write are not cached, or a lagging replica could put the old values back
+    record_write()
+    suggestions_cache.clear()
+    cache = get_cache()
+    if not isinstance(cache, MemoryCacheBackend):
+        # Only in-process entries need evicting, a shared cache was already invalidated by the replica that wrote
+        return
+    if product_ids is None:
+        cache.clear()
+    else:
+        await invalidate_products([product_key(int(product_id)) for product_id in product_ids])
 
 
 class ProductService:
     @staticmethod
     async def get_product_by_id(product_id: int) -> Product | None:
+        (product,) = await ProductService.get_products_by_ids([product_id])
+        return product
+
+    @staticmethod
+    async def get_products_by_ids(product_ids: list[int]) -> list[Product | None]:
+        """
+        Loads many products, returned in the order of `product_ids` (None for unknown ids).
+        Cached products are served from the cache, the rest are read in one query and cached.
+        """
+        cached = await cache_get_many([product_key(product_id) for product_id in product_ids])
+        by_id = {product.id: product for data in cached if data is not None for product in load_products(data)}
+        missing = [product_id for product_id in product_ids if product_id not in by_id]
+        if missing:
+            async with get_session() as session:
+                products = await ProductRepository.get_products_by_ids(missing, session)
+            for product in products:
+                by_id[product.id] = product
+                await cache_fill(product_key(product.id), dump_products([product]))
+        return [by_id.get(product_id) for product_id in product_ids]
+
+    @staticmethod
+    async def get_active_products(limit: int, after_id: int | None = None) -> list[ProductRow]:
+        key = await list_key("active", limit, after_id)
+        (cached,) = await cache_get_many([key])
+        if cached is not None:
+            return load_rows(cached, ProductRow)
         async with get_session() as session:
-            return await ProductRepository.get_product_by_id(product_id, session)
+            products = await ProductRepository.get_active_products(limit, after_id, session)
+        await cache_fill(key, dump_rows(products))
+        return products
 
     @staticmethod
-    async def get_active_products() -> list[Product]:
+    async def get_active_products_by_price(
+        min_price: float | None,
+        max_price: float | None,
+        limit: int,
+        after: tuple[float, int] | None = None,
+        fields: Collection[str] = PRODUCT_FIELDS,
+    ) -> list[ProductRow]:
         async with get_session() as session:
-            return await ProductRepository.get_active_products(session)
+            return await ProductRepository.get_active_products_by_price(
+                min_price, max_price, limit, after, fields, session
+            )
 
     @staticmethod
-    async def search_products_by_name(search: str) -> list[Product]:
+    async def search_products_by_name(
+        search: str, limit: int, after: tuple[float, int] | None = None
+    ) -> list[RankedProductRow]:
+        key = await list_key("search", search, limit, after)
+        (cached,) = await cache_get_many([key])
+        if cached is not None:
+            return load_rows(cached, RankedProductRow)
         async with get_session() as session:
-            return await ProductRepository.search_products_by_name(search, session)
+            ranked = await ProductRepository.search_products_by_name(search, limit, after, session)
+        await cache_fill(key, dump_rows(ranked))
+        return ranked
+
+    @staticmethod
+    async def suggest_product_names(prefix: str, limit: int) -> list[str]:
+        """
+        Top `limit` active product names starting with `prefix`, answered within the configured latency budget.
+        Recent prefixes are served from an in-process LRU; a lookup over budget yields no suggestions.
+        """
+        if not 1 <= limit <= MAX_SUGGESTIONS:
+            raise ValueError(f"`limit` must be between 1 and {MAX_SUGGESTIONS}")
+        prefix = prefix.strip()
+        if len(prefix) < MIN_SUGGEST_PREFIX_LENGTH:
+            return []
+        key = (prefix.lower(), limit)
+        names = suggestions_cache.get(key)
+        if names is not None:
+            return names
+        try:
+            async with asyncio.timeout(settings.SUGGEST_LATENCY_BUDGET_MS / 1000):
+                # A cancelled lookup must not disturb the operation's shared session
+                async with get_session(isolated=True) as session:
+                    names = await ProductRepository.suggest_product_names(prefix, limit, session)
+        except TimeoutError:
+            return []
+        if not replica_may_lag():
+            suggestions_cache.set(key, names)
+        return names
+
+    @staticmethod
+    async def get_changes_since(after: tuple[int, int] | None, limit: int) -> list[ProductChangeRow]:
+        # Never cached: a consumer resyncing incrementally wants the changes as of now. Always read from the primary:
+        # only it knows every transaction still in flight, and replicas lag behind each other, so a consumer moving
+        # between them could pass changes one of them has not replayed yet
+        async with init_db()() as session:
+            return await ProductRepository.get_changes_since(after, limit, session)
 
     @staticmethod
     async def create_product(inp: "ProductInput") -> Product:  # type: ignore  # noqa
         async with get_session() as session:
             product = Product(name=inp.name, price=inp.price, status=inp.status)
-            return await ProductRepository.create_product(product, session)
+            product = await ProductRepository.create_product(product, session)
+        await after_commit(invalidate_products, [])
+        return product
+
+    @staticmethod
+    async def create_products(inputs: list["ProductInput"]) -> list[tuple[Product | None, str | None]]:  # type: ignore  # noqa
+        """
+        Creates many products at once, returning `(product, None)` or `(None, error)` in the order of `inputs`.
+        Invalid items are rejected up front; the valid ones are inserted in a single statement.
+        """
+        errors: list[str | None] = []
+        seen: set[str] = set()
+        for inp in inputs:
+            if not MIN_PRODUCT_NAME_LENGTH <= len(inp.name) <= MAX_PRODUCT_NAME_LENGTH:
+                errors.append(
+                    f"Name must be between {MIN_PRODUCT_NAME_LENGTH} and {MAX_PRODUCT_NAME_LENGTH} characters"
+                )
+            elif inp.name in seen:
+                errors.append(f"Duplicate name {inp.name!r} in the same batch")
+            else:
+                errors.append(None)
+            seen.add(inp.name)
+        rows = [
+            {"name": inp.name, "price": inp.price, "status": inp.status}
+            for inp, error in zip(inputs, errors, strict=True)
+            if error is None
+        ]
+        created: dict[str, Product] = {}
+        if rows:
+            async with get_session() as session:
+                created = {product.name: product for product in await ProductRepository.create_products(rows, session)}
+            await after_commit(invalidate_products, [])
+        results: list[tuple[Product | None, str | None]] = []
+        for inp, error in zip(inputs, errors, strict=True):
+            if error is not None:
+                results.append((None, error))
+            elif inp.name in created:
+                results.append((created[inp.name], None))
+            else:
+                results.append((None, f"Product {inp.name!r} already exists"))
+        return results
 
     @staticmethod
     async def update_product(product_id: int, inp: "ProductInput") -> Product | None:  # type: ignore  # noqa
         async with get_session() as session:
-            product = await ProductRepository.get_product_by_id(product_id, session)
-            if product:
-                product.name = inp.name
-                product.price = inp.price
-                product.status = inp.status
-                return await ProductRepository.update_product(product, session)
-            return None
+            values = {"name": inp.name, "price": inp.price, "status": inp.status}
+            product = await ProductRepository.update_product(product_id, values, session)
+        if product:
+            await after_commit(invalidate_products, [product_key(product_id)])
+        return product
 
     @staticmethod
     async def delete_product(product_id: int) -> bool:
         async with get_session() as session:
-            product = await ProductRepository.get_product_by_id(product_id, session)
-            if product:
-                await ProductRepository.delete_product(product, session)
-                return True
-            return False
+            deleted = await ProductRepository.delete_product(product_id, session)
+        if deleted:
+            await after_commit(invalidate_products, [product_key(product_id)])
+        return deleted
@@ -1,3 +1,4 @@
+from typing import Literal
 from urllib.parse import quote
 
 from pydantic import computed_field
@@ -11,6 +12,34 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     POSTGRES_HOST: str
     POSTGRES_PORT: int
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    SLOW_QUERY_MS: int = 200
+    SQL_STATS_IN_RESPONSE: bool = False
+    DATABASE_REPLICA_URIS: list[str] = []
+    REPLICA_ROUTING: Literal["round_robin", "least_loaded"] = "least_loaded"
+    READ_YOUR_WRITES_SECONDS: float = 0.0
+    CACHE_BACKEND: Literal["memory", "redis", "none"] = "memory"
+    CACHE_TTL_SECONDS: float = 60.0
+    CACHE_MAX_ENTRIES: int = 10_000
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    CACHE_TIMEOUT_MS: int = 100
+    INVALIDATION_LISTEN: bool = True
+    INVALIDATION_COALESCE_MS: int = 50
+    PERSISTED_QUERIES_MAX_ENTRIES: int = 10_000
+    DOCUMENT_CACHE_MAX_ENTRIES: int = 1_000
+    COST_MAX_PER_OPERATION: int = 10_000
+    COST_DEFAULT_LIST_SIZE: int = 10
+    COST_CONCURRENCY_LIMIT: int = 50_000
+    COST_QUEUE_TIMEOUT_MS: int = 1_000
+    BULK_MAX_ITEMS: int = 10_000
+    BULK_COPY_THRESHOLD: int = 1_000
+    SUGGEST_LATENCY_BUDGET_MS: int = 100
+    SUGGEST_CACHE_SIZE: int = 1024
+    SUGGEST_CACHE_TTL_SECONDS: float = 30.0
 
     @computed_field  # type: ignore
     @property
@@ -2,32 +2,44 @@ from collections.abc import AsyncGenerator
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 from sqlmodel import SQLModel
 
 from products_app.app import create_app
-from products_app.db import get_db_engine, get_session
+from products_app.db import dispose_db, get_db_engine
 from products_app.models import Product, ProductStatus
+from products_app.services import suggestions_cache
 from products_app.settings import settings
 
 
-async def seed_data() -> None:
+async def seed_data(engine: AsyncEngine) -> None:
     """Seed the database with initial test data."""
     product1 = Product(name="Product 1", price=10.0, status=ProductStatus.ACTIVE)
     product2 = Product(name="Product 2", price=20.0, status=ProductStatus.INACTIVE)
 
-    async with get_session() as session:
+    async with async_sessionmaker(engine, class_=AsyncSession)() as session:
         session.add_all([product1, product2])
         await session.commit()
 
 
+@pytest.fixture(scope="function")
+async def engine() -> AsyncGenerator[AsyncEngine, None]:
+    """Engine owned by the test itself, separate from the app's lifespan-managed pool."""
+    engine = get_db_engine(settings.DATABASE_URI)
+    yield engine
+    await engine.dispose()
+
+
 @pytest.fixture(scope="function", autouse=True)
-async def setup_test_env() -> AsyncGenerator[None, None]:
+async def setup_test_env(engine: AsyncEngine) -> AsyncGenerator[None, None]:
     """Sets up the database environment for testing."""
-    engine = get_db_engine(settings.DATABASE_URI)
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
-    await seed_data()
+    await seed_data(engine)
+    suggestions_cache.clear()
     yield
+    # Drop the process-wide engine if the test used services directly, outside the app lifespan
+    await dispose_db()
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.drop_all)
 
@@ -0,0 +1,75 @@
+import asyncio
+import time
+from collections.abc import Sequence
+
+
+class FakeRedisServer:
+    """In-loop stand-in for Redis, speaking just the RESP2 commands the cache backend uses."""
+
+    def __init__(self) -> None:
+        self.data: dict[bytes, tuple[float | None, bytes]] = {}
+        self.commands: list[bytes] = []
+        # Seconds to wait before every reply, to stand in for a stalled server
+        self.delay = 0.0
+        self._server: asyncio.Server | None = None
+
+    @property
+    def url(self) -> str:
+        assert self._server is not None
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+
+    async def stop(self) -> None:
+        assert self._server is not None
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _get(self, key: bytes) -> bytes | None:
+        expires_at, value = self.data.get(key, (None, None))
+        if value is None or (expires_at is not None and expires_at < time.monotonic()):
+            return None
+        return value
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n")
+                args = []
+                for _ in range(int(header[1:-2])):
+                    size = int((await reader.readuntil(b"\r\n"))[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                reply = self._reply(args)
+                await asyncio.sleep(self.delay)
+                writer.write(reply)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, OSError):
+            writer.close()
+
+    def _reply(self, args: list[bytes]) -> bytes:
+        command = args[0].upper()
+        self.commands.append(command)
+        if command in (b"AUTH", b"SELECT"):
+            return b"+OK\r\n"
+        if command == b"SET":
+            ttl = int(args[4]) / 1000 if len(args) > 4 and args[3].upper() == b"PX" else None
+            self.data[args[1]] = (time.monotonic() + ttl if ttl is not None else None, args[2])
+            return b"+OK\r\n"
+        if command == b"MGET":
+            return encode_array([self._get(key) for key in args[1:]])
+        if command == b"DEL":
+            deleted = sum(self.data.pop(key, None) is not None for key in args[1:])
+            return b":%d\r\n" % deleted
+        return b"-ERR unknown command\r\n"
+
+
+def encode_bulk(value: bytes | None) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def encode_array(values: Sequence[bytes | None]) -> bytes:
+    return b"*%d\r\n" % len(values) + b"".join(encode_bulk(value) for value in values)
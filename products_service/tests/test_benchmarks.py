@@ -0,0 +1,147 @@
+import time
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from products_app import db
+from products_app.models import Product
+
+ENTITIES_QUERY = """
+query Entities($representations: [_Any!]!) {
+  _entities(representations: $representations) {
+    ... on ProductType {
+      name
+    }
+  }
+}
+"""
+
+
+@pytest.fixture
+async def seed_products(engine: AsyncEngine) -> list[int]:
+    """Seed enough products to resolve large reference batches."""
+    async with async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)() as session:
+        products = [Product(name=f"Bulk product {i}", price=float(i)) for i in range(500)]
+        session.add_all(products)
+        await session.commit()
+        return [product.id for product in products]
+
+
+@pytest.mark.parametrize("references", [1, 10, 100, 500])
+async def test_resolve_reference_query_count_scaling(
+    client: TestClient, seed_products: list[int], references: int
+) -> None:
+    """Test that resolving N product references costs one SQL statement regardless of N."""
+    statements: list[str] = []
+
+    def count(_conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        statements.append(statement)
+
+    assert db._engine is not None
+    event.listen(db._engine.sync_engine, "before_cursor_execute", count)
+    try:
+        representations = [{"__typename": "ProductType", "id": i} for i in seed_products[:references]]
+        response = client.post(
+            "/graphql", json={"query": ENTITIES_QUERY, "variables": {"representations": representations}}
+        )
+    finally:
+        event.remove(db._engine.sync_engine, "before_cursor_execute", count)
+
+    data = response.json()["data"]["_entities"]
+    assert [product["name"] for product in data] == [f"Bulk product {i}" for i in range(references)]
+    assert len(statements) == 1
+
+
+# Rows per second a bulk create must sustain: a few times below what a statement per batch achieves, and above what a
+# statement per row would. The fixed cost of the request dominates small batches.
+@pytest.mark.parametrize(("rows", "min_rows_per_second"), [(100, 500), (5000, 5_000)])
+async def test_create_products_throughput(client: TestClient, rows: int, min_rows_per_second: int) -> None:
+    """Test that a bulk create is a fixed number of statements, at a floor of rows per second."""
+    statements: list[str] = []
+
+    def count(_conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        statements.append(statement)
+
+    mutation = """
+    mutation CreateProducts($inputs: [ProductInput!]!) {
+      createProducts(inputs: $inputs) {
+        error
+      }
+    }
+    """
+    inputs = [{"name": f"Imported product {i}", "price": float(i)} for i in range(rows)]
+    client.get("/stats")  # the lifespan creates the engine
+    assert db._engine is not None
+    event.listen(db._engine.sync_engine, "before_cursor_execute", count)
+    try:
+        start = time.perf_counter()
+        response = client.post("/graphql", json={"query": mutation, "variables": {"inputs": inputs}})
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(db._engine.sync_engine, "before_cursor_execute", count)
+
+    results = response.json()["data"]["createProducts"]
+    assert [result["error"] for result in results] == [None] * rows
+    assert len(statements) <= 4
+    assert rows / elapsed >= min_rows_per_second, f"{rows / elapsed:,.0f} rows/sec"
+
+
+@pytest.mark.parametrize(
+    ("mutation", "expected"),
+    [
+        (
+            'mutation { updateProduct(productId: 1, input: {name: "Renamed", price: 5.0}) { name } }',
+            {"name": "Renamed"},
+        ),
+        ('mutation { updateProduct(productId: 999, input: {name: "Missing", price: 5.0}) { name } }', None),
+        ("mutation { deleteProduct(productId: 1) }", "Product 1 deleted successfully."),
+        ("mutation { deleteProduct(productId: 999) }", "Product 999 not found."),
+    ],
+)
+async def test_write_is_single_statement(client: TestClient, mutation: str, expected: Any) -> None:
+    """Test that updating or deleting a product, found or not, costs one SQL statement."""
+    statements: list[str] = []
+
+    def count(_conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        statements.append(statement)
+
+    client.get("/stats")  # the lifespan creates the engine
+    assert db._engine is not None
+    event.listen(db._engine.sync_engine, "before_cursor_execute", count)
+    try:
+        response = client.post("/graphql", json={"query": mutation})
+    finally:
+        event.remove(db._engine.sync_engine, "before_cursor_execute", count)
+
+    (data,) = response.json()["data"].values()
+    assert data == expected
+    assert len(statements) == 1
+
+
+async def test_price_listing_reads_only_requested_columns(client: TestClient) -> None:
+    """Test that the price listing selects the requested columns plus its cursor keys, nothing more."""
+    statements: list[str] = []
+
+    def capture(_conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        statements.append(statement)
+
+    client.get("/stats")  # the lifespan creates the engine
+    assert db._engine is not None
+    event.listen(db._engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        response = client.post(
+            "/graphql", json={"query": "query { activeProductsByPrice { edges { node { name } } } }"}
+        )
+    finally:
+        event.remove(db._engine.sync_engine, "before_cursor_execute", capture)
+
+    assert response.json()["data"]["activeProductsByPrice"]["edges"] == [{"node": {"name": "Product 1"}}]
+    (statement,) = statements
+    assert statement[len("SELECT ") : statement.index(" \nFROM")].split(", ") == [
+        "product.id",
+        "product.name",
+        "product.price",
+    ]
@@ -0,0 +1,139 @@
+import asyncio
+from collections.abc import AsyncGenerator
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from products_app import cache, db
+from products_app.cache import MemoryCacheBackend, RedisCacheBackend
+from products_app.services import LISTS_VERSION_KEY, ProductService, list_key, product_key
+from tests.fake_redis import FakeRedisServer
+
+ACTIVE_PRODUCTS_QUERY = "query { getActiveProductsSortedById { edges { node { name } } } }"
+
+
+@pytest.fixture
+async def fake_redis() -> AsyncGenerator[FakeRedisServer, None]:
+    """Start a Redis-protocol fake on a free local port."""
+    server = FakeRedisServer()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+@pytest.fixture
+async def redis_cache(fake_redis: FakeRedisServer) -> AsyncGenerator[RedisCacheBackend, None]:
+    """Install a Redis backend (talking to the fake) as the process-wide cache."""
+    backend = RedisCacheBackend(fake_redis.url, timeout=1)
+    cache._cache = backend
+    yield backend
+    await cache.dispose_cache()
+
+
+def count_statements(client: TestClient, query: str) -> int:
+    """Run a GraphQL query and return how many SQL statements it executed."""
+    statements: list[str] = []
+
+    def capture(_conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        statements.append(statement)
+
+    assert db._engine is not None
+    event.listen(db._engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        assert "errors" not in client.post("/graphql", json={"query": query}).json()
+    finally:
+        event.remove(db._engine.sync_engine, "before_cursor_execute", capture)
+    return len(statements)
+
+
+async def test_memory_backend_evicts_least_recently_used() -> None:
+    """Test LRU eviction, TTL expiry and hit/miss/eviction counters of the in-process backend."""
+    backend = MemoryCacheBackend(maxsize=2, ttl=60)
+    await backend.set("a", b"1", 60)
+    await backend.set("b", b"2", 60)
+    assert await backend.get("a") == b"1"
+    await backend.set("c", b"3", 60)  # evicts "b", the least recently used
+    await backend.set("d", b"4", -1)  # already expired, evicts "a"
+
+    assert await backend.get_many(["a", "b", "c", "d"]) == [None, None, b"3", None]
+    assert backend.get_stats() == {"hits": 2, "misses": 3, "evictions": 2, "errors": 0, "entries": 1}
+
+
+async def test_reads_are_cached_and_invalidated_by_mutations(client: TestClient) -> None:
+    """Test that repeated reads skip the database until a mutation invalidates them."""
+    assert count_statements(client, ACTIVE_PRODUCTS_QUERY) == 1
+    assert count_statements(client, ACTIVE_PRODUCTS_QUERY) == 0
+
+    mutation = """
+    mutation {
+      updateProduct(productId: 1, input: {name: "Renamed product", price: 1.0, status: ACTIVE}) {
+        id
+      }
+    }
+    """
+    client.post("/graphql", json={"query": mutation})
+
+    assert count_statements(client, ACTIVE_PRODUCTS_QUERY) == 1
+    response = client.post("/graphql", json={"query": ACTIVE_PRODUCTS_QUERY}).json()
+    assert response["data"]["getActiveProductsSortedById"]["edges"] == [{"node": {"name": "Renamed product"}}]
+
+    stats = client.get("/stats").json()["cache"]
+    # Every listing lookup reads the lists version first
+    assert stats["hits"] == 2 + 3
+    assert stats["misses"] == 2 + 1
+
+
+async def test_redis_backend_read_through(redis_cache: RedisCacheBackend, fake_redis: FakeRedisServer) -> None:
+    """Test the read-through paths against the Redis-protocol backend."""
+    (product,) = await ProductService.get_active_products(10)
+    listing_key = await list_key("active", 10, None)
+    assert fake_redis.data.keys() == {LISTS_VERSION_KEY.encode(), listing_key.encode()}
+
+    expected = {"id": product.id, "name": product.name, "price": product.price, "status": product.status}
+    assert (await ProductService.get_product_by_id(product.id)).model_dump() == expected  # type: ignore[union-attr]
+    assert product_key(product.id).encode() in fake_redis.data
+    assert (await ProductService.get_product_by_id(product.id)).model_dump() == expected  # type: ignore[union-attr]
+    assert redis_cache.get_stats() == {"hits": 2, "misses": 3, "evictions": 0, "errors": 0}
+
+    await ProductService.delete_product(product.id)
+    # Writes delete the product and replace the lists version, instead of scanning for the lists to delete
+    assert product_key(product.id).encode() not in fake_redis.data
+    assert await list_key("active", 10, None) != listing_key
+    assert b"SCAN" not in fake_redis.commands
+    assert await ProductService.get_active_products(10) == []
+
+
+async def test_unreachable_cache_falls_back_to_database(fake_redis: FakeRedisServer) -> None:
+    """Test that cache failures are counted but never fail reads."""
+    url = fake_redis.url
+    await fake_redis.stop()
+    backend = RedisCacheBackend(url, timeout=1)
+    cache._cache = backend
+    try:
+        products = await ProductService.get_active_products(10)
+    finally:
+        await cache.dispose_cache()
+
+    assert [product.name for product in products] == ["Product 1"]
+    # Reading and starting the lists version, then reading and writing the listing
+    assert backend.stats.errors == 4
+
+
+async def test_stalled_cache_times_out_without_desyncing_replies(
+    redis_cache: RedisCacheBackend, fake_redis: FakeRedisServer
+) -> None:
+    """Test that a command timing out is skipped, and its late reply is never read as the next command's."""
+    await redis_cache.set("a", b"1", 60)
+    await redis_cache.set("b", b"2", 60)
+    redis_cache.timeout = 0.05
+    fake_redis.delay = 0.2
+
+    assert await cache.cache_get_many(["a"]) == [None]
+    assert redis_cache.stats.errors == 1
+
+    fake_redis.delay = 0
+    assert await redis_cache.get("b") == b"2"
+    # Let the stalled reply be written to the dropped connection
+    await asyncio.sleep(0.2)
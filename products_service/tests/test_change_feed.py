@@ -0,0 +1,86 @@
+from typing import Any
+
+import sqlalchemy as sa
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+FEED_QUERY = """
+query Feed($cursor: String, $first: Int!) {
+  productsChangedSince(cursor: $cursor, first: $first) {
+    changes { id deleted product { name price } }
+    cursor
+    hasMore
+  }
+}
+"""
+
+
+def changes_since(client: TestClient, cursor: str | None, first: int = 10) -> dict[str, Any]:
+    response = client.post("/graphql", json={"query": FEED_QUERY, "variables": {"cursor": cursor, "first": first}})
+    feed: dict[str, Any] = response.json()["data"]["productsChangedSince"]
+    return feed
+
+
+async def test_feed_pages_through_every_product(client: TestClient) -> None:
+    """Test that the feed starts with every product, oldest first, a page at a time."""
+    first = changes_since(client, None, first=1)
+    assert first["changes"] == [{"id": 1, "deleted": False, "product": {"name": "Product 1", "price": 10.0}}]
+    assert first["hasMore"]
+
+    second = changes_since(client, first["cursor"], first=1)
+    assert [change["id"] for change in second["changes"]] == [2]
+    last = changes_since(client, second["cursor"])
+    assert last == {"changes": [], "cursor": second["cursor"], "hasMore": False}
+
+
+async def test_feed_reports_updates_and_deletes_once(client: TestClient) -> None:
+    """Test that resuming from a cursor yields only what changed since, deletes included as tombstones."""
+    cursor = changes_since(client, None)["cursor"]
+    update = 'mutation { updateProduct(productId: 2, input: {name: "Product 2", price: 25.0}) { id } }'
+    client.post("/graphql", json={"query": update})
+    client.post("/graphql", json={"query": "mutation { deleteProduct(productId: 1) }"})
+
+    feed = changes_since(client, cursor)
+
+    assert feed["changes"] == [
+        {"id": 2, "deleted": False, "product": {"name": "Product 2", "price": 25.0}},
+        {"id": 1, "deleted": True, "product": None},
+    ]
+    assert changes_since(client, feed["cursor"])["changes"] == []
+
+
+async def test_feed_skips_updates_that_change_nothing(client: TestClient) -> None:
+    """Test that an update writing the same values does not show up as a change."""
+    cursor = changes_since(client, None)["cursor"]
+    update = 'mutation { updateProduct(productId: 1, input: {name: "Product 1", price: 10.0}) { id } }'
+    client.post("/graphql", json={"query": update})
+
+    assert changes_since(client, cursor)["changes"] == []
+
+
+async def test_feed_holds_back_changes_behind_a_transaction_in_flight(client: TestClient, engine: AsyncEngine) -> None:
+    """Test that a transaction still open when a later one commits gets its changes served before the later ones."""
+    cursor = changes_since(client, None)["cursor"]
+    async with engine.connect() as connection:
+        slow = await connection.begin()
+        await connection.execute(sa.text("UPDATE product SET price = 11.0 WHERE id = 1"))
+        update = 'mutation { updateProduct(productId: 2, input: {name: "Product 2", price: 25.0}) { id } }'
+        client.post("/graphql", json={"query": update})
+
+        # The committed update waits for the older transaction, whose changes are not visible yet
+        held = changes_since(client, cursor)
+        assert held == {"changes": [], "cursor": cursor, "hasMore": False}
+        await slow.commit()
+
+    feed = changes_since(client, held["cursor"])
+    assert feed["changes"] == [
+        {"id": 1, "deleted": False, "product": {"name": "Product 1", "price": 11.0}},
+        {"id": 2, "deleted": False, "product": {"name": "Product 2", "price": 25.0}},
+    ]
+
+
+async def test_feed_rejects_invalid_cursor(client: TestClient) -> None:
+    """Test that a cursor not produced by the feed is rejected."""
+    response = client.post("/graphql", json={"query": FEED_QUERY, "variables": {"cursor": "bogus", "first": 1}})
+
+    assert response.json()["errors"][0]["message"] == "Invalid cursor"
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from graphql import parse
+
+from products_app import db
+from products_app.cost import CostLimiter, OperationShed, cost_limiter, operation_cost
+from products_app.schema import schema
+from products_app.settings import settings
+
+LISTING_QUERY = """
+query Listing($first: Int!) {
+  getActiveProductsSortedById(first: $first) { edges { node { name } } pageInfo { hasNextPage } }
+}
+"""
+
+
+def cost(query: str, **variables: object) -> int:
+    return operation_cost(schema._schema, parse(query), None, variables)
+
+
+def test_operation_cost_multiplies_lists_by_their_size() -> None:
+    """Test that connections, argument lists and unsized lists are weighted by how many items they may return."""
+    # The connection and `pageInfo`, plus an edge and a node per requested item
+    assert cost(LISTING_QUERY, first=20) == 1 + 20 * 2 + 1
+    assert cost(LISTING_QUERY, first=5) == 1 + 5 * 2 + 1
+    entities = "query($representations: [_Any!]!) { _entities(representations: $representations) { __typename } }"
+    assert cost(entities, representations=[{"__typename": "ProductType", "id": 1}] * 3) == 3
+    assert cost('{ suggestProducts(prefix: "Pro") }') == 10
+    assert cost('{ searchActiveProductsByName(search: "Pro", first: 3) { edges { cursor } } }') == 5 + 3
+    assert cost("{ __schema { types { name } } }") == 0
+
+
+async def test_expensive_query_is_rejected(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a query over the cost budget is rejected before touching the database."""
+    monkeypatch.setattr(settings, "COST_MAX_PER_OPERATION", 30)
+    client.get("/stats")  # the lifespan creates the engine
+    checkouts = db.pool_stats.checkouts
+
+    cheap = client.post("/graphql", json={"query": LISTING_QUERY, "variables": {"first": 10}}).json()
+    assert "errors" not in cheap
+    response = client.post("/graphql", json={"query": LISTING_QUERY, "variables": {"first": 20}}).json()
+
+    assert response["data"] is None
+    assert response["errors"][0]["extensions"] == {"code": "OPERATION_TOO_EXPENSIVE", "cost": 42}
+    assert db.pool_stats.checkouts - checkouts == 1
+
+
+async def test_overloaded_process_sheds_operations(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that an operation which cannot be admitted in time fails with SERVICE_OVERLOADED."""
+    monkeypatch.setattr(cost_limiter, "timeout", 0.01)
+    monkeypatch.setattr(cost_limiter, "in_flight", cost_limiter.capacity)
+    shed = cost_limiter.shed
+
+    response = client.post("/graphql", json={"query": LISTING_QUERY, "variables": {"first": 10}}).json()
+
+    assert response["data"] is None
+    assert response["errors"][0]["extensions"] == {"code": "SERVICE_OVERLOADED"}
+    assert client.get("/stats").json()["admission"] == {"in_flight": cost_limiter.capacity, "shed": shed + 1}
+
+
+async def test_cost_limiter_admits_in_order() -> None:
+    """Test that waiting operations are admitted first come first served as capacity frees up."""
+    limiter = CostLimiter(capacity=10, timeout=1.0)
+    admitted: list[str] = []
+    release = asyncio.Event()
+
+    async def run(name: str, cost: int) -> None:
+        async with limiter.admit(cost):
+            admitted.append(name)
+            await release.wait()
+
+    first = asyncio.create_task(run("first", 8))
+    await asyncio.sleep(0)
+    # A cheap operation does not overtake a queued costlier one
+    waiting = [asyncio.create_task(run("second", 5)), asyncio.create_task(run("third", 1))]
+    await asyncio.sleep(0.01)
+    assert admitted == ["first"]
+
+    release.set()
+    await asyncio.gather(first, *waiting)
+    assert admitted == ["first", "second", "third"]
+    assert limiter.in_flight == 0
+
+
+async def test_cost_limiter_sheds_after_timeout() -> None:
+    """Test that an operation waiting longer than the timeout is shed without holding capacity."""
+    limiter = CostLimiter(capacity=10, timeout=0.01)
+    async with limiter.admit(10):
+        with pytest.raises(OperationShed):
+            async with limiter.admit(1):
+                pass
+    async with limiter.admit(1):
+        assert limiter.in_flight == 1
+    assert limiter.shed == 1
@@ -0,0 +1,263 @@
+from collections.abc import AsyncGenerator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import SQLModel
+
+from products_app import db
+from products_app.app import create_app
+from products_app.schema import ProductInput
+from products_app.services import ProductService, evict_changed_products
+from products_app.settings import settings
+
+
+async def test_requests_share_pooled_engine(client: TestClient) -> None:
+    """Test that every request checks out connections from the same process-wide pool."""
+    engine = db._engine
+    connects = db.pool_stats.connects
+    query = "query { getActiveProductsSortedById { edges { cursor } } }"
+    for _ in range(5):
+        response = client.post("/graphql", json={"query": query})
+        assert response.status_code == 200
+
+    assert db._engine is engine
+    assert db.pool_stats.connects - connects <= 1
+
+
+async def test_pool_stats_endpoint(client: TestClient) -> None:
+    """Test that pool gauges and checkout/wait counters are exposed."""
+    client.post("/graphql", json={"query": "query { getActiveProductsSortedById { edges { cursor } } }"})
+    response = client.get("/stats")
+
+    assert response.status_code == 200
+    pool = response.json()["pool"]
+    assert pool["checkouts"] >= 1
+    assert pool["checked_out"] == 0
+    assert {"size", "checked_in", "overflow", "wait_seconds_total", "wait_seconds_max", "timeouts"} <= pool.keys()
+
+
+async def test_engine_disposed_on_shutdown() -> None:
+    """Test that the lifespan hook creates the engine on startup and drops it on shutdown."""
+    with TestClient(create_app()):
+        assert db._engine is not None
+    assert db._engine is None
+
+
+async def test_operation_checks_out_one_connection(client: TestClient) -> None:
+    """Test that every field of an operation reads through the same lazily-opened session."""
+    query = """
+    query {
+      byId: getActiveProductsSortedById { edges { cursor } }
+      byPrice: activeProductsByPrice { edges { cursor } }
+      search: searchActiveProductsByName(search: "Product") { edges { cursor } }
+      _entities(representations: [{__typename: "ProductType", id: 1}, {__typename: "ProductType", id: 2}]) {
+        ... on ProductType { name }
+      }
+    }
+    """
+    client.get("/stats")  # the lifespan creates the engine
+    checkouts = db.pool_stats.checkouts
+    response = client.post("/graphql", json={"query": query})
+
+    assert "errors" not in response.json()
+    assert db.pool_stats.checkouts - checkouts == 1
+    assert client.get("/stats").json()["pool"]["checked_out"] == 0
+
+
+async def test_mutations_of_an_operation_share_one_transaction(client: TestClient, engine: AsyncEngine) -> None:
+    """Test that a failing mutation rolls back the mutations before it in the same operation."""
+    mutation = """
+    mutation {
+      created: createProduct(inp: {name: "Product 3", price: 1.0}) { id }
+      renamed: updateProduct(productId: 2, input: {name: "Renamed", price: 1.0}) { id }
+      duplicate: createProduct(inp: {name: "Product 1", price: 1.0}) { id }
+    }
+    """
+    response = client.post("/graphql", json={"query": mutation}).json()
+
+    assert response["data"] is None
+    assert len(response["errors"]) == 1
+    async with engine.connect() as conn:
+        names = await conn.scalars(text("SELECT name FROM product ORDER BY id"))
+        assert list(names) == ["Product 1", "Product 2"]
+
+
+async def test_mutations_of_an_operation_commit_together(client: TestClient, engine: AsyncEngine) -> None:
+    """Test that successful mutations are committed once the operation is over."""
+    mutation = """
+    mutation {
+      created: createProduct(inp: {name: "Product 3", price: 1.0}) { id }
+      deleted: deleteProduct(productId: 2)
+    }
+    """
+    response = client.post("/graphql", json={"query": mutation}).json()
+
+    assert response["data"] == {"created": {"id": 3}, "deleted": "Product 2 deleted successfully."}
+    async with engine.connect() as conn:
+        names = await conn.scalars(text("SELECT name FROM product ORDER BY id"))
+        assert list(names) == ["Product 1", "Product 3"]
+
+
+async def test_updates_of_an_operation_return_their_own_writes() -> None:
+    """Test that updating a product twice in one unit of work returns the values each update wrote."""
+    unit_of_work = db.UnitOfWork()
+    token = db.current_unit_of_work.set(unit_of_work)
+    try:
+        first = await ProductService.update_product(2, ProductInput(name="Renamed once", price=1.0))
+        assert first is not None and first.name == "Renamed once"
+        # The first product is still referenced, so the unit of work's identity map holds on to it
+        second = await ProductService.update_product(2, ProductInput(name="Renamed twice", price=2.0))
+        assert second is not None
+        assert (second.name, second.price) == ("Renamed twice", 2.0)
+    finally:
+        await unit_of_work.rollback()
+        await unit_of_work.close()
+        db.current_unit_of_work.reset(token)
+
+
+@pytest.fixture
+async def replica(engine: AsyncEngine, monkeypatch: pytest.MonkeyPatch) -> AsyncGenerator[AsyncEngine, None]:
+    """A second database standing in for a read replica, holding different rows than the primary."""
+    name = f"{settings.POSTGRES_DB}_replica"
+    async with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        await conn.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
+        await conn.execute(text(f'CREATE DATABASE "{name}"'))
+    replica_uri = make_url(settings.DATABASE_URI).set(database=name).render_as_string(hide_password=False)
+    replica = db.get_db_engine(replica_uri)
+    async with replica.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.execute(text("INSERT INTO product (name, price, status) VALUES ('Replica product', 5, 'ACTIVE')"))
+    monkeypatch.setattr(settings, "DATABASE_REPLICA_URIS", [replica_uri])
+    monkeypatch.setattr(db, "_last_write_at", float("-inf"))
+    yield replica
+    await db.dispose_db()
+    await replica.dispose()
+    async with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        await conn.execute(text(f'DROP DATABASE "{name}" WITH (FORCE)'))
+
+
+ACTIVE_NAMES_QUERY = "query { getActiveProductsSortedById { edges { node { name } } } }"
+
+
+def active_names(client: TestClient) -> list[str]:
+    response = client.post("/graphql", json={"query": ACTIVE_NAMES_QUERY}).json()
+    return [edge["node"]["name"] for edge in response["data"]["getActiveProductsSortedById"]["edges"]]
+
+
+async def test_queries_read_from_replica(replica: AsyncEngine, client: TestClient) -> None:
+    """Test that query operations are served by a replica when one is configured."""
+    assert active_names(client) == ["Replica product"]
+
+
+async def test_mutations_write_to_primary(replica: AsyncEngine, client: TestClient, engine: AsyncEngine) -> None:
+    """Test that mutations run on the primary even when replicas are configured."""
+    mutation = 'mutation { createProduct(inp: {name: "Product 3", price: 1.0}) { id } }'
+    response = client.post("/graphql", json={"query": mutation}).json()
+
+    assert response["data"] == {"createProduct": {"id": 3}}
+    async with engine.connect() as conn:
+        assert await conn.scalar(text("SELECT count(*) FROM product WHERE name = 'Product 3'")) == 1
+    async with replica.connect() as conn:
+        assert await conn.scalar(text("SELECT count(*) FROM product WHERE name = 'Product 3'")) == 0
+
+
+async def test_reads_after_write_go_to_primary(
+    replica: AsyncEngine, client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that the client that wrote reads from the primary within the read-your-writes window, and no other."""
+    monkeypatch.setattr(settings, "READ_YOUR_WRITES_SECONDS", 60.0)
+    assert active_names(client) == ["Replica product"]
+
+    client.post("/graphql", json={"query": 'mutation { createProduct(inp: {name: "Product 3", price: 1.0}) { id } }'})
+
+    assert active_names(client) == ["Product 1", "Product 3"]
+    # Another client, without the cookie of the write, still reads from the replica (listings by price are not cached)
+    client.cookies.clear()
+    by_price = client.post("/graphql", json={"query": "query { activeProductsByPrice { edges { node { name } } } }"})
+    assert [edge["node"]["name"] for edge in by_price.json()["data"]["activeProductsByPrice"]["edges"]] == [
+        "Replica product"
+    ]
+
+
+async def test_reads_after_write_elsewhere_are_not_cached(
+    replica: AsyncEngine, client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that replica reads right after a write notified by another process stay on the replica, uncached."""
+    monkeypatch.setattr(settings, "READ_YOUR_WRITES_SECONDS", 60.0)
+    await evict_changed_products({"1"})
+
+    assert active_names(client) == ["Replica product"]
+    async with replica.begin() as conn:
+        await conn.execute(text("UPDATE product SET name = 'Caught up product'"))
+    assert active_names(client) == ["Caught up product"]
+
+
+async def test_replicas_share_reads(replica: AsyncEngine, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that idle replicas take turns under both routing policies."""
+    monkeypatch.setattr(settings, "DATABASE_REPLICA_URIS", settings.DATABASE_REPLICA_URIS * 2)
+    for routing in ("round_robin", "least_loaded"):
+        monkeypatch.setattr(settings, "REPLICA_ROUTING", routing)
+        picked = [db.read_session_maker() for _ in range(4)]
+        assert picked[0] is picked[2] and picked[1] is picked[3]
+        assert picked[0] is not picked[1]
+        assert db.init_db() not in picked
+
+
+async def test_least_loaded_replica_is_preferred(replica: AsyncEngine, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a busy replica is skipped while another one is idle."""
+    monkeypatch.setattr(settings, "DATABASE_REPLICA_URIS", settings.DATABASE_REPLICA_URIS * 2)
+    db.init_db()
+    busy_engine, busy = db._replicas[0]
+    async with busy_engine.connect():
+        assert all(db.read_session_maker() is not busy for _ in range(4))
+
+
+async def test_response_reports_sql_statements(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that responses carry the number of statements their resolvers ran, only when asked to."""
+    query = """
+    query {
+      getActiveProductsSortedById { edges { cursor } }
+      _entities(representations: [{__typename: "ProductType", id: 1}, {__typename: "ProductType", id: 2}]) {
+        ... on ProductType { name }
+      }
+    }
+    """
+    monkeypatch.setattr(settings, "SQL_STATS_IN_RESPONSE", True)
+    response = client.post("/graphql", json={"query": query}).json()
+
+    assert response["extensions"]["sql"]["statements"] == 2
+    assert response["extensions"]["sql"]["duration_ms"] > 0
+    monkeypatch.setattr(settings, "SQL_STATS_IN_RESPONSE", False)
+    assert "extensions" not in client.post("/graphql", json={"query": query}).json()
+
+
+async def test_statement_stats_by_fingerprint(client: TestClient) -> None:
+    """Test that executions of a statement with different parameter lists share one fingerprint."""
+    query = "query($reps: [_Any!]!) { _entities(representations: $reps) { ... on ProductType { name } } }"
+    for ids in ([1], [1, 2], [2, 3, 4]):
+        representations = [{"__typename": "ProductType", "id": product_id} for product_id in ids]
+        client.post("/graphql", json={"query": query, "variables": {"reps": representations}})
+
+    statements = client.get("/stats/statements").json()
+    (by_ids,) = [stats for stats in statements if stats["statement"].endswith("WHERE product.id = ANY (?)")]
+    assert by_ids["count"] >= 3
+    assert by_ids["seconds_max"] <= by_ids["seconds_total"]
+    series = f'db_statement_duration_seconds_count{{fingerprint="{by_ids["fingerprint"]}"}}'
+    assert series in client.get("/metrics").text
+
+
+async def test_slow_statements_are_logged(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    """Test that statements over the threshold are logged with parameter shapes but without values."""
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", 0)
+    query = 'query { searchActiveProductsByName(search: "secret") { edges { cursor } } }'
+    with caplog.at_level("WARNING", logger="products_app.db"):
+        client.post("/graphql", json={"query": query})
+
+    (record,) = [record for record in caplog.records if "to_tsquery" in record.getMessage()]
+    assert "parameters (str, str, " in record.getMessage()
+    assert "secret" not in record.getMessage()
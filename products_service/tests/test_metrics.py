@@ -0,0 +1,90 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from products_app import extensions
+from products_app.metrics import Histogram
+
+LISTING_QUERY = "query Listing { getActiveProductsSortedById { edges { node { name } } } }"
+
+
+def sample(client: TestClient, series: str) -> float:
+    for line in client.get("/metrics").text.splitlines():
+        name, _, value = line.rpartition(" ")
+        if name == series:
+            return float(value)
+    return 0.0
+
+
+async def test_operation_and_field_metrics(client: TestClient) -> None:
+    """Test that operations and fields with a resolver of their own are timed and sized."""
+    operations = 'graphql_operation_duration_seconds_count{operation_type="query",operation_name="Listing"}'
+    fields = 'graphql_field_duration_seconds_count{field="Query.getActiveProductsSortedById"}'
+    before = sample(client, operations), sample(client, fields)
+
+    for _ in range(3):
+        assert "errors" not in client.post("/graphql", json={"query": LISTING_QUERY}).json()
+
+    assert sample(client, operations) == before[0] + 3
+    assert sample(client, fields) == before[1] + 3
+    # Plain attributes are not timed
+    assert 'field="ProductType.name"' not in client.get("/metrics").text
+
+
+async def test_error_metrics(client: TestClient) -> None:
+    """Test that resolver errors are counted per field and per operation."""
+    query = 'query Broken { getActiveProductsSortedById(after: "not a cursor") { edges { cursor } } }'
+    fields = 'graphql_field_errors_total{field="Query.getActiveProductsSortedById"}'
+    operations = 'graphql_operation_errors_total{operation_type="query",operation_name="Broken"}'
+    before = sample(client, fields), sample(client, operations)
+
+    assert "errors" in client.post("/graphql", json={"query": query}).json()
+
+    assert sample(client, fields) == before[0] + 1
+    assert sample(client, operations) == before[1] + 1
+
+
+async def test_operation_names_are_capped(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that operation names beyond the cap share one label, so clients cannot grow the metrics unbounded."""
+    monkeypatch.setattr(extensions, "_operation_names", set())
+    monkeypatch.setattr(extensions, "MAX_OPERATION_NAMES", 1)
+    series = 'graphql_operation_duration_seconds_count{{operation_type="query",operation_name="{}"}}'
+
+    for name in ("Kept", "Dropped1", "Dropped2", "Kept"):
+        client.post(
+            "/graphql", json={"query": f"query {name} {{ getActiveProductsSortedById {{ edges {{ cursor }} }} }}"}
+        )
+
+    assert sample(client, series.format("Kept")) == 2
+    assert sample(client, series.format("other")) == 2
+    assert 'operation_name="Dropped1"' not in client.get("/metrics").text
+
+
+async def test_metrics_export_pool_gauges(client: TestClient) -> None:
+    """Test that pool, cache and admission stats are exported next to the GraphQL metrics."""
+    client.post("/graphql", json={"query": LISTING_QUERY})
+    response = client.get("/metrics")
+
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE db_pool_checkouts_total counter" in response.text
+    assert "# TYPE db_pool_checked_out gauge" in response.text
+    assert sample(client, "db_pool_checked_out") == 0
+    assert sample(client, "db_pool_checkouts_total") >= 1
+    assert "# TYPE cache_hits_total counter" in response.text
+    assert "# TYPE admission_in_flight gauge" in response.text
+
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    """Test the Prometheus text format of a histogram, including label escaping."""
+    histogram = Histogram("latency_seconds", "Latency", ("path",), (0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(('a"b',), value)
+
+    assert list(histogram.render()) == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{path="a\\"b",le="0.1"} 1.0',
+        'latency_seconds_bucket{path="a\\"b",le="1.0"} 3.0',
+        'latency_seconds_bucket{path="a\\"b",le="+Inf"} 4.0',
+        'latency_seconds_sum{path="a\\"b"} 4.25',
+        'latency_seconds_count{path="a\\"b"} 4.0',
+    ]
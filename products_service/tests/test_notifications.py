@@ -0,0 +1,117 @@
+import asyncio
+from collections.abc import AsyncGenerator, Callable
+
+import asyncpg  # type: ignore[import-untyped]
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from products_app import cache
+from products_app.cache import MemoryCacheBackend
+from products_app.notifications import PRODUCTS_CHANNEL, ChangeListener, listen_dsn
+from products_app.services import LISTS_VERSION_KEY, ProductService, evict_changed_products
+
+
+async def wait_until(condition: Callable[[], bool], timeout: float = 5.0) -> None:
+    """Poll until `condition` holds, giving background tasks time to run."""
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+async def changes() -> list[set[str] | None]:
+    return []
+
+
+@pytest.fixture
+async def listener(changes: list[set[str] | None]) -> AsyncGenerator[ChangeListener, None]:
+    """Run a change listener recording every batch it hands out."""
+
+    async def record(ids: set[str] | None) -> None:
+        changes.append(ids)
+
+    listener = ChangeListener(listen_dsn(), PRODUCTS_CHANNEL, record, coalesce_seconds=0.05)
+    listener.start()
+    await asyncio.wait_for(listener.connected.wait(), 5)
+    yield listener
+    await listener.stop()
+
+
+async def test_writes_notify_product_ids(client: TestClient) -> None:
+    """Test that create, update and delete each NOTIFY the changed product id."""
+    payloads: list[str] = []
+    connection = await asyncpg.connect(listen_dsn())
+    await connection.add_listener(PRODUCTS_CHANNEL, lambda *args: payloads.append(args[-1]))
+    try:
+        product = """
+        mutation {
+          createProduct(inp: {name: "Product 3", price: 1.0}) {
+            id
+          }
+        }
+        """
+        created = client.post("/graphql", json={"query": product}).json()["data"]["createProduct"]["id"]
+        update = 'mutation { updateProduct(productId: 1, input: {name: "Renamed", price: 1.0}) { id } }'
+        client.post("/graphql", json={"query": update})
+        client.post("/graphql", json={"query": "mutation { deleteProduct(productId: 2) }"})
+
+        await wait_until(lambda: len(payloads) == 3)
+    finally:
+        await connection.close()
+
+    assert payloads == [str(created), "1", "2"]
+
+
+async def test_listener_coalesces_bulk_changes(
+    engine: AsyncEngine, listener: ChangeListener, changes: list[set[str] | None]
+) -> None:
+    """Test that a burst of notifications is handed over as a single batch."""
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("SELECT pg_notify(:channel, n::text) FROM generate_series(1, 500) AS n"),
+            {"channel": PRODUCTS_CHANNEL},
+        )
+
+    await wait_until(lambda: len(changes) > 0)
+    await asyncio.sleep(0.1)
+    assert changes == [{str(n) for n in range(1, 501)}]
+
+
+async def test_listener_reconnects_and_reports_possible_gap(
+    engine: AsyncEngine, listener: ChangeListener, changes: list[set[str] | None]
+) -> None:
+    """Test that a dropped LISTEN connection is re-established and reported as "everything changed"."""
+    assert listener.connection is not None
+    connection = listener.connection
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": connection.get_server_pid()})
+
+    await wait_until(lambda: listener.connection is not None and listener.connection is not connection)
+    await wait_until(lambda: changes == [None])
+
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_notify(:channel, '7')"), {"channel": PRODUCTS_CHANNEL})
+    await wait_until(lambda: changes == [None, {"7"}])
+
+
+async def test_change_from_another_replica_evicts_local_cache(engine: AsyncEngine) -> None:
+    """Test that a write committed elsewhere evicts this process's cached listing."""
+    backend = cache._cache = MemoryCacheBackend(maxsize=100, ttl=60)
+    listener = ChangeListener(listen_dsn(), PRODUCTS_CHANNEL, evict_changed_products, coalesce_seconds=0.01)
+    listener.start()
+    try:
+        await asyncio.wait_for(listener.connected.wait(), 5)
+        assert [product.name for product in await ProductService.get_active_products(10)] == ["Product 1"]
+        version = await backend.get(LISTS_VERSION_KEY)
+
+        async with engine.begin() as conn:
+            await conn.execute(text("UPDATE product SET name = 'Renamed elsewhere' WHERE id = 1"))
+            await conn.execute(text("SELECT pg_notify(:channel, '1')"), {"channel": PRODUCTS_CHANNEL})
+
+        await wait_until(lambda: backend._lru.get(LISTS_VERSION_KEY) != version)
+        assert [product.name for product in await ProductService.get_active_products(10)] == ["Renamed elsewhere"]
+    finally:
+        await listener.stop()
+        await cache.dispose_cache()
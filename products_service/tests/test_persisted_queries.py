@@ -0,0 +1,71 @@
+import hashlib
+import json
+
+import pytest
+import strawberry.schema.execute
+from fastapi.testclient import TestClient
+
+from products_app.persisted_queries import documents, persisted_queries
+
+QUERY = "query { getActiveProductsSortedById { edges { node { name } } } }"
+QUERY_HASH = hashlib.sha256(QUERY.encode()).hexdigest()
+EXTENSIONS = {"persistedQuery": {"version": 1, "sha256Hash": QUERY_HASH}}
+EXPECTED = {"getActiveProductsSortedById": {"edges": [{"node": {"name": "Product 1"}}]}}
+
+
+@pytest.fixture(autouse=True)
+def clear_registries() -> None:
+    persisted_queries.clear()
+    documents.clear()
+
+
+async def test_unknown_hash_asks_for_query(client: TestClient) -> None:
+    """Test that a hash sent without its query text is answered with PERSISTED_QUERY_NOT_FOUND."""
+    response = client.post("/graphql", json={"extensions": EXTENSIONS})
+
+    assert response.status_code == 200
+    (error,) = response.json()["errors"]
+    assert error["message"] == "PersistedQueryNotFound"
+    assert error["extensions"] == {"code": "PERSISTED_QUERY_NOT_FOUND"}
+
+
+async def test_registered_query_runs_by_hash(client: TestClient) -> None:
+    """Test that a query registered with its hash can then be executed by hash alone, over POST and GET."""
+    registered = client.post("/graphql", json={"query": QUERY, "extensions": EXTENSIONS})
+    assert registered.json()["data"] == EXPECTED
+
+    by_post = client.post("/graphql", json={"extensions": EXTENSIONS})
+    by_get = client.get(
+        "/graphql", params={"extensions": json.dumps(EXTENSIONS)}, headers={"Accept": "application/json"}
+    )
+
+    assert by_post.json()["data"] == EXPECTED
+    assert by_get.json()["data"] == EXPECTED
+
+
+async def test_mismatched_hash_is_rejected(client: TestClient) -> None:
+    """Test that a query is not registered under a hash that is not its own."""
+    extensions = {"persistedQuery": {"version": 1, "sha256Hash": "0" * 64}}
+    response = client.post("/graphql", json={"query": QUERY, "extensions": extensions})
+
+    assert response.status_code == 400
+    assert len(persisted_queries) == 0
+
+
+async def test_repeated_query_is_parsed_once(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a validated document is reused, while an invalid query is never cached."""
+    parse_document = strawberry.schema.execute.parse_document
+    parsed: list[str] = []
+
+    def counting_parse_document(query: str, **kwargs: object) -> object:
+        parsed.append(query)
+        return parse_document(query, **kwargs)  # type: ignore[arg-type]
+
+    monkeypatch.setattr(strawberry.schema.execute, "parse_document", counting_parse_document)
+    for _ in range(3):
+        assert client.post("/graphql", json={"query": QUERY}).json()["data"] == EXPECTED
+        assert "errors" in client.post("/graphql", json={"query": "query { unknownField }"}).json()
+
+    assert parsed.count(QUERY) == 1
+    assert parsed.count("query { unknownField }") == 3
+    assert len(documents) == 1
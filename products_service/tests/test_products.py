@@ -1,15 +1,24 @@
+from typing import Any
+
 from fastapi.testclient import TestClient
 
+from products_app.pagination import encode_cursor
+from products_app.settings import settings
+
 
 async def test_search_active_products_by_name(client: TestClient) -> None:
     """Test searching for active products by name."""
     query = """
     query SearchActiveProducts($search: String!) {
       searchActiveProductsByName(search: $search) {
-        id
-        name
-        price
-        status
+        edges {
+          node {
+            id
+            name
+            price
+            status
+          }
+        }
       }
     }
     """
@@ -21,31 +30,166 @@ async def test_search_active_products_by_name(client: TestClient) -> None:
 
     assert response.status_code == 200
 
-    data = response.json()["data"]["searchActiveProductsByName"]
+    data = [edge["node"] for edge in response.json()["data"]["searchActiveProductsByName"]["edges"]]
     assert len(data) == 1
     assert data[0]["name"] == "Product 1"
     assert data[0]["status"] == "ACTIVE"
 
 
+async def test_search_products_ranked_with_prefix_matching(client: TestClient) -> None:
+    """Test that search ranks matches, matches partial trailing words and pages with cursors."""
+    mutation = """
+    mutation CreateProduct($input: ProductInput!) {
+      createProduct(inp: $input) {
+        id
+      }
+    }
+    """
+    for name in ("Red running shoes", "Red shoes for red carpets", "Blue running shirt"):
+        variables = {"input": {"name": name, "price": 1.0, "status": "ACTIVE"}}
+        client.post("/graphql", json={"query": mutation, "variables": variables})
+
+    query = """
+    query Search($search: String!, $first: Int!, $after: String) {
+      searchActiveProductsByName(search: $search, first: $first, after: $after) {
+        edges {
+          node {
+            name
+          }
+        }
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+      }
+    }
+    """
+
+    def search(text: str, first: int = 10, after: str | None = None) -> dict[str, Any]:
+        variables = {"search": text, "first": first, "after": after}
+        connection: dict[str, Any] = client.post("/graphql", json={"query": query, "variables": variables}).json()[
+            "data"
+        ]["searchActiveProductsByName"]
+        return connection
+
+    def names(connection: dict[str, Any]) -> list[str]:
+        return [edge["node"]["name"] for edge in connection["edges"]]
+
+    assert names(search("red")) == ["Red shoes for red carpets", "Red running shoes"]
+    assert names(search("red runn")) == ["Red running shoes"]
+    assert names(search("shoe -running")) == ["Red shoes for red carpets"]
+    assert set(names(search("prod"))) == {"Product 1"}
+
+    first_page = search("run", first=1)
+    assert first_page["pageInfo"]["hasNextPage"] is True
+    second_page = search("run", first=1, after=first_page["pageInfo"]["endCursor"])
+    assert second_page["pageInfo"]["hasNextPage"] is False
+    assert {*names(first_page), *names(second_page)} == {"Red running shoes", "Blue running shirt"}
+
+
+async def test_search_matches_a_trailing_word_by_its_stem(client: TestClient) -> None:
+    """Test that a whole trailing word matches other forms of it, not only names starting with it."""
+    mutation = 'mutation { createProduct(inp: {name: "Red shoe", price: 1.0, status: ACTIVE}) { id } }'
+    client.post("/graphql", json={"query": mutation})
+    query = "query Search($search: String!) { searchActiveProductsByName(search: $search) { edges { node { name } } } }"
+
+    for search in ("shoes", "red shoes", "shoe"):
+        response = client.post("/graphql", json={"query": query, "variables": {"search": search}}).json()
+        edges = response["data"]["searchActiveProductsByName"]["edges"]
+        assert [edge["node"]["name"] for edge in edges] == ["Red shoe"], search
+
+
 async def test_get_active_products_sorted_by_id(client: TestClient) -> None:
     """Test retrieving all active products sorted by ID."""
     query = """
     query GetActiveProducts {
       getActiveProductsSortedById {
-        id
-        name
-        price
-        status
+        edges {
+          node {
+            id
+            name
+            price
+            status
+          }
+        }
+        pageInfo {
+          hasNextPage
+        }
       }
     }
     """
     response = client.post("/graphql", json={"query": query})
     assert response.status_code == 200
 
-    data = response.json()["data"]["getActiveProductsSortedById"]
+    connection = response.json()["data"]["getActiveProductsSortedById"]
+    data = [edge["node"] for edge in connection["edges"]]
     assert len(data) == 1  # Only one active product in the seed data
     assert data[0]["name"] == "Product 1"
     assert data[0]["status"] == "ACTIVE"
+    assert connection["pageInfo"]["hasNextPage"] is False
+
+
+async def test_paginate_active_products_sorted_by_id(client: TestClient) -> None:
+    """Test walking the active products connection page by page."""
+    mutation = """
+    mutation CreateProduct($input: ProductInput!) {
+      createProduct(inp: $input) {
+        id
+      }
+    }
+    """
+    for i in range(3, 8):
+        status = "ACTIVE" if i % 2 else "INACTIVE"
+        variables = {"input": {"name": f"Product {i}", "price": float(i), "status": status}}
+        client.post("/graphql", json={"query": mutation, "variables": variables})
+
+    query = """
+    query GetActiveProducts($first: Int!, $after: String) {
+      getActiveProductsSortedById(first: $first, after: $after) {
+        edges {
+          cursor
+          node {
+            name
+          }
+        }
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+      }
+    }
+    """
+    names: list[str] = []
+    after = None
+    has_next_page = True
+    while has_next_page:
+        response = client.post("/graphql", json={"query": query, "variables": {"first": 2, "after": after}})
+        connection = response.json()["data"]["getActiveProductsSortedById"]
+        assert len(connection["edges"]) <= 2
+        names.extend(edge["node"]["name"] for edge in connection["edges"])
+        has_next_page = connection["pageInfo"]["hasNextPage"]
+        after = connection["pageInfo"]["endCursor"]
+
+    assert names == ["Product 1", "Product 3", "Product 5", "Product 7"]
+
+
+async def test_active_products_rejects_invalid_page_arguments(client: TestClient) -> None:
+    """Test that oversized pages and malformed cursors (or cursors of the wrong types) are rejected."""
+    query = """
+    query GetActiveProducts($first: Int!, $after: String) {
+      getActiveProductsSortedById(first: $first, after: $after) {
+        edges {
+          cursor
+        }
+      }
+    }
+    """
+    response = client.post("/graphql", json={"query": query, "variables": {"first": 1000}})
+    assert response.json()["errors"][0]["message"] == "`first` must be between 1 and 100"
+
+    for after in ("not-a-cursor", encode_cursor("x"), encode_cursor(1, 2)):
+        response = client.post("/graphql", json={"query": query, "variables": {"first": 10, "after": after}})
+        assert response.json()["errors"][0]["message"] == "Invalid cursor"
 
 
 async def test_create_product(client: TestClient) -> None:
@@ -74,6 +218,50 @@ async def test_create_product(client: TestClient) -> None:
     assert data["status"] == "ACTIVE"
 
 
+CREATE_PRODUCTS_MUTATION = """
+mutation CreateProducts($inputs: [ProductInput!]!) {
+  createProducts(inputs: $inputs) {
+    product {
+      name
+      status
+    }
+    error
+  }
+}
+"""
+
+
+async def test_create_products(client: TestClient) -> None:
+    """Test creating products in bulk, with errors reported per item and in input order."""
+    inputs = [
+        {"name": "Product 3", "price": 30.0, "status": "ACTIVE"},
+        {"name": "Product 1", "price": 10.0},
+        {"name": "P", "price": 1.0},
+        {"name": "Product 4", "price": 40.0, "status": "INACTIVE"},
+        {"name": "Product 3", "price": 31.0},
+    ]
+    response = client.post("/graphql", json={"query": CREATE_PRODUCTS_MUTATION, "variables": {"inputs": inputs}})
+
+    assert response.json()["data"]["createProducts"] == [
+        {"product": {"name": "Product 3", "status": "ACTIVE"}, "error": None},
+        {"product": None, "error": "Product 'Product 1' already exists"},
+        {"product": None, "error": "Name must be between 3 and 500 characters"},
+        {"product": {"name": "Product 4", "status": "INACTIVE"}, "error": None},
+        {"product": None, "error": "Duplicate name 'Product 3' in the same batch"},
+    ]
+
+
+async def test_create_products_streams_large_batches(client: TestClient) -> None:
+    """Test that batches above the COPY threshold are created the same way."""
+    inputs = [{"name": f"Imported {i}", "price": float(i)} for i in range(settings.BULK_COPY_THRESHOLD)]
+    inputs.append({"name": "Product 2", "price": 1.0})
+    response = client.post("/graphql", json={"query": CREATE_PRODUCTS_MUTATION, "variables": {"inputs": inputs}})
+
+    results = response.json()["data"]["createProducts"]
+    assert [result["product"]["name"] for result in results[:-1]] == [f"Imported {i}" for i in range(len(inputs) - 1)]
+    assert results[-1] == {"product": None, "error": "Product 'Product 2' already exists"}
+
+
 async def test_update_product(client: TestClient) -> None:
     """Test updating an existing product."""
     mutation = """
@@ -119,3 +307,92 @@ async def test_delete_product(client: TestClient) -> None:
     assert response.status_code == 200
     data = response.json()["data"]["deleteProduct"]
     assert data == "Product 1 deleted successfully."
+
+
+async def test_resolve_product_references(client: TestClient) -> None:
+    """Test resolving federated product references in input order."""
+    query = """
+    query Entities($representations: [_Any!]!) {
+      _entities(representations: $representations) {
+        ... on ProductType {
+          id
+          name
+          price
+        }
+      }
+    }
+    """
+    representations = [{"__typename": "ProductType", "id": product_id} for product_id in (2, 42, 1)]
+    response = client.post(
+        "/graphql",
+        json={"query": query, "variables": {"representations": representations}},
+    )
+
+    assert response.status_code == 200
+
+    data = response.json()["data"]["_entities"]
+    assert data[0] == {"id": 2, "name": "Product 2", "price": 20.0}
+    assert data[1] is None
+    assert data[2] == {"id": 1, "name": "Product 1", "price": 10.0}
+
+
+async def test_active_products_by_price(client: TestClient) -> None:
+    """Test price-range listing ordered by price, paged with cursors."""
+    mutation = """
+    mutation CreateProduct($input: ProductInput!) {
+      createProduct(inp: $input) {
+        id
+      }
+    }
+    """
+    for name, price in (("Cheap", 5.0), ("Mid A", 15.0), ("Mid B", 15.0), ("Pricey", 99.0)):
+        variables = {"input": {"name": name, "price": price, "status": "ACTIVE"}}
+        client.post("/graphql", json={"query": mutation, "variables": variables})
+
+    query = """
+    query ByPrice($minPrice: Float, $maxPrice: Float, $first: Int!, $after: String) {
+      activeProductsByPrice(minPrice: $minPrice, maxPrice: $maxPrice, first: $first, after: $after) {
+        edges {
+          node {
+            name
+            price
+          }
+        }
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+      }
+    }
+    """
+    page_variables: dict[str, Any] = {"minPrice": 6.0, "maxPrice": 50.0, "first": 2}
+    response = client.post("/graphql", json={"query": query, "variables": page_variables})
+    first_page = response.json()["data"]["activeProductsByPrice"]
+    assert [edge["node"]["name"] for edge in first_page["edges"]] == ["Product 1", "Mid A"]
+    assert first_page["pageInfo"]["hasNextPage"] is True
+
+    page_variables["after"] = first_page["pageInfo"]["endCursor"]
+    response = client.post("/graphql", json={"query": query, "variables": page_variables})
+    second_page = response.json()["data"]["activeProductsByPrice"]
+    assert [edge["node"] for edge in second_page["edges"]] == [{"name": "Mid B", "price": 15.0}]
+    assert second_page["pageInfo"]["hasNextPage"] is False
+
+
+async def test_suggest_products(client: TestClient) -> None:
+    """Test typeahead suggestions for partial, short and wildcard-looking prefixes."""
+    query = """
+    query Suggest($prefix: String!) {
+      suggestProducts(prefix: $prefix, limit: 5)
+    }
+    """
+
+    def suggest(prefix: str) -> list[str]:
+        response = client.post("/graphql", json={"query": query, "variables": {"prefix": prefix}})
+        suggestions: list[str] = response.json()["data"]["suggestProducts"]
+        return suggestions
+
+    assert suggest("prod") == ["Product 1"]  # "Product 2" is inactive
+    assert suggest("PRODUCT 1") == ["Product 1"]
+    assert suggest("pr") == []
+    assert suggest("pro%") == []
+    assert suggest("roduct") == []
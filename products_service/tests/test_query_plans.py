@@ -0,0 +1,226 @@
+import json
+import os
+from collections.abc import Awaitable, Callable, Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from products_app import db
+from products_app.models import Product, ProductStatus
+from products_app.repository import ProductRepository
+from products_app.services import PRODUCT_FIELDS
+
+# Estimated total cost of every statement a repository method runs, recorded against the seeded volume below.
+# Regenerate with `UPDATE_QUERY_PLAN_BASELINE=1 pytest tests/test_query_plans.py` after an intended plan change.
+BASELINE_PATH = Path(__file__).with_name("query_plan_baseline.json")
+# Estimates shift slightly with the statistics sampled by ANALYZE
+COST_TOLERANCE = 1.25
+SEEDED_PRODUCTS = 100_000
+# Seeded names combine these words (and a number), so a word matches a realistic share of the products
+ADJECTIVES = "red blue green black white oak walnut steel glass leather linen wool cotton brass copper "
+ADJECTIVES += "vintage modern rustic compact deluxe"
+NOUNS = "chair table lamp sofa desk shelf bed rug mirror clock vase bench stool cabinet dresser "
+NOUNS += "curtain pillow blanket basket frame candle planter tray hook ladder"
+
+Query = Callable[[AsyncSession], Awaitable[object]]
+
+QUERIES: dict[str, Query] = {
+    "get_product_by_id": lambda session: ProductRepository.get_product_by_id(4242, session),
+    "get_products_by_ids": lambda session: ProductRepository.get_products_by_ids(list(range(1000, 1100)), session),
+    "get_active_products": lambda session: ProductRepository.get_active_products(50, None, session),
+    "get_active_products_after": lambda session: ProductRepository.get_active_products(50, 50_000, session),
+    "get_active_products_by_price": lambda session: ProductRepository.get_active_products_by_price(
+        10.0, 20.0, 50, None, {"name", "price"}, session
+    ),
+    "get_active_products_by_price_after": lambda session: ProductRepository.get_active_products_by_price(
+        None, None, 50, (50.0, 1234), {"name", "price", "status"}, session
+    ),
+    "search_products_by_name": lambda session: ProductRepository.search_products_by_name(
+        "walnut lamp", 50, None, session
+    ),
+    "search_products_by_name_prefix": lambda session: ProductRepository.search_products_by_name(
+        "walnut la", 50, None, session
+    ),
+    "suggest_product_names": lambda session: ProductRepository.suggest_product_names("walnut lamp 12", 10, session),
+    "get_changes_since": lambda session: ProductRepository.get_changes_since(None, 51, session),
+    "get_changes_since_after": lambda session: ProductRepository.get_changes_since((1, 1234), 51, session),
+    "create_product": lambda session: ProductRepository.create_product(Product(name="Planned", price=1.0), session),
+    "create_products": lambda session: ProductRepository.create_products(
+        [{"name": f"Planned {i}", "price": 1.0, "status": ProductStatus.ACTIVE} for i in range(10)], session
+    ),
+    "update_product": lambda session: ProductRepository.update_product(4242, {"price": 2.0}, session),
+    "delete_product": lambda session: ProductRepository.delete_product(4242, session),
+    "notify_changed": lambda session: ProductRepository.notify_changed([4242], session),
+}
+
+
+async def explain(engine: AsyncEngine, call: Callable[[AsyncSession], Awaitable[Any]]) -> dict[str, Any]:
+    """Run a repository call, then return the JSON plan of the statement it executed."""
+    statements: list[tuple[str, Any]] = []
+
+    def capture(_conn: Any, _cursor: Any, statement: str, parameters: Any, *_: Any) -> None:
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        async with async_sessionmaker(engine, class_=AsyncSession)() as session:
+            await call(session)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+    statement, parameters = statements[0]
+    async with engine.connect() as conn:
+        # The seed data is tiny, so make sequential scans unattractive to check that an index *can* serve the query
+        await conn.exec_driver_sql("SET enable_seqscan = off")
+        result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+        plan: dict[str, Any] = result.scalar_one()[0]["Plan"]
+    return plan
+
+
+@pytest.fixture
+async def bulk_products(engine: AsyncEngine) -> None:
+    """Seed enough rows for the planner to prefer selective indexes on its own."""
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql(
+            "INSERT INTO product (name, price, status) "
+            "SELECT 'Item ' || n, n % 500, 'ACTIVE' FROM generate_series(1, 20000) AS n"
+        )
+        await conn.exec_driver_sql("ANALYZE product")
+
+
+def plan_nodes(plan: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+async def test_active_products_page_uses_status_id_index(engine: AsyncEngine) -> None:
+    """Test that the keyset page is an ordered range scan over `idx_status_id`."""
+    plan = await explain(engine, lambda session: ProductRepository.get_active_products(51, 10, session))
+
+    nodes = list(plan_nodes(plan))
+    assert any(node.get("Index Name") == "idx_status_id" for node in nodes)
+    assert not any(node["Node Type"] in ("Sort", "Seq Scan") for node in nodes)
+
+
+async def test_active_products_by_price_is_index_only(engine: AsyncEngine) -> None:
+    """Test that price listings are an index-only range scan over `idx_status_price`, with no sort."""
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.exec_driver_sql("VACUUM ANALYZE product")
+
+    plan = await explain(
+        engine,
+        lambda session: ProductRepository.get_active_products_by_price(
+            5.0, 50.0, 51, (10.0, 1), PRODUCT_FIELDS, session
+        ),
+    )
+
+    nodes = list(plan_nodes(plan))
+    assert any(
+        node["Node Type"] == "Index Only Scan" and node.get("Index Name") == "idx_status_price" for node in nodes
+    )
+    assert not any(node["Node Type"] in ("Sort", "Seq Scan") for node in nodes)
+
+
+async def test_search_uses_stored_search_vector_index(engine: AsyncEngine, bulk_products: None) -> None:
+    """Test that search probes the GIN index on the stored tsvector instead of computing it per row."""
+    plan = await explain(
+        engine, lambda session: ProductRepository.search_products_by_name("red sho", 51, None, session)
+    )
+
+    nodes = list(plan_nodes(plan))
+    assert any(node.get("Index Name") == "idx_search_vector" for node in nodes)
+    assert not any(node["Node Type"] == "Seq Scan" for node in nodes)
+
+
+async def test_suggestions_use_trigram_index(engine: AsyncEngine, bulk_products: None) -> None:
+    """Test that prefix suggestions probe the trigram index on `name`."""
+    plan = await explain(engine, lambda session: ProductRepository.suggest_product_names("Item 12", 10, session))
+
+    nodes = list(plan_nodes(plan))
+    assert any(node.get("Index Name") == "idx_name_trgm" for node in nodes)
+    assert not any(node["Node Type"] == "Seq Scan" for node in nodes)
+
+
+async def seed_products(engine: AsyncEngine) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                "INSERT INTO product (name, price, status) "
+                "SELECT (CAST(:adjectives AS text[]))[1 + n % 20] || ' ' "
+                "|| (CAST(:nouns AS text[]))[1 + n / 20 % 25] || ' ' || n, "
+                "(n * 7919 % 10000) / 100.0, "
+                "CASE WHEN n % 5 = 0 THEN 'INACTIVE' ELSE 'ACTIVE' END::productstatus "
+                "FROM generate_series(1, :rows) AS n"
+            ),
+            {"rows": SEEDED_PRODUCTS, "adjectives": ADJECTIVES.split(), "nouns": NOUNS.split()},
+        )
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("ANALYZE product"))
+
+
+async def explain_all(query: Query) -> list[dict[str, Any]]:
+    """Run `query` in a transaction that is rolled back, then return the JSON plan of every statement it ran."""
+    unit_of_work = db.UnitOfWork()
+    token = db.current_unit_of_work.set(unit_of_work)
+    statements: list[tuple[str, Any]] = []
+
+    def capture(_conn: Any, _cursor: Any, statement: str, parameters: Any, *_: Any) -> None:
+        statements.append((statement, parameters))
+
+    db.init_db()
+    assert db._engine is not None
+    event.listen(db._engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        async with unit_of_work.session() as session:
+            await query(session)
+        event.remove(db._engine.sync_engine, "before_cursor_execute", capture)
+        async with unit_of_work.session() as session:
+            raw = await (await session.connection()).get_raw_connection()
+            plans = []
+            for statement, parameters in statements:
+                explained = await raw.driver_connection.fetchval(  # type: ignore[union-attr]
+                    f"EXPLAIN (FORMAT JSON) {statement}", *parameters
+                )
+                # The dialect registers a codec decoding `json` values
+                plans.append(explained[0]["Plan"])
+            return plans
+    finally:
+        if event.contains(db._engine.sync_engine, "before_cursor_execute", capture):
+            event.remove(db._engine.sync_engine, "before_cursor_execute", capture)
+        await unit_of_work.rollback()
+        await unit_of_work.close()
+        db.current_unit_of_work.reset(token)
+
+
+async def test_repository_query_plans(engine: AsyncEngine) -> None:
+    """Test that every repository query uses an index and stays within its recorded cost estimate."""
+    await seed_products(engine)
+    plans = {name: await explain_all(query) for name, query in QUERIES.items()}
+    costs = {name: [plan["Total Cost"] for plan in statement_plans] for name, statement_plans in plans.items()}
+
+    seq_scans = [
+        f"{name}: Seq Scan on {node['Relation Name']}"
+        for name, statement_plans in plans.items()
+        for plan in statement_plans
+        for node in plan_nodes(plan)
+        if node["Node Type"] == "Seq Scan"
+    ]
+    assert not seq_scans
+
+    if os.environ.get("UPDATE_QUERY_PLAN_BASELINE"):
+        BASELINE_PATH.write_text(json.dumps(costs, indent=2, sort_keys=True) + "\n")
+    baseline = json.loads(BASELINE_PATH.read_text())
+    assert {name: len(costs[name]) for name in costs} == {name: len(baseline[name]) for name in baseline}
+    regressions = [
+        f"{name}: estimated cost {cost} over the baseline {recorded}"
+        for name in costs
+        for cost, recorded in zip(costs[name], baseline[name], strict=True)
+        if cost > recorded * COST_TOLERANCE
+    ]
+    assert not regressions
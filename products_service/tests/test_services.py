@@ -0,0 +1,21 @@
+import pytest
+
+from products_app.services import ProductService, suggestions_cache
+from products_app.settings import settings
+
+
+async def test_suggestions_are_served_from_lru() -> None:
+    """Test that a repeated prefix is answered from the in-process LRU."""
+    assert await ProductService.suggest_product_names("Prod", 5) == ["Product 1"]
+    assert suggestions_cache.get(("prod", 5)) == ["Product 1"]
+
+    suggestions_cache.set(("prod", 5), ["Cached product"])
+    assert await ProductService.suggest_product_names("prod", 5) == ["Cached product"]
+
+
+async def test_suggestions_over_latency_budget_are_dropped(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a lookup exceeding the latency budget returns no suggestions and is not cached."""
+    monkeypatch.setattr(settings, "SUGGEST_LATENCY_BUDGET_MS", 0)
+
+    assert await ProductService.suggest_product_names("Prod", 5) == []
+    assert len(suggestions_cache) == 0